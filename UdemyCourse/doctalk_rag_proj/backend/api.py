@@ -1,10 +1,48 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from router import file_upload, get_file, chat, pageindex_chat
+from fastapi.responses import JSONResponse, PlainTextResponse
+from router import file_upload, get_file, chat, pageindex_chat, jobs
+from router.uploads import RequestSizeLimitMiddleware
+from router.streaming import stream_stats
+from router.metrics import MetricsMiddleware
+from lang_chain.query_pdf import close_async_clients, get_async_qdrant
+from lang_chain.vector_store import VECTOR_BACKEND, get_store
+from lang_chain.jobs import MAX_PENDING_JOBS, pending_jobs
+from lang_chain.history_compactor import get_history_compactor
+from lang_chain.session_store import get_session_store
+from lang_chain.llm_scheduler import get_scheduler
+from lang_chain import metrics
+from lang_chain.query_cache import get_query_cache
+from lang_chain.answer_cache import get_answer_cache
+from lang_chain.embedding_cache import get_cache
+
+# Per-dependency timeout of the /ready checks
+READY_CHECK_TIMEOUT_SECONDS = float(os.getenv("READY_CHECK_TIMEOUT_SECONDS", "2"))
+
+_started_at = time.time()
+
+# Hit / miss counters of the caches, exported at /metrics
+for _name, _get in (("query_embedding", get_query_cache), ("answer", get_answer_cache), ("embedding", get_cache)):
+    metrics.register_cache(_name, lambda get=_get: {"hits": get().hits, "misses": get().misses})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.start_flusher()
+    yield
+    metrics.flush()
+    # Release the pooled async OpenAI / Qdrant connections used by the query routes
+    await close_async_clients()
+
 
 app = FastAPI(
     title="PDF Reader",
-    description="PDF Q&A — Vector DB (Qdrant) and PageIndex (vectorless) engines"
+    description="PDF Q&A — Vector DB (Qdrant) and PageIndex (vectorless) engines",
+    lifespan=lifespan,
 )
 
 origins = [
@@ -13,6 +51,13 @@ origins = [
     "http://0.0.0.0:8002",
 ]
 
+# Oversized uploads are refused before Starlette buffers the multipart body.
+# Added before CORS so CORS stays outermost and 413s still carry CORS headers.
+app.add_middleware(RequestSizeLimitMiddleware, bulk_paths=("/file/add_files",))
+
+# Route label and request counters for /metrics; outside the size limit so 413s are counted
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -25,6 +70,7 @@ app.add_middleware(
 app.include_router(file_upload.router, prefix="/file")
 app.include_router(get_file.router, prefix="/query")
 app.include_router(chat.router, prefix="/chat")
+app.include_router(jobs.router, prefix="/jobs")
 
 # PageIndex (vectorless) routes
 app.include_router(pageindex_chat.router, prefix="/pageindex/chat")
@@ -33,3 +79,75 @@ app.include_router(pageindex_chat.router, prefix="/pageindex/chat")
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+async def _check_vector_store() -> None:
+    if VECTOR_BACKEND == "qdrant":
+        await get_async_qdrant().get_collections()
+    else:
+        await asyncio.to_thread(get_store)
+
+
+async def _check_session_store() -> None:
+    await asyncio.to_thread(get_session_store("chat").stats)
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness of the worker process that answers. In multi-worker mode each
+    process reports for itself (`pid`): 200 when it reaches the vector store
+    and the session store and its ingestion queue has room, 503 otherwise.
+    """
+    checks = {}
+    for name, check in (("vector_store", _check_vector_store), ("session_store", _check_session_store)):
+        try:
+            await asyncio.wait_for(check(), READY_CHECK_TIMEOUT_SECONDS)
+            checks[name] = "ok"
+        except Exception as e:
+            checks[name] = f"failed: {e!r}"
+    pending = pending_jobs()
+    checks["ingest_queue"] = "ok" if pending < MAX_PENDING_JOBS else f"full ({pending} jobs)"
+
+    ok = all(result == "ok" for result in checks.values())
+    body = {
+        "status": "ready" if ok else "unavailable",
+        "pid": os.getpid(),
+        "uptime_s": round(time.time() - _started_at, 1),
+        "checks": checks,
+    }
+    return JSONResponse(body, status_code=200 if ok else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """
+    Prometheus text format: per-stage latency histograms and LLM token counts of
+    both engines (labelled by engine, route and stage), HTTP request counts and
+    durations, streaming TTFT and cache hit counters — summed over all workers.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/streaming")
+def streaming_stats():
+    """Time-to-first-token and total latency (p50/p95) of streamed chat replies, per engine."""
+    return stream_stats.summary()
+
+
+@app.get("/stats/history")
+def history_stats():
+    """Conversation summaries kept by the history compactor and its background update counters."""
+    return get_history_compactor().stats()
+
+
+@app.get("/stats/sessions")
+def session_stats():
+    """Live chat sessions of each engine in the configured SESSION_BACKEND."""
+    return {namespace: get_session_store(namespace).stats() for namespace in ("chat", "pageindex")}
+
+
+@app.get("/stats/llm")
+def llm_stats():
+    """Slots, queues, retries and rate-limit state of this worker's LLM scheduler."""
+    return get_scheduler().stats()
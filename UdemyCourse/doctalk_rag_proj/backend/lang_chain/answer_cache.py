@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+import numpy as np
+
+# Semantic cache of first-turn answers. Many users ask the same question about
+# the same shared document; a hit skips retrieval and the gpt-4o call entirely.
+# Entries belong to one exact document version (filename + content hash), and a
+# question matches when its embedding's cosine similarity to a cached question
+# is at least ANSWER_CACHE_SIMILARITY.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_PER_DOC = int(os.getenv("ANSWER_CACHE_MAX_PER_DOC", "256"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+
+class _DocAnswers:
+    """Cached answers for one document version; vectors kept as a normalized matrix."""
+
+    def __init__(self, content_hash: str):
+        self.content_hash = content_hash
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.answers: list[dict] = []
+        self.created: list[float] = []
+        self.last_used: list[float] = []
+
+    def add(self, vector: np.ndarray, answer: dict, max_entries: int) -> int:
+        """Add an entry, evicting least-recently-used ones past `max_entries`. Returns evictions."""
+        now = time.monotonic()
+        self.vectors = vector[None, :] if not self.answers else np.vstack([self.vectors, vector])
+        self.answers.append(answer)
+        self.created.append(now)
+        self.last_used.append(now)
+        evicted = 0
+        while len(self.answers) > max_entries:
+            self.remove(int(np.argmin(self.last_used)))
+            evicted += 1
+        return evicted
+
+    def remove(self, index: int) -> None:
+        self.vectors = np.delete(self.vectors, index, axis=0)
+        for column in (self.answers, self.created, self.last_used):
+            del column[index]
+
+
+def _normalize(vector: list[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class AnswerCache:
+    """Thread-safe semantic answer cache keyed by (filename, content hash, query embedding)."""
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_SIMILARITY,
+        max_per_doc: int = ANSWER_CACHE_MAX_PER_DOC,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+    ):
+        self.threshold = threshold
+        self.max_per_doc = max_per_doc
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._docs: dict[str, _DocAnswers] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, filename: str, content_hash: str, vector: list[float]) -> dict | None:
+        """Return the cached answer of the most similar question, if similar enough."""
+        query = _normalize(vector)
+        with self._lock:
+            doc = self._docs.get(filename)
+            if doc is not None and doc.content_hash != content_hash:
+                self._drop(filename)
+                doc = None
+            if doc is None or not doc.answers:
+                self.misses += 1
+                return None
+
+            scores = doc.vectors @ query
+            best = int(np.argmax(scores))
+            if time.monotonic() - doc.created[best] > self.ttl_seconds:
+                doc.remove(best)
+                self.misses += 1
+                return None
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            doc.last_used[best] = time.monotonic()
+            self.hits += 1
+            return doc.answers[best]
+
+    def store(self, filename: str, content_hash: str, vector: list[float], answer: dict) -> None:
+        with self._lock:
+            doc = self._docs.get(filename)
+            if doc is None or doc.content_hash != content_hash:
+                doc = self._docs[filename] = _DocAnswers(content_hash)
+            self.evictions += doc.add(_normalize(vector), answer, self.max_per_doc)
+
+    def invalidate(self, filename: str, keep_hash: str | None = None) -> None:
+        """Drop a document's answers — all of them, or all but those for `keep_hash`."""
+        with self._lock:
+            doc = self._docs.get(filename)
+            if doc is not None and doc.content_hash != keep_hash:
+                self._drop(filename)
+
+    def _drop(self, filename: str) -> None:
+        del self._docs[filename]
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            documents = len(self._docs)
+            entries = sum(len(doc.answers) for doc in self._docs.values())
+        lookups = self.hits + self.misses
+        return {
+            "documents": documents,
+            "entries": entries,
+            "threshold": self.threshold,
+            "max_per_doc": self.max_per_doc,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache: AnswerCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache()
+    return _cache
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from queue import Empty
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Callable, Iterator
+from langchain_core.documents import Document
+from lang_chain.document_loader import (
+    SUPPORTED_EXTENSIONS,
+    EMBED_BATCH_SIZE,
+    EMBED_CONCURRENCY,
+    _batched,
+    _iter_documents,
+    _chunk_documents,
+    _make_splitter,
+    _tag_pages,
+    chunk_point_id,
+    commit_version,
+    embed_and_upsert,
+    ensure_sparse_index,
+    file_sha256,
+    ingest_lock,
+    skip_unchanged_pages,
+)
+from lang_chain.vector_store import get_store
+from lang_chain.metrics import record_stage
+
+# CPU-bound parsing (PyPDFLoader, pandas, docx2txt) runs in this many processes;
+# embedding and upsert are one shared, I/O-bound stage in the parent.
+PARSE_WORKERS = int(os.getenv("BULK_PARSE_WORKERS", str(os.cpu_count() or 2)))
+
+
+# Set in each parser process by _init_parser: where parsed chunks go, and the
+# parent's signal to stop sending them
+_results = None
+_stop = None
+
+
+def _init_parser(results, stop) -> None:
+    global _results, _stop
+    _results, _stop = results, stop
+
+
+def _parse_file(file_path: str, filename: str, content_hash: str, batch_size: int) -> None:
+    """
+    Worker: load + split one file. Runs in a child process. Chunks are sent to
+    the parent as ("chunks", filename, batch) messages of up to `batch_size`
+    chunks, so a large file never crosses the process boundary in one piece;
+    the bounded queue blocks the parser while the parent is behind. The file
+    ends with a ("done", filename, summary) or ("failed", filename, error).
+    """
+    start = time.perf_counter()
+    pages = 0
+
+    def _loaded_pages() -> Iterator[Document]:
+        nonlocal pages
+        # Already inside a pool worker — extract single-process rather than nesting pools
+        for doc in _iter_documents(file_path, pdf_engine="pypdf", filename=filename):
+            pages += 1
+            yield doc
+
+    try:
+        chunks = _chunk_documents(_tag_pages(_loaded_pages(), filename, content_hash), _make_splitter())
+        for batch in _batched(chunks, batch_size):
+            if _stop.is_set():
+                return
+            _results.put(("chunks", filename, batch))
+    except Exception as e:
+        _results.put(("failed", filename, str(e)))
+        return
+    _results.put(("done", filename, {
+        "filename": filename,
+        "content_hash": content_hash,
+        "pages": pages,
+        "parse_seconds": round(time.perf_counter() - start, 3),
+    }))
+
+
+def ingest_files(
+    file_paths: list[str],
+    workers: int = PARSE_WORKERS,
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    progress: Callable[[str, int], None] | None = None,
+    filenames: list[str] | None = None,
+    content_hashes: list[str] | None = None,
+) -> dict:
+    """
+    Ingest many files at once. Files are parsed in a process pool and their
+    chunks feed a single shared embed + upsert stage in completion order; each
+    file is committed (old versions deleted) once its last chunk is stored.
+
+    `filenames` / `content_hashes` default to each path's basename / SHA-256
+    (staged uploads live under unique temp names and are hashed while streaming).
+
+    Every filename in the batch is locked (see ingest_lock) for the whole run;
+    if the embed + upsert stage fails, files not yet committed lose the points
+    written for them.
+
+    Returns {"files": [per-file summary], "totals": throughput numbers}.
+    """
+    filenames = filenames or [os.path.basename(path) for path in file_paths]
+    content_hashes = content_hashes or [None] * len(file_paths)
+    with ExitStack() as locks:
+        # Sorted, so two batches sharing filenames can't deadlock
+        for filename in sorted(set(filenames)):
+            locks.enter_context(ingest_lock(filename))
+        return _ingest_files_locked(file_paths, workers, batch_size, concurrency, progress, filenames, content_hashes)
+
+
+def _ingest_files_locked(
+    file_paths: list[str],
+    workers: int,
+    batch_size: int,
+    concurrency: int,
+    progress: Callable[[str, int], None] | None,
+    filenames: list[str],
+    content_hashes: list[str | None],
+) -> dict:
+    progress = progress or (lambda stage, count: None)
+    store = get_store()
+    start = time.perf_counter()
+
+    summaries: dict[str, dict] = {}
+    to_parse: list[tuple[str, str, str]] = []
+    for path, filename, content_hash in zip(file_paths, filenames, content_hashes):
+        ext = os.path.splitext(filename)[1].lower()
+        if filename in summaries or any(name == filename for _, name, _ in to_parse):
+            print(f"Skipping '{path}': another file named '{filename}' is in this batch.")
+            continue
+        if ext not in SUPPORTED_EXTENSIONS:
+            summaries[filename] = {"filename": filename, "action": "failed", "error": f"Unsupported file type '{ext}'"}
+            continue
+        content_hash = content_hash or file_sha256(path)
+        if store.is_committed(filename, content_hash):
+            summaries[filename] = {"filename": filename, "action": "unchanged", "pages": 0, "chunks": 0}
+            ensure_sparse_index(store, filename, content_hash)
+            continue
+        to_parse.append((path, filename, content_hash))
+
+    # Chunks still waiting to be upserted per file; a file is committed once it
+    # is fully parsed and this drops to 0
+    remaining: dict[str, int] = {}
+    parsed: set[str] = set()
+    # Files whose parser failed after some of their chunks were sent on
+    abandoned: set[str] = set()
+    # Stored points per page of each file, and its reused pages, relabelled when the file is committed
+    existing: dict[str, dict[str, list[str]]] = {}
+    relabels: dict[str, list[tuple[list[str], dict]]] = {}
+    on_reused: dict[str, Callable[[list[str], dict], None]] = {}
+    # Point IDs upserted per file, checked by the store before it commits
+    written: dict[str, list[str]] = {}
+    recomputed: dict[str, set[str]] = {}
+    hashes = {filename: content_hash for _, filename, content_hash in to_parse}
+    counts = {"load": 0, "split": 0, "embed": 0, "upsert": 0}
+
+    def _start_file(filename: str) -> None:
+        # Only chunks of new or edited pages go on to embedding; unchanged
+        # pages keep their stored points and just get relabelled
+        existing[filename] = store.page_points(filename)
+        relabels[filename] = []
+        written[filename] = []
+        recomputed[filename] = set()
+        remaining[filename] = 0
+        seen: set[str] = set()
+
+        def _reused(ids: list[str], meta: dict) -> None:
+            # A page's chunks can arrive in several batches; relabel it once
+            if meta["page_key"] not in seen:
+                seen.add(meta["page_key"])
+                relabels[filename].append((ids, meta))
+        on_reused[filename] = _reused
+
+    def _commit(filename: str) -> None:
+        commit_version(store, filename, hashes[filename], relabels[filename], written[filename])
+        del remaining[filename]
+        print(f"Committed '{filename}' ({summaries[filename]['chunks']} chunks).")
+
+    def _fail(filename: str, error: str) -> None:
+        print(f"Failed to parse '{filename}': {error}")
+        summaries[filename] = {"filename": filename, "action": "failed", "error": error}
+        if filename in remaining:
+            abandoned.add(filename)
+
+    def _parsed_chunks() -> Iterator[Document]:
+        if not to_parse:
+            return
+        ctx = multiprocessing.get_context("spawn")
+        # Bounded, so parsed-but-unembedded chunks can't pile up
+        results = ctx.Queue(maxsize=max(1, workers) * 2)
+        stop = ctx.Event()
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(to_parse)),
+            mp_context=ctx,
+            initializer=_init_parser,
+            initargs=(results, stop),
+        ) as pool:
+            futures = {pool.submit(_parse_file, path, name, h, batch_size): name for path, name, h in to_parse}
+            pending = set(futures.values())
+            try:
+                while pending:
+                    try:
+                        kind, filename, payload = results.get(timeout=1)
+                    except Empty:
+                        # A parser that died without reporting (e.g. a crashed process)
+                        for future, name in futures.items():
+                            if name in pending and future.done() and future.exception() is not None:
+                                pending.discard(name)
+                                _fail(name, str(future.exception()))
+                        continue
+                    if kind == "failed":
+                        pending.discard(filename)
+                        _fail(filename, payload)
+                        continue
+                    if filename not in remaining:
+                        _start_file(filename)
+                    if kind == "done":
+                        pending.discard(filename)
+                        parsed.add(filename)
+                        # Load + split ran in a child process; only its total is known here
+                        record_stage("vector", "parse", payload.pop("parse_seconds"))
+                        summaries[filename] = {
+                            **payload,
+                            "action": "updated" if existing[filename] else "ingested",
+                            "pages_reused": len(relabels[filename]),
+                            "pages_recomputed": len(recomputed[filename]),
+                            "chunks": len(written[filename]) + remaining[filename],
+                        }
+                        counts["load"] += payload["pages"]
+                        progress("load", counts["load"])
+                        if remaining[filename] == 0:
+                            _commit(filename)
+                        continue
+                    chunks = list(skip_unchanged_pages(payload, existing[filename], on_reused[filename]))
+                    remaining[filename] += len(chunks)
+                    recomputed[filename].update(c.metadata["page_key"] for c in chunks)
+                    counts["split"] += len(chunks)
+                    progress("split", counts["split"])
+                    yield from chunks
+            finally:
+                # Stopped early (the embed stage failed): unblock parsers waiting on
+                # a full queue so the pool can shut down
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                while not all(future.done() for future in futures):
+                    try:
+                        results.get(timeout=0.1)
+                    except Empty:
+                        pass
+
+    def _on_embedded(batch: list[Document]) -> None:
+        counts["embed"] += len(batch)
+        progress("embed", counts["embed"])
+
+    def _on_upserted(batch: list[Document]) -> None:
+        counts["upsert"] += len(batch)
+        progress("upsert", counts["upsert"])
+        for chunk in batch:
+            filename = chunk.metadata["filename"]
+            remaining[filename] -= 1
+            written[filename].append(chunk_point_id(chunk))
+            if remaining[filename] == 0 and filename in parsed:
+                _commit(filename)
+
+    try:
+        embed_and_upsert(_parsed_chunks(), batch_size, concurrency, _on_embedded, _on_upserted)
+    except Exception:
+        for filename in remaining:
+            print(f"Discarding the uncommitted version of '{filename}'.")
+            store.discard_uncommitted(filename, hashes[filename])
+        raise
+    for filename in abandoned:
+        store.discard_uncommitted(filename, hashes[filename])
+
+    elapsed = time.perf_counter() - start
+    files = list(summaries.values())
+    totals = {
+        "files": len(files),
+        "ingested": sum(1 for f in files if f["action"] in ("ingested", "updated")),
+        "unchanged": sum(1 for f in files if f["action"] == "unchanged"),
+        "failed": sum(1 for f in files if f["action"] == "failed"),
+        "pages": counts["load"],
+        "chunks": counts["upsert"],
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(len(files) / elapsed, 2) if elapsed else 0.0,
+        "pages_per_sec": round(counts["load"] / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_sec": round(counts["upsert"] / elapsed, 2) if elapsed else 0.0,
+    }
+    print(f"Bulk ingestion done: {json.dumps(totals)}")
+    return {"files": files, "totals": totals}
+
+
+def _expand_paths(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, name) for name in sorted(names)
+                    if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS
+                )
+        else:
+            files.append(path)
+    return files
+
+
+# Usage (from the backend directory):
+#   python -m lang_chain.bulk_ingest ../invoices/ extra.pdf --workers 8
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-ingest files or directories into the vector DB.")
+    parser.add_argument("paths", nargs="+", help="Files and/or directories to ingest")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="Parser processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding request")
+    parser.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help="Embedding requests in flight")
+    args = parser.parse_args()
+
+    result = ingest_files(_expand_paths(args.paths), args.workers, args.batch_size, args.concurrency)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+from langchain_core.documents import Document
+from lang_chain.token_chunker import count_tokens
+
+# Builds the <context> block of the prompt from retrieved chunks. Neighbouring
+# chunks of a page overlap by CHUNK_OVERLAP_TOKENS, so joining them verbatim
+# repeats text; near-duplicate chunks (repeated headers, boilerplate) add
+# nothing. Candidates are picked by maximal marginal relevance (MMR) over their
+# stored embeddings until CONTEXT_TOKEN_BUDGET prompt tokens are used, and
+# consecutive chunks of the same page are stitched into one passage with the
+# overlap counted and sent only once.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1024"))
+# Retrieved candidates the packer chooses from (retrieval k before packing)
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+# 1.0 = pure relevance order, 0.0 = pure diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Candidates at least this similar to an already chosen chunk are dropped outright
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.97"))
+CONTEXT_ENCODING = os.getenv("CONTEXT_ENCODING", "o200k_base")   # tokenizer of gpt-4o
+
+# Shorter common affixes are treated as coincidence, not chunk overlap
+_MIN_OVERLAP_CHARS = 16
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    for size in range(min(len(left), len(right)), _MIN_OVERLAP_CHARS - 1, -1):
+        if right.startswith(left[-size:]):
+            return size
+    return 0
+
+
+def _position(doc: Document) -> tuple | None:
+    meta = doc.metadata
+    if meta.get("page_key") is None or meta.get("page_chunk") is None:
+        return None
+    return meta.get("filename"), meta["page_key"], int(meta["page_chunk"])
+
+
+def _similarities(docs: list[Document], vectors: dict[str, list[float]]) -> np.ndarray:
+    """Pairwise cosine similarity of the candidates; 0 where a vector is unknown."""
+    dim = len(next(iter(vectors.values()))) if vectors else 0
+    matrix = np.zeros((len(docs), max(dim, 1)), dtype=np.float32)
+    for i, doc in enumerate(docs):
+        vector = vectors.get(str(doc.metadata.get("_id")))
+        if vector is not None:
+            matrix[i] = vector
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    return matrix @ matrix.T
+
+
+def pack_context(
+    docs: list[Document],
+    vectors: dict[str, list[float]] | None = None,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    mmr_lambda: float = MMR_LAMBDA,
+) -> list[Document]:
+    """
+    Select and merge `docs` (best first, as retrieval ranked them) into passages
+    totalling at most `budget` tokens. `vectors` maps each doc's `_id` to its
+    stored embedding; docs without one are never considered redundant.
+    Returned passages keep the order of their best-ranked chunk; each carries
+    the metadata of its first chunk plus `token_count` and `merged_chunks`.
+    """
+    if not docs:
+        return []
+    n = len(docs)
+    relevance = 1 - np.arange(n) / n          # rank-based, so hybrid/BM25 ordering is respected
+    similarity = _similarities(docs, vectors or {})
+    positions = [_position(doc) for doc in docs]
+    index_at = {pos: i for i, pos in enumerate(positions) if pos is not None}
+
+    selected: list[int] = []
+    chosen: set[int] = set()
+    redundancy = np.zeros(n, dtype=np.float32)
+    used = 0
+    remaining = set(range(n))
+    while remaining:
+        scores = {i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy[i] for i in remaining}
+        best = max(scores, key=scores.get)
+        remaining.discard(best)
+        if redundancy[best] >= CONTEXT_DUPLICATE_SIMILARITY:
+            continue
+        # A chunk next to one already chosen only costs its non-overlapping text
+        text = docs[best].page_content
+        pos = positions[best]
+        if pos is not None:
+            prev = index_at.get((pos[0], pos[1], pos[2] - 1))
+            if prev in chosen:
+                text = text[_overlap(docs[prev].page_content, text):]
+            nxt = index_at.get((pos[0], pos[1], pos[2] + 1))
+            if nxt in chosen:
+                cut = _overlap(text, docs[nxt].page_content)
+                text = text[:len(text) - cut]
+        cost = count_tokens(text, CONTEXT_ENCODING)
+        if used + cost > budget:
+            continue
+        used += cost
+        selected.append(best)
+        chosen.add(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return _merge(docs, selected, positions)
+
+
+def _merge(docs: list[Document], selected: list[int], positions: list[tuple | None]) -> list[Document]:
+    """Stitch runs of consecutive chunks of the same page into single passages."""
+    rank = {i: r for r, i in enumerate(selected)}
+    runs: list[list[int]] = []
+    located = sorted((positions[i], i) for i in selected if positions[i] is not None)
+    for pos, i in located:
+        last = runs[-1][-1] if runs else None
+        if last is not None and positions[last][:2] == pos[:2] and positions[last][2] == pos[2] - 1:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    runs.extend([i] for i in selected if positions[i] is None)
+
+    passages = []
+    for run in sorted(runs, key=lambda run: min(rank[i] for i in run)):
+        text = docs[run[0]].page_content
+        for i in run[1:]:
+            part = docs[i].page_content
+            cut = _overlap(text, part)
+            text += part[cut:] if cut else "\n" + part
+        metadata = {**docs[run[0]].metadata, "merged_chunks": len(run), "token_count": count_tokens(text, CONTEXT_ENCODING)}
+        passages.append(Document(page_content=text, metadata=metadata))
+    return passages
@@ -1,89 +1,446 @@
 import os
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    CSVLoader,
-    Docx2txtLoader,
-    TextLoader,
-)
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_qdrant import QdrantVectorStore
+import sys
+import fcntl
+import hashlib
+import tempfile
+import time
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import BinaryIO, Callable, Iterable, Iterator
 from langchain_core.documents import Document
-
-VECTOR_DB_URL = os.getenv("VECTOR_DB_URL", "http://localhost:6333")
-COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "pdf_documents")
+from lang_chain.vector_store import get_store, point_id
+from lang_chain.embedding_cache import cached_embeddings, get_cache
+from lang_chain.answer_cache import get_answer_cache
+from lang_chain.sparse_index import get_sparse_index
+from lang_chain.pdf_extract import iter_pdf_pages
+from lang_chain.tabular_loader import iter_csv, iter_xls, iter_xlsx
+from lang_chain.text_io import open_text
+from lang_chain.token_chunker import TokenChunker, chunker_signature, get_chunker
+from lang_chain.metrics import in_context, stage, timed_iter
 
 SUPPORTED_EXTENSIONS = {".pdf", ".xlsx", ".xls", ".csv", ".docx", ".txt"}
 
+# Chunks per embedding request, and how many requests may be in flight at once.
+# Peak memory is bounded by roughly EMBED_BATCH_SIZE * (EMBED_CONCURRENCY + 1) chunks.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# Lock files that serialise ingests of the same filename across worker processes
+INGEST_LOCK_DIR = os.getenv("INGEST_LOCK_DIR", os.path.join(tempfile.gettempdir(), "doctalk_ingest_locks"))
 
-def _load_file(file_path: str) -> list[Document]:
-    """Load a file into LangChain Documents based on its extension."""
-    ext = os.path.splitext(file_path)[1].lower()
+
+def _iter_documents(
+    source: str | BinaryIO,
+    pdf_engine: str | None = None,
+    filename: str | None = None,
+) -> Iterator[Document]:
+    """
+    Lazily yield LangChain Documents (one per page / spreadsheet row group) based on extension.
+
+    `source` is a file path or an already-open binary file object (e.g. a
+    staged upload); for file objects pass `filename` so the type is known.
+    `pdf_engine` overrides PDF_EXTRACT_ENGINE (see lang_chain.pdf_extract).
+    """
+    name = filename or source
+    ext = os.path.splitext(name)[1].lower()
 
     if ext == ".pdf":
-        return PyPDFLoader(file_path).load()
+        yield from iter_pdf_pages(source, engine=pdf_engine, filename=name)
+        return
 
-    if ext in (".xlsx", ".xls"):
-        try:
-            import pandas as pd
-        except ImportError:
-            raise RuntimeError("pandas and openpyxl are required for Excel files. Add them to requirements.txt.")
-        xl = pd.ExcelFile(file_path)
-        docs = []
-        for sheet_name in xl.sheet_names:
-            df = xl.parse(sheet_name).fillna("")
-            text = df.to_string(index=False)
-            docs.append(Document(
-                page_content=text,
-                metadata={"source": file_path, "sheet": sheet_name},
-            ))
-        return docs
+    # Spreadsheets stream as header-prefixed row groups (see lang_chain.tabular_loader)
+    if ext == ".xlsx":
+        yield from iter_xlsx(source, name)
+        return
+
+    if ext == ".xls":
+        yield from iter_xls(source, name)
+        return
 
     if ext == ".csv":
-        return CSVLoader(file_path).load()
+        yield from iter_csv(source, name)
+        return
 
     if ext == ".docx":
-        return Docx2txtLoader(file_path).load()
+        import docx2txt
+        yield Document(page_content=docx2txt.process(source) or "", metadata={"source": name})
+        return
 
     if ext == ".txt":
-        return TextLoader(file_path, encoding="utf-8").load()
+        with open_text(source) as f:
+            yield Document(page_content=f.read(), metadata={"source": name})
+        return
 
     raise ValueError(f"Unsupported file type: '{ext}'. Supported: {', '.join(sorted(SUPPORTED_EXTENSIONS))}")
 
 
-def upload_document(file_path: str) -> str:
+def _load_file(file_path: str) -> list[Document]:
+    """Load a whole file into LangChain Documents based on its extension."""
+    return list(_iter_documents(file_path))
+
+
+def _iter_chunks(docs: Iterable[Document], splitter: TokenChunker) -> Iterator[Document]:
     """
-    Load any supported file, chunk it, embed it, and store in Qdrant.
-    Returns the original filename.
+    Split documents one at a time so only the current page is held in memory.
+    Documents marked `prechunked` (spreadsheet row groups) pass through whole.
     """
-    filename = os.path.basename(file_path)
-    print(f"Loading file: {filename}")
+    for doc in docs:
+        if doc.metadata.pop("prechunked", False):
+            pieces = [doc]
+        else:
+            with stage("vector", "split"):
+                pieces = splitter.split_documents([doc])
+        for page_chunk, piece in enumerate(pieces):
+            piece.metadata["page_chunk"] = page_chunk
+            yield piece
+
+
+# Chunk-level metadata; everything else on a chunk describes its page
+_CHUNK_KEYS = ("chunk_index", "page_chunk", "token_count")
 
-    docs = _load_file(file_path)
-    print(f"Loaded {len(docs)} document(s).")
 
+def _tag_pages(docs: Iterable[Document], filename: str, content_hash: str) -> Iterator[Document]:
+    """
+    Tag each page with its file identity and a content-derived `page_key`
+    (SHA-256 of the chunker settings + page text, plus an occurrence number so
+    repeated identical pages stay distinct). Point IDs derive from the page_key,
+    not the page position; changing CHUNK_* settings re-chunks every page.
+    """
+    occurrences: dict[str, int] = {}
+    prefix = f"{chunker_signature()}\n".encode("utf-8")
     for doc in docs:
+        page_hash = hashlib.sha256(prefix + doc.page_content.encode("utf-8")).hexdigest()
+        occurrence = occurrences.get(page_hash, 0)
+        occurrences[page_hash] = occurrence + 1
         doc.metadata["filename"] = filename
+        doc.metadata["content_hash"] = content_hash
+        doc.metadata["page_hash"] = page_hash
+        doc.metadata["page_key"] = f"{page_hash}:{occurrence}"
+        yield doc
+
+
+def _page_metadata(metadata: dict) -> dict:
+    return {k: v for k, v in metadata.items() if k not in _CHUNK_KEYS}
+
+
+@contextmanager
+def ingest_lock(filename: str):
+    """
+    Exclusive lock on one filename, held from the committed-version check until
+    its new version is committed. flock() locks are per open file, so this
+    serialises threads of one worker as well as separate worker processes;
+    otherwise two ingests of the same name would delete each other's points.
+    """
+    os.makedirs(INGEST_LOCK_DIR, exist_ok=True)
+    digest = hashlib.sha256(filename.encode("utf-8")).hexdigest()[:32]
+    with open(os.path.join(INGEST_LOCK_DIR, f"{digest}.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def chunk_point_id(chunk: Document) -> str:
+    return point_id(chunk.metadata["filename"], chunk.metadata["page_key"], chunk.metadata["page_chunk"])
+
+
+def commit_version(
+    store,
+    filename: str,
+    content_hash: str,
+    relabel: list[tuple[list[str], dict]] = (),
+    written_ids: list[str] = (),
+) -> None:
+    """
+    Commit a fully written file version, relabelling the reused pages' points
+    (`relabel`, as collected by skip_unchanged_pages) in the same step, and
+    drop cached answers about older versions. The store refuses the commit
+    (RuntimeError) when any of `written_ids` or of the reused points is missing.
+
+    The version's BM25 index is built before the commit and swapped in right
+    after it, so a failed build leaves the old version committed.
+    """
+    index = get_sparse_index()
+    staged, _ = index.build(filename, _version_points(store, filename, content_hash, relabel), content_hash)
+    try:
+        store.commit_document(filename, content_hash, relabel, written_ids)
+    except BaseException:
+        index.discard(staged)
+        raise
+    index.install(filename, staged)
+    get_answer_cache().invalidate(filename, keep_hash=content_hash)
+
+
+def _version_points(
+    store,
+    filename: str,
+    content_hash: str,
+    relabel: list[tuple[list[str], dict]],
+) -> Iterator[tuple[str, str, dict]]:
+    """The points `filename` will have once `content_hash` is committed, with their metadata as of then."""
+    reused = {pid: metadata for ids, metadata in relabel for pid in ids}
+    for pid, text, metadata in store.iter_points(filename):
+        if pid in reused:
+            yield pid, text, {**metadata, **reused[pid], "committed": True}
+        elif metadata.get("content_hash") == content_hash:
+            yield pid, text, {**metadata, "committed": True}
+
+
+def ensure_sparse_index(store, filename: str, content_hash: str) -> None:
+    """Rebuild the BM25 index of an unchanged file if it is missing or not of its committed version."""
+    if get_sparse_index().content_hash(filename) != content_hash:
+        get_sparse_index().rebuild(filename, store.iter_points(filename, committed_only=True), content_hash)
+
+
+def skip_unchanged_pages(
+    items: Iterable[Document],
+    existing: dict[str, list[str]],
+    on_reused: Callable[[list[str], dict], None],
+) -> Iterator[Document]:
+    """
+    Yield pages (or chunks) whose page_key is not already stored. For each
+    stored page, call `on_reused(point_ids, page_metadata)` once instead, so
+    its points can be relabelled with the new version's metadata when the
+    version is committed (see commit_version).
+    """
+    reused: set[str] = set()
+    for item in items:
+        page_key = item.metadata["page_key"]
+        ids = existing.get(page_key)
+        if ids is None:
+            yield item
+        elif page_key not in reused:
+            reused.add(page_key)
+            on_reused(ids, _page_metadata(item.metadata))
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-    )
-    chunks = text_splitter.split_documents(docs)
-    print(f"Split into {len(chunks)} chunks.")
 
-    embedding = OpenAIEmbeddings(model="text-embedding-ada-002")
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
 
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MB."""
     try:
-        QdrantVectorStore.from_documents(
-            documents=chunks,
-            embedding=embedding,
-            collection_name=COLLECTION_NAME,
-            url=VECTOR_DB_URL,
-        )
-        print(f"Uploaded embeddings for '{filename}' to Qdrant.")
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def file_sha256(source: str | BinaryIO) -> str:
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            while block := f.read(1024 * 1024):
+                digest.update(block)
+    else:
+        source.seek(0)
+        while block := source.read(1024 * 1024):
+            digest.update(block)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def _make_splitter() -> TokenChunker:
+    # Token-sized chunks (CHUNK_TOKENS / CHUNK_OVERLAP_TOKENS), see lang_chain.token_chunker
+    return get_chunker()
+
+
+def _chunk_documents(docs: Iterable[Document], splitter: TokenChunker) -> Iterator[Document]:
+    """Split documents lazily and number the chunks within their file (`chunk_index`)."""
+    for index, chunk in enumerate(_iter_chunks(docs, splitter)):
+        chunk.metadata["chunk_index"] = index
+        yield chunk
+
+
+def embed_and_upsert(
+    chunks: Iterable[Document],
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    on_embedded: Callable[[list[Document]], None] | None = None,
+    on_upserted: Callable[[list[Document]], None] | None = None,
+) -> None:
+    """
+    Shared embed + upsert stage. Chunks may come from any number of files; each
+    must carry filename, page_key and page_chunk metadata, which determine its
+    point ID. Batches are upserted in input order as soon as embedded, with
+    at most `concurrency` embedding requests in flight.
+    """
+    embedding = cached_embeddings()
+    store = get_store()
+
+    # Runs on the pool; in_context() carries the route label over to it
+    def _embed(texts: list[str]) -> list[list[float]]:
+        with stage("vector", "embed"):
+            return embedding.embed_documents(texts)
+
+    def _upsert(batch: list[Document], future) -> None:
+        vectors = future.result()
+        if on_embedded:
+            on_embedded(batch)
+        ids = [chunk_point_id(chunk) for chunk in batch]
+        with stage("vector", "upsert"):
+            store.upsert(batch, vectors, ids=ids)
+        if on_upserted:
+            on_upserted(batch)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = deque()
+        for batch in _batched(chunks, batch_size):
+            texts = [chunk.page_content for chunk in batch]
+            in_flight.append((batch, pool.submit(in_context(_embed), texts)))
+            # Backpressure: stop pulling chunks until the oldest batch is stored
+            if len(in_flight) >= concurrency:
+                _upsert(*in_flight.popleft())
+        while in_flight:
+            _upsert(*in_flight.popleft())
+
+
+def ingest_document(
+    source: str | BinaryIO,
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    content_hash: str | None = None,
+    progress: Callable[[str, int], None] | None = None,
+    filename: str | None = None,
+) -> dict:
+    """
+    Stream a supported file into Qdrant: load page by page, split, embed in
+    batches with up to `concurrency` embedding requests in flight, and upsert
+    each batch as soon as its embeddings arrive.
+
+    Ingestion is keyed by the file's SHA-256: an unchanged file is a no-op. For
+    a changed file only pages whose text changed are split, embedded and
+    upserted; unchanged pages keep their points, which are relabelled with the
+    new version's metadata in the same commit step that deletes stale points.
+
+    `source` is a path or an open binary file object; `filename` (required for
+    file objects) is the name chunks are tagged and filtered with. Pass
+    `content_hash` when it is already known (staged uploads hash while streaming).
+
+    `progress(stage, count)` is called as pages are loaded ("load"), chunks
+    produced ("split"), embedded ("embed") and written ("upsert").
+
+    Ingests of the same filename run one at a time (see ingest_lock). Until
+    the commit, searches only see the previously committed version; a failed
+    ingest deletes the points it wrote.
+
+    Returns ingestion stats: filename, action, pages, pages_reused,
+    pages_recomputed, chunks, seconds, pages_per_sec, peak_rss_mb,
+    embed_cache_hits, embed_cache_misses.
+    """
+    filename = filename or os.path.basename(source)
+    content_hash = content_hash or file_sha256(source)
+    with ingest_lock(filename):
+        return _ingest_document_locked(source, batch_size, concurrency, content_hash, progress, filename)
+
+
+def _ingest_document_locked(
+    source: str | BinaryIO,
+    batch_size: int,
+    concurrency: int,
+    content_hash: str,
+    progress: Callable[[str, int], None] | None,
+    filename: str,
+) -> dict:
+    store = get_store()
+    progress = progress or (lambda stage, count: None)
+
+    stats = {
+        "filename": filename, "content_hash": content_hash, "action": "ingested",
+        "pages": 0, "pages_reused": 0, "pages_recomputed": 0, "chunks": 0,
+    }
+    if store.is_committed(filename, content_hash):
+        print(f"'{filename}' is unchanged since last ingestion — skipping.")
+        # Backfills an index that is missing (ingested before hybrid search) or stale
+        ensure_sparse_index(store, filename, content_hash)
+        stats.update(action="unchanged", seconds=0.0, pages_per_sec=0.0, peak_rss_mb=round(_rss_mb(), 1),
+                     embed_cache_hits=0, embed_cache_misses=0)
+        return stats
+
+    existing = store.page_points(filename)
+    if existing:
+        stats["action"] = "updated"
+    relabel: list[tuple[list[str], dict]] = []
+    written: list[str] = []
+
+    def _on_reused(ids: list[str], metadata: dict) -> None:
+        # Applied only at commit time, so the old version stays intact until then
+        stats["pages_reused"] += 1
+        relabel.append((ids, metadata))
+
+    print(f"Loading file: {filename}")
+    start = time.perf_counter()
+    peak_rss = _rss_mb()
+    counts = {"split": 0, "embed": 0}
+    cache = get_cache()
+    hits_before, misses_before = cache.hits, cache.misses
+
+    def _loaded_pages() -> Iterator[Document]:
+        for doc in timed_iter(_iter_documents(source, filename=filename), "vector", "load"):
+            stats["pages"] += 1
+            progress("load", stats["pages"])
+            yield doc
+
+    def _changed_pages() -> Iterator[Document]:
+        pages = _tag_pages(_loaded_pages(), filename, content_hash)
+        for doc in skip_unchanged_pages(pages, existing, _on_reused):
+            stats["pages_recomputed"] += 1
+            yield doc
+
+    def _counted_chunks() -> Iterator[Document]:
+        for chunk in _chunk_documents(_changed_pages(), _make_splitter()):
+            counts["split"] += 1
+            progress("split", counts["split"])
+            yield chunk
+
+    def _on_embedded(batch: list[Document]) -> None:
+        counts["embed"] += len(batch)
+        progress("embed", counts["embed"])
+
+    def _on_upserted(batch: list[Document]) -> None:
+        nonlocal peak_rss
+        stats["chunks"] += len(batch)
+        written.extend(chunk_point_id(chunk) for chunk in batch)
+        progress("upsert", stats["chunks"])
+        peak_rss = max(peak_rss, _rss_mb())
+
+    try:
+        embed_and_upsert(_counted_chunks(), batch_size, concurrency, _on_embedded, _on_upserted)
+        commit_version(store, filename, content_hash, relabel, written)
     except Exception as e:
         print(f"Error uploading to Qdrant: {e}")
+        store.discard_uncommitted(filename, content_hash)
         raise
 
-    return filename
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["pages_per_sec"] = round(stats["pages"] / elapsed, 2) if elapsed else 0.0
+    stats["peak_rss_mb"] = round(peak_rss, 1)
+    stats["embed_cache_hits"] = cache.hits - hits_before
+    stats["embed_cache_misses"] = cache.misses - misses_before
+    print(
+        f"Uploaded {stats['chunks']} chunks from {stats['pages']} page(s) of '{filename}' "
+        f"({stats['pages_reused']} reused, {stats['pages_recomputed']} recomputed) "
+        f"in {stats['seconds']}s ({stats['pages_per_sec']} pages/s, peak RSS {stats['peak_rss_mb']} MB, "
+        f"{stats['embed_cache_hits']} embedding cache hits)."
+    )
+    return stats
+
+
+def upload_document(file_path: str) -> str:
+    """
+    Load any supported file, chunk it, embed it, and store in Qdrant.
+    Returns the original filename.
+    """
+    return ingest_document(file_path)["filename"]
@@ -0,0 +1,352 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import Iterator
+from langchain_core.documents import Document
+
+# In-process alternative to the Qdrant service (VECTOR_BACKEND=embedded), for
+# small deployments and CI. Each file's vectors live in their own flat float32
+# file, L2-normalised so cosine similarity is a dot product, and are searched
+# by memory-mapping that file — nothing is loaded at startup and the OS page
+# cache decides what stays resident. Payloads (page_content + metadata, same
+# shape as the Qdrant payload) and each point's row ("slot") are kept in SQLite.
+EMBEDDED_STORE_DIR = os.getenv("EMBEDDED_STORE_DIR", "embedded_store")
+
+_SCROLL_PAGE = 1000
+_SEARCH_BLOCK = 65536   # rows scored per matmul, bounds temporary memory on large files
+
+
+def _normalize(vectors) -> np.ndarray:
+    array = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(array, axis=-1, keepdims=True)
+    return array / np.where(norms == 0, 1, norms)
+
+
+class EmbeddedStore:
+    """
+    Drop-in replacement for QdrantStore backed by memory-mapped NumPy files
+    and SQLite, with brute-force (exact) cosine search.
+    """
+
+    def __init__(self, root: str = EMBEDDED_STORE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "vectors"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, "payloads.sqlite3"), check_same_thread=False)
+        self._conn.executescript(
+            "PRAGMA journal_mode=WAL;"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            # One vector file per source file; `path` changes when the file is compacted
+            "CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, path TEXT NOT NULL, generation INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS points (id TEXT PRIMARY KEY, filename TEXT NOT NULL, slot INTEGER NOT NULL,"
+            " page_content TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS points_by_file ON points (filename, slot);"
+        )
+        self._lock = threading.RLock()
+        # filename -> ((path, size, mtime), memmap, slot -> committed point id, mask of mapped slots);
+        # refreshed when the file changes and dropped whenever its points do
+        self._maps: dict[str, tuple[tuple, np.memmap, list[str | None], np.ndarray]] = {}
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+
+    # -- layout helpers ------------------------------------------------------
+
+    def _vector_path(self, filename: str, generation: int) -> str:
+        digest = hashlib.sha256(filename.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.root, "vectors", f"{digest}.{generation}.f32")
+
+    def _file(self, filename: str) -> tuple[str, int] | None:
+        return self._conn.execute(
+            "SELECT path, generation FROM files WHERE filename = ?", (filename,)
+        ).fetchone()
+
+    def _rows(self, path: str) -> int:
+        return os.path.getsize(path) // (self.dim * 4) if os.path.exists(path) else 0
+
+    # -- QdrantStore interface -----------------------------------------------
+
+    def ensure_collection(self, vector_size: int) -> None:
+        """Record the vector size on first use; every later vector must match it."""
+        if self.dim == vector_size:
+            return
+        with self._lock:
+            if self.dim is None:
+                self._conn.execute("INSERT INTO meta VALUES ('dim', ?)", (str(vector_size),))
+                self._conn.commit()
+                self.dim = vector_size
+                print(f"Created embedded vector store in '{self.root}' (dim={vector_size}).")
+            elif self.dim != vector_size:
+                raise ValueError(f"Embedded store holds {self.dim}-dim vectors, got {vector_size}")
+
+    def upsert(self, chunks: list[Document], vectors: list[list[float]], ids: list[str] | None = None) -> None:
+        """Write one batch; points with an existing ID are overwritten in place, new ones appended."""
+        if not chunks:
+            return
+        self.ensure_collection(len(vectors[0]))
+        ids = ids or [os.urandom(16).hex() for _ in chunks]
+        matrix = _normalize(vectors)
+
+        with self._lock:
+            by_file: dict[str, list[int]] = {}
+            for i, chunk in enumerate(chunks):
+                by_file.setdefault(chunk.metadata["filename"], []).append(i)
+
+            for filename, rows in by_file.items():
+                stored = self._file(filename)
+                if stored is None:
+                    path = self._vector_path(filename, 0)
+                    self._conn.execute("INSERT INTO files VALUES (?, ?, 0)", (filename, path))
+                else:
+                    path = stored[0]
+                batch_ids = [ids[i] for i in rows]
+                slots = dict(self._conn.execute(
+                    f"SELECT id, slot FROM points WHERE filename = ? AND id IN ({','.join('?' * len(batch_ids))})",
+                    [filename, *batch_ids],
+                ).fetchall())
+
+                # Vectors are written before their payload rows, so a crash leaves at
+                # most unreferenced trailing rows, which search ignores.
+                next_slot = self._rows(path)
+                with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+                    for i, pid in zip(rows, batch_ids):
+                        if pid not in slots:
+                            slots[pid] = next_slot
+                            next_slot += 1
+                        f.seek(slots[pid] * self.dim * 4)
+                        f.write(matrix[i].tobytes())
+
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (pid, filename, slots[pid], chunks[i].page_content, json.dumps(chunks[i].metadata))
+                        for i, pid in zip(rows, batch_ids)
+                    ],
+                )
+                self._maps.pop(filename, None)
+            self._conn.commit()
+
+    def is_committed(self, filename: str, content_hash: str) -> bool:
+        """True if this exact file version was fully ingested and no other version's points remain."""
+        with self._lock:
+            committed, leftovers = self._conn.execute(
+                "SELECT"
+                " SUM(json_extract(metadata, '$.content_hash') = ? AND json_extract(metadata, '$.committed') = 1),"
+                " SUM(json_extract(metadata, '$.content_hash') IS NOT ?)"
+                " FROM points WHERE filename = ?",
+                (content_hash, content_hash, filename),
+            ).fetchone()
+        return bool(committed) and not leftovers
+
+    def committed_hash(self, filename: str) -> str | None:
+        """content_hash of the committed version of `filename`, or None if it has none."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT json_extract(metadata, '$.content_hash') FROM points"
+                " WHERE filename = ? AND json_extract(metadata, '$.committed') = 1 LIMIT 1",
+                (filename,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def iter_points(self, filename: str, committed_only: bool = False) -> Iterator[tuple[str, str, dict]]:
+        """Yield (point_id, page_content, metadata) for every (committed) point of `filename`, without vectors."""
+        committed = " AND json_extract(metadata, '$.committed') = 1" if committed_only else ""
+        last_slot = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, slot, page_content, metadata FROM points"
+                    f" WHERE filename = ? AND slot > ?{committed} ORDER BY slot LIMIT ?",
+                    (filename, last_slot, _SCROLL_PAGE),
+                ).fetchall()
+            for pid, last_slot, text, metadata in rows:
+                yield pid, text, json.loads(metadata)
+            if len(rows) < _SCROLL_PAGE:
+                return
+
+    def page_points(self, filename: str) -> dict[str, list[str]]:
+        """Map each stored page_key of `filename` to the IDs of its points."""
+        pages: dict[str, list[str]] = {}
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, json_extract(metadata, '$.page_key') FROM points WHERE filename = ?", (filename,)
+            ).fetchall()
+        for pid, page_key in rows:
+            if page_key:
+                pages.setdefault(page_key, []).append(pid)
+        return pages
+
+    def _count_ids(self, filename: str, ids: list[str]) -> int:
+        found = 0
+        for start in range(0, len(ids), _SCROLL_PAGE):
+            batch = ids[start:start + _SCROLL_PAGE]
+            found += self._conn.execute(
+                f"SELECT COUNT(*) FROM points WHERE filename = ? AND id IN ({','.join('?' * len(batch))})",
+                [filename, *batch],
+            ).fetchone()[0]
+        return found
+
+    def commit_document(
+        self,
+        filename: str,
+        content_hash: str,
+        relabel: list[tuple[list[str], dict]] = (),
+        written_ids: list[str] = (),
+    ) -> None:
+        """
+        Merge the new version's metadata into the points of reused pages given
+        as (point_ids, metadata), mark the new version's points as committed and
+        drop every point of older versions. The surviving vectors are compacted
+        into a fresh file that the payload rows switch to in the same
+        transaction, so a crash leaves either the old or the new layout.
+
+        Raises RuntimeError instead of committing when any of `written_ids`
+        (the chunks upserted for this version) or of the reused points is missing.
+        """
+        with self._lock:
+            expected = [*written_ids, *(pid for ids, _ in relabel for pid in ids)]
+            found = self._count_ids(filename, expected)
+            if found < len(expected):
+                raise RuntimeError(
+                    f"Not committing '{filename}': only {found} of its {len(expected)} points are stored."
+                )
+            # Search maps only committed points; rebuild its slot table after the flip
+            self._maps.pop(filename, None)
+            for ids, metadata in relabel:
+                self._conn.execute(
+                    f"UPDATE points SET metadata = json_patch(metadata, ?) WHERE id IN ({','.join('?' * len(ids))})",
+                    [json.dumps(metadata), *ids],
+                )
+            self._conn.execute(
+                "UPDATE points SET metadata = json_set(metadata, '$.committed', json('true'))"
+                " WHERE filename = ? AND json_extract(metadata, '$.content_hash') = ?",
+                (filename, content_hash),
+            )
+            self._conn.execute(
+                "DELETE FROM points WHERE filename = ? AND json_extract(metadata, '$.content_hash') IS NOT ?",
+                (filename, content_hash),
+            )
+            stored = self._file(filename)
+            if stored is None:
+                self._conn.commit()
+                return
+            old_path, generation = stored
+            live = self._conn.execute(
+                "SELECT id, slot FROM points WHERE filename = ? ORDER BY slot", (filename,)
+            ).fetchall()
+            if len(live) == self._rows(old_path) and all(slot == i for i, (_, slot) in enumerate(live)):
+                self._conn.commit()
+                return
+
+            new_path = self._vector_path(filename, generation + 1)
+            if live:
+                old = np.memmap(old_path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+                with open(new_path, "wb") as f:
+                    for start in range(0, len(live), _SEARCH_BLOCK):
+                        slots = [slot for _, slot in live[start:start + _SEARCH_BLOCK]]
+                        f.write(np.ascontiguousarray(old[slots]).tobytes())
+                del old
+            else:
+                open(new_path, "wb").close()
+            self._conn.executemany("UPDATE points SET slot = ? WHERE id = ?", [(i, pid) for i, (pid, _) in enumerate(live)])
+            self._conn.execute(
+                "UPDATE files SET path = ?, generation = ? WHERE filename = ?", (new_path, generation + 1, filename)
+            )
+            self._conn.commit()
+            self._maps.pop(filename, None)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+
+    def discard_uncommitted(self, filename: str, content_hash: str) -> None:
+        """Delete the points a failed ingest of `content_hash` wrote; committed points are kept."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM points WHERE filename = ? AND json_extract(metadata, '$.content_hash') = ?"
+                " AND json_extract(metadata, '$.committed') IS NOT 1",
+                (filename, content_hash),
+            )
+            self._conn.commit()
+            self._maps.pop(filename, None)
+
+    # -- search --------------------------------------------------------------
+
+    def _mapped(self, filename: str) -> tuple[np.memmap, list[str | None], np.ndarray] | None:
+        """
+        Memory-map a file's vectors and its slot -> point ID table, cached until
+        the file changes or a version is committed. Only committed points are in
+        the table, so searches never see a version that is still being written;
+        the returned mask marks the slots that have one.
+        """
+        stored = self._file(filename)
+        if stored is None or self.dim is None or not os.path.exists(stored[0]):
+            return None
+        path = stored[0]
+        stat = os.stat(path)
+        version = (path, stat.st_size, stat.st_mtime_ns)
+        cached = self._maps.get(filename)
+        if cached and cached[0] == version:
+            return cached[1:]
+        rows = stat.st_size // (self.dim * 4)
+        if rows == 0:
+            return None
+        vectors = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        ids: list[str | None] = [None] * rows
+        for pid, slot in self._conn.execute(
+            "SELECT id, slot FROM points WHERE filename = ? AND json_extract(metadata, '$.committed') = 1", (filename,)
+        ):
+            if slot < rows:
+                ids[slot] = pid
+        present = np.array([pid is not None for pid in ids])
+        self._maps[filename] = (version, vectors, ids, present)
+        return vectors, ids, present
+
+    def vectors(self, ids: list[str]) -> dict[str, list[float]]:
+        """Stored (normalised) embeddings of the given point IDs (missing IDs are left out)."""
+        if not ids:
+            return {}
+        result = {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, filename, slot FROM points WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+            for pid, filename, slot in rows:
+                mapped = self._mapped(filename)
+                if mapped is not None and slot < len(mapped[1]):
+                    result[pid] = mapped[0][slot].tolist()
+        return result
+
+    def search(self, vector: list[float], filename: str | None = None, k: int = 4) -> list[Document]:
+        """Top-k points by cosine similarity, in one file or across all of them."""
+        query = _normalize(vector)
+        with self._lock:
+            filenames = [filename] if filename else [row[0] for row in self._conn.execute("SELECT filename FROM files")]
+            hits: list[tuple[float, str]] = []
+            for name in filenames:
+                mapped = self._mapped(name)
+                if mapped is None:
+                    continue
+                vectors, ids, present = mapped
+                for start in range(0, len(ids), _SEARCH_BLOCK):
+                    scores = vectors[start:start + _SEARCH_BLOCK] @ query
+                    # Uncommitted and stale slots must not take places in the top k
+                    scores[~present[start:start + _SEARCH_BLOCK]] = -np.inf
+                    top = np.argsort(scores)[::-1] if len(scores) <= k else np.argpartition(scores, -k)[-k:]
+                    hits.extend(
+                        (float(scores[i]), ids[start + i]) for i in top if ids[start + i] is not None
+                    )
+            hits = sorted(hits, reverse=True)[:k]
+            if not hits:
+                return []
+            payloads = {
+                pid: (text, json.loads(metadata))
+                for pid, text, metadata in self._conn.execute(
+                    f"SELECT id, page_content, metadata FROM points WHERE id IN ({','.join('?' * len(hits))})",
+                    [pid for _, pid in hits],
+                )
+            }
+        return [
+            Document(page_content=payloads[pid][0], metadata={**payloads[pid][1], "_id": pid})
+            for _, pid in hits
+            if pid in payloads
+        ]
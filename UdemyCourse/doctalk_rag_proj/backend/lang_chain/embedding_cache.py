@@ -0,0 +1,182 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+# On-disk cache of chunk embeddings, keyed by model + SHA-256 of the chunk text.
+# Shared by every ingestion path so re-ingesting a file (or boilerplate text seen
+# in other files) costs no embedding calls.
+CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+
+# Embedding model shared by ingestion and queries. EMBEDDING_DIMENSIONS truncates
+# the output of models that support it (text-embedding-3-*); unset = native size.
+# Changing either needs a new collection — see lang_chain/migrate_collection.py.
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH = 500
+# The running entry count is re-read from the table every Nth put, to pick up
+# inserts and evictions by other processes sharing the file
+_RECOUNT_EVERY = 200
+
+
+def embedding_id(model: str = EMBEDDING_MODEL, dimensions: int | None = EMBEDDING_DIMENSIONS) -> str:
+    """Identifies the vector space: cached vectors are only reused for the same model and size."""
+    return f"{model}@{dimensions}" if dimensions else model
+
+
+def make_embeddings(model: str = EMBEDDING_MODEL, dimensions: int | None = EMBEDDING_DIMENSIONS) -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(model=model, dimensions=dimensions)
+
+
+def cache_key(model: str, text: str) -> str:
+    return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store with size-bounded LRU eviction."""
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._puts = 0
+        (self._entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """Return cached vectors for the given keys and refresh their LRU timestamp."""
+        found: dict[str, list[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), _SQL_BATCH):
+                part = unique[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        keys = list(items)
+        with self._lock:
+            # Replaced keys don't grow the table; count only the new ones
+            existing = 0
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                (found,) = self._conn.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchone()
+                existing += found
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._entries += len(keys) - existing
+            self._puts += 1
+            if self._puts % _RECOUNT_EVERY == 0:
+                (self._entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        overflow = self._entries - self.max_entries
+        if overflow > 0:
+            self._entries -= self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._entries
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Drop-in LangChain Embeddings that checks the cache before calling the
+    underlying model. Only texts that miss (deduplicated) are sent to the API.
+    """
+
+    def __init__(self, model: str, cache: "EmbeddingCache", dimensions: int | None = None):
+        self.model = embedding_id(model, dimensions)
+        self.cache = cache
+        self.underlying = make_embeddings(model, dimensions)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [cache_key(self.model, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing: dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(fresh)
+            found.update(fresh)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.underlying.embed_query(text)
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+    return _cache
+
+
+def cached_embeddings(model: str = EMBEDDING_MODEL, dimensions: int | None = EMBEDDING_DIMENSIONS) -> CachedEmbeddings:
+    return CachedEmbeddings(model=model, cache=get_cache(), dimensions=dimensions)
@@ -0,0 +1,196 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI
+from lang_chain.token_chunker import count_tokens
+from lang_chain.context_packer import CONTEXT_ENCODING
+from lang_chain.llm_scheduler import BACKGROUND, complete
+
+# Bounds the conversation history sent with each turn. The last
+# HISTORY_KEEP_TURNS turns go verbatim; older turns are replaced by a running
+# summary. Summaries are produced by a background thread, never on the request
+# path: a prompt uses the newest summary available, plus as many not-yet-
+# summarised turns as fit in HISTORY_TOKEN_BUDGET. Summaries are keyed by a
+# rolling hash of the history prefix they cover, so the sessions themselves
+# (and the full history shown to the user) are untouched, and each update only
+# folds the turns added since the previous summary into it.
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300"))
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL") or os.getenv("CHAT_MODEL", "gpt-4o")
+HISTORY_SUMMARY_CACHE = int(os.getenv("HISTORY_SUMMARY_CACHE", "10000"))
+
+# Messages folded into the summary per LLM call, so a long backlog is summarised in steps
+_FOLD_MESSAGES = 20
+
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant about a document. "
+    "Update the summary with the new messages. Keep facts, figures, names and open questions the "
+    "user may refer back to; drop pleasantries. Reply with the updated summary only, at most {words} words."
+)
+
+
+def _prefix_hashes(messages: list[dict]) -> list[str]:
+    """hashes[i] identifies messages[:i + 1] — equal prefixes of any two histories hash alike."""
+    hashes, digest = [], b""
+    for message in messages:
+        digest = hashlib.sha256(
+            digest + message.get("role", "").encode() + b"\0" + (message.get("content") or "").encode("utf-8")
+        ).digest()
+        hashes.append(digest.hex())
+    return hashes
+
+
+def _transcript(messages: list[dict]) -> str:
+    return "\n".join(f"{m.get('role', 'user')}: {m.get('content') or ''}" for m in messages)
+
+
+class HistoryCompactor:
+    """Builds bounded prompt histories and keeps their summaries up to date in the background."""
+
+    def __init__(
+        self,
+        keep_turns: int = HISTORY_KEEP_TURNS,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        summary_max_tokens: int = HISTORY_SUMMARY_MAX_TOKENS,
+        model: str = HISTORY_SUMMARY_MODEL,
+        max_summaries: int = HISTORY_SUMMARY_CACHE,
+    ):
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.model = model
+        self.max_summaries = max_summaries
+        self.updates = 0
+        self.failures = 0
+        self._summaries: OrderedDict[str, str] = OrderedDict()   # prefix hash -> summary
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self._client: OpenAI | None = None
+
+    def _get_client(self) -> OpenAI:
+        # Same provider settings as the PageIndex querier (OpenAI or Gemini's OpenAI-compatible endpoint)
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=os.getenv("GEMINI_KEY") or os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                max_retries=0,
+            )
+        return self._client
+
+    def _latest_summary(self, hashes: list[str]) -> tuple[int, str | None]:
+        """(number of messages covered, summary) for the longest summarised prefix."""
+        with self._lock:
+            for i in range(len(hashes) - 1, -1, -1):
+                summary = self._summaries.get(hashes[i])
+                if summary is not None:
+                    self._summaries.move_to_end(hashes[i])
+                    return i + 1, summary
+        return 0, None
+
+    def compact(self, history: list[dict]) -> list[dict]:
+        """
+        Messages to send in place of `history`: a summary system message (when
+        one exists) followed by recent messages within the token budget. The
+        last turn is always kept. Schedules a summary update when older turns
+        are not summarised yet.
+        """
+        keep = self.keep_turns * 2
+        if len(history) <= keep:
+            return list(history)
+        older = history[:-keep]
+        hashes = _prefix_hashes(older)
+        covered, summary = self._latest_summary(hashes)
+        if covered < len(older):
+            self._schedule(older, hashes)
+
+        # Newest first: recent turns, then older ones the summary does not cover yet
+        kept: list[dict] = []
+        used = 0
+        for message in reversed(history[covered:]):
+            cost = count_tokens(message.get("content") or "", CONTEXT_ENCODING)
+            if used + cost > self.token_budget and len(kept) >= 2:
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+        if summary is None:
+            return kept
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}] + kept
+
+    def _schedule(self, older: list[dict], hashes: list[str]) -> None:
+        target = hashes[-1]
+        with self._lock:
+            if target in self._pending:
+                return
+            self._pending.add(target)
+        self._pool.submit(self._update, list(older), hashes, target)
+
+    def _update(self, older: list[dict], hashes: list[str], target: str) -> None:
+        """Fold the unsummarised messages into the summary, _FOLD_MESSAGES at a time."""
+        try:
+            covered, summary = self._latest_summary(hashes)
+            while covered < len(older):
+                end = min(covered + _FOLD_MESSAGES, len(older))
+                summary = self._summarize(summary, older[covered:end])
+                with self._lock:
+                    self._summaries[hashes[end - 1]] = summary
+                    self._summaries.move_to_end(hashes[end - 1])
+                    while len(self._summaries) > self.max_summaries:
+                        self._summaries.popitem(last=False)
+                    self.updates += 1
+                covered = end
+        except Exception as e:
+            self.failures += 1
+            print(f"History summary update failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(target)
+
+    def _summarize(self, summary: str | None, messages: list[dict]) -> str:
+        response = complete(
+            self._get_client().chat.completions.create,
+            BACKGROUND,
+            model=self.model,
+            messages=[
+                {"role": "system", "content": _SUMMARY_PROMPT.format(words=int(self.summary_max_tokens * 0.75))},
+                {
+                    "role": "user",
+                    "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{_transcript(messages)}",
+                },
+            ],
+            max_tokens=self.summary_max_tokens,
+            temperature=0,
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "summaries": len(self._summaries),
+                "pending": len(self._pending),
+                "updates": self.updates,
+                "failures": self.failures,
+                "keep_turns": self.keep_turns,
+                "token_budget": self.token_budget,
+            }
+
+
+_compactor: HistoryCompactor | None = None
+_compactor_lock = threading.Lock()
+
+
+def get_history_compactor() -> HistoryCompactor:
+    global _compactor
+    with _compactor_lock:
+        if _compactor is None:
+            _compactor = HistoryCompactor()
+    return _compactor
+
+
+def compact_history(history: list[dict]) -> list[dict]:
+    """Bounded replacement for `history` in an LLM prompt (see HistoryCompactor.compact)."""
+    return get_history_compactor().compact(history)
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import sqlite3
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from lang_chain.metrics import in_context
+
+# Background ingestion jobs. Uploads return a job_id immediately and the
+# parse → split → embed → upsert run happens on a bounded worker pool, so the
+# event loop stays free and a burst of large uploads cannot starve chat traffic.
+JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))
+MAX_PENDING_JOBS = int(os.getenv("INGEST_MAX_PENDING_JOBS", "50"))
+JOB_TTL_SECONDS = int(os.getenv("INGEST_JOB_TTL_SECONDS", "3600"))
+# A job runs in the worker process that accepted the upload, but with several
+# workers its status may be polled through any of them. When set, state changes
+# are also written to this SQLite file, shared by the workers: status and stage
+# changes at once, progress counts at most every JOB_PUBLISH_INTERVAL_SECONDS.
+JOB_STATE_PATH = os.getenv("JOB_STATE_PATH", "")
+JOB_PUBLISH_INTERVAL_SECONDS = float(os.getenv("JOB_PUBLISH_INTERVAL_SECONDS", "0.5"))
+
+STAGES = ("load", "split", "embed", "upsert")
+
+# Signature of the progress callback passed to job functions: (stage, count)
+ProgressFn = Callable[[str, int], None]
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="ingest-job")
+_jobs: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+class _SharedJobs:
+    """Job snapshots in a SQLite file, visible to every worker process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, state TEXT NOT NULL,"
+            " version INTEGER NOT NULL, finished_at REAL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def put(self, job: dict) -> None:
+        # Snapshots can be written out of order by different threads; keep the newest
+        self._conn().execute(
+            "INSERT INTO jobs VALUES (?, ?, ?, ?) ON CONFLICT (job_id) DO UPDATE SET"
+            " state = excluded.state, version = excluded.version, finished_at = excluded.finished_at"
+            " WHERE excluded.version > jobs.version",
+            (job["job_id"], json.dumps(job), job["version"], job["finished_at"]),
+        )
+
+    def get(self, job_id: str) -> dict | None:
+        row = self._conn().execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def evict_finished(self, cutoff: float) -> None:
+        self._conn().execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+
+
+_shared = _SharedJobs(JOB_STATE_PATH) if JOB_STATE_PATH else None
+
+
+def _snapshot(job: dict) -> dict:
+    return {**job, "progress": dict(job["progress"])}
+
+
+def _publish(snapshot: dict) -> None:
+    if _shared is None:
+        return
+    try:
+        _shared.put(snapshot)
+    except sqlite3.Error as e:
+        # Status polling through other workers lags; the job itself is unaffected
+        print(f"Could not publish job {snapshot['job_id']}: {e}")
+
+
+def _evict_finished() -> None:
+    cutoff = time.time() - JOB_TTL_SECONDS
+    for job_id in [j for j, job in _jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+        del _jobs[job_id]
+
+
+def _pending_count() -> int:
+    return sum(1 for job in _jobs.values() if job["status"] in ("queued", "running"))
+
+
+def _update(job_id: str, **fields) -> None:
+    with _lock:
+        job = _jobs[job_id]
+        job.update(fields)
+        job["version"] += 1
+        snapshot = _snapshot(job)
+    _publish(snapshot)
+
+
+def _run(job_id: str, fn: Callable, args: tuple, cleanup: Callable | None) -> None:
+    published = {"stage": None, "at": 0.0}
+
+    def progress(stage: str, count: int) -> None:
+        now = time.monotonic()
+        with _lock:
+            job = _jobs[job_id]
+            job["stage"] = stage
+            job["progress"][stage] = count
+            job["version"] += 1
+            # Called per page and per chunk: only some calls reach the shared file
+            if _shared is None or (stage == published["stage"] and now - published["at"] < JOB_PUBLISH_INTERVAL_SECONDS):
+                return
+            published.update(stage=stage, at=now)
+            snapshot = _snapshot(job)
+        _publish(snapshot)
+
+    _update(job_id, status="running", started_at=time.time())
+    try:
+        result = fn(*args, progress=progress)
+        _update(job_id, status="succeeded", stage="done", result=result, finished_at=time.time())
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        _update(job_id, status="failed", error=str(e), finished_at=time.time())
+    finally:
+        if cleanup:
+            cleanup()
+
+
+def submit_job(kind: str, fn: Callable, *args, filename: str | None = None, cleanup: Callable | None = None) -> str:
+    """
+    Queue `fn(*args, progress=...)` on the worker pool and return its job_id.
+    `cleanup` always runs after the job finishes (e.g. to delete the temp file).
+    Raises JobQueueFull when MAX_PENDING_JOBS are already queued or running.
+    """
+    with _lock:
+        _evict_finished()
+        if _pending_count() >= MAX_PENDING_JOBS:
+            raise JobQueueFull(f"Too many ingestion jobs in progress ({MAX_PENDING_JOBS}). Retry later.")
+        job_id = str(uuid.uuid4())
+        _jobs[job_id] = {
+            "job_id": job_id,
+            "kind": kind,
+            "filename": filename,
+            "status": "queued",
+            "stage": None,
+            "progress": {stage: 0 for stage in STAGES},
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "version": 0,
+        }
+        snapshot = _snapshot(_jobs[job_id])
+    if _shared is not None:
+        _shared.evict_finished(time.time() - JOB_TTL_SECONDS)
+    _publish(snapshot)
+    # in_context: the job's stage metrics keep the route of the upload that queued it
+    _executor.submit(in_context(_run), job_id, fn, args, cleanup)
+    return job_id
+
+
+def get_job(job_id: str) -> dict | None:
+    """Snapshot of a job's state, or None if unknown / expired."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            return _snapshot(job)
+    # Submitted through another worker process
+    return _shared.get(job_id) if _shared is not None else None
+
+
+def pending_jobs() -> int:
+    """Jobs queued or running in this worker process."""
+    with _lock:
+        return _pending_count()
+
+
+def is_finished(job: dict) -> bool:
+    return job["status"] in ("succeeded", "failed")
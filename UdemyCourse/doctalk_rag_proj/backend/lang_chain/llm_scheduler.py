@@ -0,0 +1,463 @@
+import os
+import math
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+import email.utils
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator
+import openai
+from lang_chain.metrics import LLM_QUEUE_SECONDS, LLM_RETRIES
+
+# Every chat completion of the process (vector answers, PageIndex navigation
+# and answers, history summaries, index re-summaries) goes through one
+# scheduler, so a burst of traffic is paced here instead of turning into 429s.
+# A call waits for:
+#   - a free slot (LLM_MAX_CONCURRENCY calls in flight),
+#   - a request from the LLM_RPM token bucket,
+#   - its estimated prompt + completion tokens from the LLM_TPM bucket
+#     (the estimate is corrected by the reported usage afterwards).
+# Waiting calls are served by priority: interactive chat first, then background
+# work (batch questions, history summaries), then bulk indexing. Interactive
+# calls are refused with LLMQueueFull (503) rather than queued when
+# LLM_MAX_QUEUED are already waiting or no slot frees up within
+# LLM_QUEUE_TIMEOUT_SECONDS. Lower priorities always queue; their callers are
+# bounded pools (ingestion jobs, the summary thread, batch concurrency).
+#
+# Rate limit and transient errors are retried up to LLM_MAX_RETRIES times, with
+# exponential backoff and jitter or the delay the API asks for in Retry-After.
+# A 429 also pauses the whole scheduler for that delay, so the other queued
+# calls do not run into the same limit. The OpenAI clients are created with
+# max_retries=0 so their own retries do not bypass the limits.
+#
+# RPM / TPM are the account's limits (0 = unlimited); each worker process of
+# serve.py takes an equal share (WEB_CONCURRENCY).
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "64"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+# Longest backoff; a Retry-After beyond it fails the call instead of waiting
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+# Completion tokens assumed for the TPM estimate when a call sets no max_tokens
+LLM_COMPLETION_ESTIMATE = int(os.getenv("LLM_COMPLETION_ESTIMATE", "500"))
+
+INTERACTIVE, BACKGROUND, BULK = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "background", "bulk")
+
+_RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class LLMQueueFull(RuntimeError):
+    """An interactive LLM call was refused because the scheduler is saturated."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """`per_minute` units, refilled continuously; 0 = unlimited."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self._rate = per_minute / 60
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken. Requests above capacity need a full bucket."""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self._rate)
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.level -= amount
+
+    def give(self, amount: float) -> None:
+        """Return (or, when negative, charge) units after the real cost is known."""
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    """One call waiting for, or holding, a slot."""
+
+    __slots__ = ("priority", "tokens", "enqueued", "granted", "cancelled", "_notify")
+
+    def __init__(self, priority: int, tokens: int, notify: Callable[[], None]):
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self._notify = notify
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        rpm: float = LLM_RPM,
+        tpm: float = LLM_TPM,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queued: int = LLM_MAX_QUEUED,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._queue: list[tuple[int, int, _Ticket]] = []
+        self._seq = itertools.count()
+        self._waiting = [0, 0, 0]   # per priority
+        self._running = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._dispatcher: threading.Thread | None = None
+        self.granted = [0, 0, 0]
+        self.rejected = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    # ---- queueing ----
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        with self._cond:
+            if ticket.priority == INTERACTIVE and self._waiting[INTERACTIVE] >= self.max_queued:
+                raise self._queue_full()
+            heapq.heappush(self._queue, (ticket.priority, next(self._seq), ticket))
+            self._waiting[ticket.priority] += 1
+            # Started on first use, and again should it ever have died
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch, name="llm-scheduler", daemon=True)
+                self._dispatcher.start()
+            self._cond.notify_all()
+
+    def _cancel(self, ticket: _Ticket) -> bool:
+        """Withdraw a waiting ticket. False when it was granted meanwhile (the caller must release it)."""
+        with self._cond:
+            if ticket.granted:
+                return False
+            ticket.cancelled = True
+            self._waiting[ticket.priority] -= 1
+            self._cond.notify_all()
+            return True
+
+    def _queue_full(self) -> LLMQueueFull:
+        self.rejected += 1
+        return LLMQueueFull(f"LLM queue is full ({self.max_queued} requests waiting). Retry shortly.", self._retry_after())
+
+    def _timed_out(self, timeout: float) -> LLMQueueFull:
+        with self._cond:
+            self.rejected += 1
+            retry_after = self._retry_after()
+        return LLMQueueFull(f"No LLM capacity within {timeout:g}s. Retry shortly.", retry_after)
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._paused_until - time.monotonic()))
+
+    def _dispatch(self) -> None:
+        """Dispatcher thread: an unexpected error restarts the loop instead of stranding every waiter."""
+        while True:
+            try:
+                self._dispatch_loop()
+            except Exception as e:
+                print(f"LLM scheduler dispatcher failed: {e!r} — restarting")
+                time.sleep(0.1)
+
+    def _dispatch_loop(self) -> None:
+        """Grant the head of the queue whenever a slot and both buckets allow it."""
+        with self._cond:
+            while True:
+                while self._queue and self._queue[0][2].cancelled:
+                    heapq.heappop(self._queue)
+                if not self._queue or self._running >= self.max_concurrency:
+                    self._cond.wait()
+                    continue
+                ticket = self._queue[0][2]
+                now = time.monotonic()
+                wait = max(
+                    self._paused_until - now,
+                    self._requests.wait_time(1, now),
+                    self._tokens.wait_time(ticket.tokens, now),
+                )
+                if wait > 0:
+                    # Strict priority: nothing behind the head overtakes it
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._queue)
+                self._requests.take(1)
+                self._tokens.take(ticket.tokens)
+                self._running += 1
+                self._waiting[ticket.priority] -= 1
+                self.granted[ticket.priority] += 1
+                ticket.granted = True
+                LLM_QUEUE_SECONDS.observe(now - ticket.enqueued, priority=PRIORITY_NAMES[ticket.priority])
+                try:
+                    ticket._notify()
+                except Exception as e:
+                    # The waiter cannot be woken (e.g. its event loop is closed): treat it as
+                    # cancelled and hand its slot and budget back
+                    print(f"LLM scheduler could not notify a waiter ({e!r}); dropping it.")
+                    ticket.granted = False
+                    ticket.cancelled = True
+                    self._running -= 1
+                    self._requests.give(1)
+                    self._tokens.give(ticket.tokens)
+
+    # ---- slots ----
+
+    def acquire(self, priority: int, tokens: int = 0, timeout: float | None = None) -> _Ticket:
+        """
+        Block until a slot is granted. Raises LLMQueueFull after `timeout`
+        seconds — by default queue_timeout for interactive calls, no limit otherwise.
+        """
+        granted = threading.Event()
+        ticket = _Ticket(priority, tokens, granted.set)
+        self._enqueue(ticket)
+        if timeout is None and priority == INTERACTIVE:
+            timeout = self.queue_timeout
+        if not granted.wait(timeout) and self._cancel(ticket):
+            raise self._timed_out(timeout)
+        return ticket
+
+    async def aacquire(self, priority: int, tokens: int = 0, timeout: float | None = None) -> _Ticket:
+        """acquire() for the event loop: waits on a future the dispatcher thread resolves."""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        ticket = _Ticket(priority, tokens, notify)
+        self._enqueue(ticket)
+        if timeout is None and priority == INTERACTIVE:
+            timeout = self.queue_timeout
+        try:
+            await asyncio.wait_for(granted, timeout)
+        except asyncio.TimeoutError:
+            if self._cancel(ticket):
+                raise self._timed_out(timeout)
+        except BaseException:
+            # Caller cancelled (e.g. client disconnected) while waiting
+            if not self._cancel(ticket):
+                self.release(ticket, 0)
+            raise
+        return ticket
+
+    def release(self, ticket: _Ticket, used_tokens: int | None = None) -> None:
+        """Free the slot; with `used_tokens`, settle the TPM estimate against the real usage."""
+        with self._cond:
+            self._running -= 1
+            if used_tokens is not None:
+                self._tokens.give(ticket.tokens - used_tokens)
+            self._cond.notify_all()
+
+    def retrying(self, delay: float, rate_limited: bool) -> None:
+        """Count a retry; after a 429, hold back every queued call for `delay` seconds."""
+        with self._cond:
+            self.retries += 1
+            if rate_limited:
+                self.rate_limited += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self._cond.notify_all()
+
+    def check_admission(self) -> None:
+        """Raise LLMQueueFull now if an interactive call would be refused (used before a stream starts)."""
+        with self._cond:
+            if self._waiting[INTERACTIVE] >= self.max_queued:
+                raise self._queue_full()
+
+    @contextmanager
+    def slot(self, priority: int = BULK, timeout: float | None = None) -> Iterator[None]:
+        """
+        Hold one slot for a block of work whose LLM calls are made elsewhere
+        (PageIndex build). Raises LLMQueueFull if none is free within `timeout`.
+        """
+        ticket = self.acquire(priority, timeout=timeout)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "running": self._running,
+                "max_concurrency": self.max_concurrency,
+                "waiting": dict(zip(PRIORITY_NAMES, self._waiting)),
+                "granted": dict(zip(PRIORITY_NAMES, self.granted)),
+                "rejected": self.rejected,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+                "rpm_limit": self._requests.capacity or None,
+                "tpm_limit": self._tokens.capacity or None,
+                "tpm_available": round(self._tokens.level) if self._tokens.capacity else None,
+            }
+
+
+_scheduler: LLMScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                share = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+                _scheduler = LLMScheduler(rpm=LLM_RPM / share, tpm=LLM_TPM / share)
+    return _scheduler
+
+
+# ---------------------------------------------------------------------------
+# Scheduled calls
+# ---------------------------------------------------------------------------
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Prompt + completion tokens a chat completion may use (only computed when LLM_TPM is set)."""
+    if not LLM_TPM:
+        return 0
+    from lang_chain.token_chunker import count_tokens
+    from lang_chain.context_packer import CONTEXT_ENCODING
+
+    prompt = sum(
+        count_tokens(message.get("content") or "", CONTEXT_ENCODING) + 4   # + role / framing
+        for message in kwargs.get("messages", ())
+    )
+    return prompt + (kwargs.get("max_tokens") or LLM_COMPLETION_ESTIMATE)
+
+
+def _used_tokens(usage) -> int | None:
+    if usage is None:
+        return None
+    return (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float | None:
+    """Seconds to wait before retrying `error`, or None when it must not be retried."""
+    if not isinstance(error, _RETRYABLE) or attempt >= LLM_MAX_RETRIES:
+        return None
+    if getattr(error, "code", None) == "insufficient_quota":
+        return None   # a 429 that no amount of waiting fixes
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    delay = None
+    if headers.get("retry-after-ms"):
+        try:
+            delay = float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if delay is None and headers.get("retry-after"):
+        try:
+            delay = float(headers["retry-after"])
+        except ValueError:
+            try:
+                delay = email.utils.parsedate_to_datetime(headers["retry-after"]).timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    if delay is None:
+        delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    return max(0.0, delay) if delay <= LLM_RETRY_MAX_SECONDS else None
+
+
+def _note_retry(scheduler: LLMScheduler, error: Exception, attempt: int, delay: float, priority: int) -> None:
+    rate_limited = isinstance(error, openai.RateLimitError)
+    reason = "rate_limited" if rate_limited else type(error).__name__
+    scheduler.retrying(delay, rate_limited)
+    LLM_RETRIES.inc(priority=PRIORITY_NAMES[priority], reason=reason)
+    print(f"LLM call failed ({reason}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+
+
+def complete(create: Callable, priority: int = INTERACTIVE, **kwargs):
+    """
+    `create(**kwargs)` (e.g. client.chat.completions.create or .parse) run
+    through the scheduler: queued by priority, rate limited and retried.
+    """
+    scheduler = get_scheduler()
+    tokens = estimate_tokens(kwargs)
+    for attempt in itertools.count():
+        ticket = scheduler.acquire(priority, tokens)
+        try:
+            response = create(**kwargs)
+        except Exception as e:
+            scheduler.release(ticket)
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+            _note_retry(scheduler, e, attempt, delay, priority)
+            time.sleep(delay)
+            continue
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+        scheduler.release(ticket, _used_tokens(getattr(response, "usage", None)))
+        return response
+
+
+async def _acreate(create: Callable, priority: int, kwargs: dict):
+    """(ticket, response) of the first successful attempt; the ticket is still held."""
+    scheduler = get_scheduler()
+    tokens = estimate_tokens(kwargs)
+    for attempt in itertools.count():
+        ticket = await scheduler.aacquire(priority, tokens)
+        try:
+            return ticket, await create(**kwargs)
+        except Exception as e:
+            scheduler.release(ticket)
+            delay = _retry_delay(e, attempt)
+            if delay is None:
+                raise
+            _note_retry(scheduler, e, attempt, delay, priority)
+            await asyncio.sleep(delay)
+        except BaseException:
+            scheduler.release(ticket)
+            raise
+
+
+async def acomplete(create: Callable, priority: int = INTERACTIVE, **kwargs):
+    """Async complete(), for the AsyncOpenAI clients."""
+    ticket, response = await _acreate(create, priority, kwargs)
+    get_scheduler().release(ticket, _used_tokens(getattr(response, "usage", None)))
+    return response
+
+
+@asynccontextmanager
+async def astream(create: Callable, priority: int = INTERACTIVE, **kwargs) -> AsyncIterator[AsyncIterator]:
+    """
+    A streamed completion holding its slot until the stream is closed. Only
+    opening the stream is retried; a failure mid-answer is the caller's.
+    Exiting the block closes the upstream stream.
+    """
+    ticket, stream = await _acreate(create, priority, {**kwargs, "stream": True})
+    used = None
+
+    async def events():
+        nonlocal used
+        async for event in stream:
+            if getattr(event, "usage", None) is not None:
+                used = _used_tokens(event.usage)
+            yield event
+
+    iterator = events()
+    try:
+        yield iterator
+    finally:
+        try:
+            await iterator.aclose()
+            await stream.close()
+        finally:
+            get_scheduler().release(ticket, used)
@@ -0,0 +1,306 @@
+import os
+import json
+import glob
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+
+# Prometheus-style counters and histograms for both engines, rendered in the
+# text exposition format by GET /metrics. Every sample carries the API route
+# template that caused it (the HTTP middleware puts the request scope in a
+# context variable), so a slow stage can be traced to the endpoint it slows
+# down; work outside a request (CLI ingestion) is labelled route="none".
+#
+# With several worker processes each keeps its own values. When METRICS_DIR is
+# set (serve.py does this for multi-worker mode) every worker writes a snapshot
+# there every METRICS_FLUSH_SECONDS, and /metrics sums the snapshots of all
+# workers, so a scrape sees the whole server whichever worker answers it.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+# Seconds; spans a cache hit (ms) to a PageIndex build (minutes)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+request_scope: contextvars.ContextVar[dict | None] = contextvars.ContextVar("metrics_request_scope", default=None)
+
+
+def route_template(scope: dict) -> str:
+    """
+    The matched route's path with parameters as placeholders
+    (/chat/{session_id}/message), so IDs never become label values.
+    Routing fills in `endpoint` and `path_params`; without them nothing matched.
+    """
+    if "endpoint" not in scope:
+        return "unmatched"
+    names = {str(value): name for name, value in scope.get("path_params", {}).items()}
+    return "/".join(f"{{{names[part]}}}" if part in names else part for part in scope["path"].split("/"))
+
+
+def current_route() -> str:
+    scope = request_scope.get()
+    return "none" if scope is None else route_template(scope)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [[list(key), value if self.kind == "counter" else list(value)] for key, value in self._values.items()]
+        return {"kind": self.kind, "help": self.help, "labels": list(self.labels), "samples": samples}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """For totals counted elsewhere (cache hit counters), copied in at collection time."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple[float, ...] = STAGE_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # [per-bucket counts..., +Inf count, sum]
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+_metrics: list[_Metric] = []
+_collectors: list[Callable[[], None]] = []
+
+STAGE_SECONDS = Histogram(
+    "doctalk_stage_seconds", "Duration of one pipeline stage (per page, batch, search or LLM call)",
+    ("engine", "route", "stage"),
+)
+STAGE_ERRORS = Counter(
+    "doctalk_stage_errors_total", "Pipeline stages that raised", ("engine", "route", "stage"),
+)
+LLM_TOKENS = Counter(
+    "doctalk_llm_tokens_total", "Tokens reported by the LLM API", ("engine", "route", "stage", "kind"),
+)
+HTTP_REQUESTS = Counter(
+    "doctalk_http_requests_total", "HTTP requests by route template and status", ("route", "method", "status"),
+)
+HTTP_SECONDS = Histogram(
+    "doctalk_http_request_seconds", "HTTP request duration, including streamed bodies", ("route", "method"),
+)
+STREAM_TTFT = Histogram(
+    "doctalk_stream_ttft_seconds", "Time to first token of streamed replies", ("engine", "route"),
+)
+STREAM_OUTCOMES = Counter(
+    "doctalk_stream_outcomes_total", "Streamed replies by outcome", ("engine", "route", "outcome"),
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "doctalk_llm_queue_seconds", "Time LLM calls waited in the scheduler for a slot", ("priority",),
+)
+LLM_RETRIES = Counter(
+    "doctalk_llm_retries_total", "LLM calls retried after a rate limit or transient error", ("priority", "reason"),
+)
+CACHE_HITS = Counter("doctalk_cache_hits_total", "Cache hits", ("cache",))
+CACHE_MISSES = Counter("doctalk_cache_misses_total", "Cache misses", ("cache",))
+
+
+# ---------------------------------------------------------------------------
+# Instrumentation helpers
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def stage(engine: str, name: str) -> Iterator[None]:
+    """Time the enclosed block as stage `name` of `engine` for the current route."""
+    route = current_route()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(engine=engine, route=route, stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, engine=engine, route=route, stage=name)
+
+
+def record_stage(engine: str, name: str, seconds: float) -> None:
+    """Record a stage timed elsewhere (e.g. in a child process)."""
+    STAGE_SECONDS.observe(seconds, engine=engine, route=current_route(), stage=name)
+
+
+def timed_iter(items: Iterable, engine: str, name: str) -> Iterator:
+    """Yield from `items`, timing the production of each item as one `name` stage."""
+    it = iter(items)
+    while True:
+        with stage(engine, name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+def record_usage(engine: str, name: str, usage) -> None:
+    """Count prompt / completion tokens of an OpenAI `usage` object (None when the API sent none)."""
+    if usage is None:
+        return
+    route = current_route()
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, engine=engine, route=route, stage=name, kind="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, engine=engine, route=route, stage=name, kind="completion")
+
+
+def in_context(fn: Callable) -> Callable:
+    """Bind `fn` to the caller's context (request scope) for running on a thread pool."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def register_cache(name: str, stats: Callable[[], dict]) -> None:
+    """Export the hits / misses of a cache exposing stats() as doctalk_cache_*_total{cache=name}."""
+    def collect() -> None:
+        values = stats()
+        CACHE_HITS.set_total(values["hits"], cache=name)
+        CACHE_MISSES.set_total(values["misses"], cache=name)
+    _collectors.append(collect)
+
+
+# ---------------------------------------------------------------------------
+# Snapshots, cross-worker merge and exposition
+# ---------------------------------------------------------------------------
+
+def snapshot() -> dict:
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return {metric.name: metric.snapshot() for metric in _metrics}
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def flush() -> dict:
+    """Take this worker's snapshot and, in multi-worker mode, publish it to METRICS_DIR."""
+    current = snapshot()
+    if METRICS_DIR:
+        path = _snapshot_path(os.getpid())
+        with open(path + ".tmp", "w") as f:
+            json.dump(current, f)
+        os.replace(path + ".tmp", path)
+    return current
+
+
+def _merge(snapshots: list[dict]) -> dict:
+    merged: dict = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for key, value in metric["samples"]:
+                key = tuple(key)
+                if key not in target["samples"]:
+                    target["samples"][key] = value
+                elif metric["kind"] == "counter":
+                    target["samples"][key] += value
+                else:
+                    target["samples"][key] = [a + b for a, b in zip(target["samples"][key], value)]
+    return merged
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: list[str], values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render() -> str:
+    """All metrics in the Prometheus text format, summed over every worker's latest snapshot."""
+    own = flush()
+    snapshots = [own]
+    if METRICS_DIR:
+        own_path = _snapshot_path(os.getpid())
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            if path == own_path:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue   # a worker mid-write or gone; its next flush is picked up by the next scrape
+
+    lines = []
+    for name, metric in _merge(snapshots).items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key, value in sorted(metric["samples"].items()):
+            if metric["kind"] == "counter":
+                lines.append(f"{name}{_label_text(metric['labels'], key)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_label_text(metric['labels'], key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(metric['labels'], key)} {round(value[-1], 6)}")
+            lines.append(f"{name}_count{_label_text(metric['labels'], key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+_flusher: threading.Thread | None = None
+
+
+def start_flusher() -> None:
+    """Publish this worker's snapshot every METRICS_FLUSH_SECONDS (multi-worker mode only)."""
+    global _flusher
+    if not METRICS_DIR or _flusher is not None:
+        return
+
+    def loop() -> None:
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            try:
+                flush()
+            except OSError as e:
+                print(f"Metrics flush failed: {e}")
+
+    _flusher = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+    _flusher.start()
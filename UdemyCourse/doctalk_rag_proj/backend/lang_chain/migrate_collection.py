@@ -0,0 +1,203 @@
+import json
+import math
+import time
+import random
+import argparse
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from qdrant_client.models import BinaryQuantization, ScalarQuantization, SearchParams
+from lang_chain.embedding_cache import (
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL,
+    cached_embeddings,
+    embedding_id,
+    make_embeddings,
+)
+from lang_chain.vector_store import (
+    COLLECTION_NAME,
+    CONTENT_KEY,
+    METADATA_KEY,
+    QDRANT_QUANTIZATION,
+    VECTOR_DB_URL,
+    QdrantStore,
+    search_params,
+)
+
+# Copies a Qdrant collection into a new one with a different embedding model,
+# vector size and/or quantization, then reports estimated vector memory and
+# recall@k of both. Points keep their IDs and payloads, so BM25 indexes and
+# sessions stay valid; switch over by pointing QDRANT_COLLECTION (and
+# EMBEDDING_MODEL / EMBEDDING_DIMENSIONS / QDRANT_QUANTIZATION) at the new one.
+
+_SCROLL_PAGE = 256
+_QUERY_WORDS = 12   # pseudo-questions are the opening words of sampled chunks
+
+
+def _quantization_mode(info) -> str:
+    config = info.config.quantization_config
+    if isinstance(config, ScalarQuantization):
+        return "scalar"
+    if isinstance(config, BinaryQuantization):
+        return "binary"
+    return "none"
+
+
+def collection_profile(client: QdrantClient, name: str) -> dict:
+    """Size, vector config and estimated vector memory of a collection."""
+    info = client.get_collection(name)
+    params = info.config.params.vectors
+    points = client.count(name, exact=True).count
+    quantization = _quantization_mode(info)
+    original = points * params.size * 4
+    quantized = {"none": 0, "scalar": points * params.size, "binary": points * math.ceil(params.size / 8)}[quantization]
+    on_disk = bool(params.on_disk)
+    return {
+        "collection": name,
+        "points": points,
+        "dimensions": params.size,
+        "quantization": quantization,
+        "originals_on_disk": on_disk,
+        # Vectors only (HNSW links and payloads excluded); quantized vectors are kept in RAM
+        "vector_ram_mb": round(((0 if on_disk else original) + quantized) / 2**20, 1),
+        "vector_disk_mb": round((original + quantized) / 2**20, 1),
+    }
+
+
+def sample_questions(client: QdrantClient, name: str, count: int, seed: int = 7) -> list[str]:
+    """Pseudo-questions taken from the opening words of randomly chosen chunks."""
+    texts, offset = [], None
+    while True:
+        points, offset = client.scroll(name, limit=1000, offset=offset, with_payload=[CONTENT_KEY], with_vectors=False)
+        texts.extend(point.payload.get(CONTENT_KEY, "") for point in points)
+        if offset is None:
+            break
+    texts = [" ".join(text.split()[:_QUERY_WORDS]) for text in texts if text.strip()]
+    return random.Random(seed).sample(texts, min(count, len(texts)))
+
+
+def _top_ids(client: QdrantClient, name: str, vectors: list[list[float]], k: int, params) -> list[set]:
+    return [
+        {point.id for point in client.query_points(name, query=vector, limit=k, search_params=params).points}
+        for vector in vectors
+    ]
+
+
+def recall_at_k(truth: list[set], found: list[set]) -> float:
+    if not truth:
+        return 0.0
+    return round(sum(len(t & f) / max(len(t), 1) for t, f in zip(truth, found)) / len(truth), 4)
+
+
+def copy_points(
+    client: QdrantClient,
+    source: str,
+    target: QdrantStore,
+    re_embed: bool,
+    model: str,
+    dimensions: int | None,
+) -> int:
+    """Copy every point of `source` into `target`, re-embedding page_content when the model changes."""
+    embedding = cached_embeddings(model, dimensions) if re_embed else None
+    copied, offset = 0, None
+    while True:
+        points, offset = client.scroll(
+            source, limit=_SCROLL_PAGE, offset=offset, with_payload=True, with_vectors=not re_embed
+        )
+        if points:
+            docs = [
+                Document(page_content=p.payload.get(CONTENT_KEY, ""), metadata=p.payload.get(METADATA_KEY) or {})
+                for p in points
+            ]
+            if re_embed:
+                vectors = embedding.embed_documents([doc.page_content for doc in docs])
+            else:
+                vectors = [p.vector for p in points]
+            target.upsert(docs, vectors, ids=[str(p.id) for p in points])
+            copied += len(points)
+            print(f"Copied {copied} points...")
+        if offset is None:
+            return copied
+
+
+def migrate(
+    source: str,
+    target: str | None,
+    source_model: str,
+    source_dimensions: int | None,
+    model: str,
+    dimensions: int | None,
+    quantization: str,
+    queries: int,
+    k: int,
+    source_quantization: str = QDRANT_QUANTIZATION,
+) -> dict:
+    client = QdrantClient(url=VECTOR_DB_URL)
+    report: dict = {"before": collection_profile(client, source)}
+
+    questions = sample_questions(client, source, queries)
+    source_vectors = make_embeddings(source_model, source_dimensions).embed_documents(questions)
+    truth = _top_ids(client, source, source_vectors, k, SearchParams(exact=True))
+    report["before"][f"recall@{k}"] = recall_at_k(truth, _top_ids(client, source, source_vectors, k, search_params(source_quantization)))
+
+    if target:
+        if client.collection_exists(target):
+            raise RuntimeError(f"Target collection '{target}' already exists.")
+        re_embed = embedding_id(model, dimensions) != embedding_id(source_model, source_dimensions)
+        store = QdrantStore(collection_name=target, quantization=quantization)
+        start = time.perf_counter()
+        copied = copy_points(client, source, store, re_embed, model, dimensions)
+        report["migration"] = {
+            "points": copied,
+            "re_embedded": re_embed,
+            "model": embedding_id(model, dimensions),
+            "seconds": round(time.perf_counter() - start, 1),
+        }
+
+        target_vectors = make_embeddings(model, dimensions).embed_documents(questions) if re_embed else source_vectors
+        after = collection_profile(client, target)
+        # Against the source's exact results, and against the target's own exact
+        # results (the loss due to quantization alone)
+        found = _top_ids(client, target, target_vectors, k, search_params(quantization))
+        after[f"recall@{k}"] = recall_at_k(truth, found)
+        after[f"quantization_recall@{k}"] = recall_at_k(
+            _top_ids(client, target, target_vectors, k, SearchParams(exact=True)), found
+        )
+        report["after"] = after
+    report["questions"] = len(questions)
+    return report
+
+
+# Usage (from the backend directory):
+#   python -m lang_chain.migrate_collection --report-only
+#   python -m lang_chain.migrate_collection --target pdf_documents_3s512 \
+#       --model text-embedding-3-small --dimensions 512 --quantization scalar
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embed and/or re-quantize a Qdrant collection into a new one.")
+    parser.add_argument("--source", default=COLLECTION_NAME, help="Collection to migrate")
+    parser.add_argument("--target", help="New collection to create (omit with --report-only)")
+    parser.add_argument("--source-model", default=EMBEDDING_MODEL, help="Embedding model of the source")
+    parser.add_argument("--source-dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument("--source-quantization", default=QDRANT_QUANTIZATION, help="Search params used on the source")
+    parser.add_argument("--model", help="Embedding model of the target (default: source model)")
+    parser.add_argument("--dimensions", type=int, help="Vector size of the target (default: source size)")
+    parser.add_argument("--quantization", default="none", choices=["none", "scalar", "binary"])
+    parser.add_argument("--queries", type=int, default=50, help="Sampled questions for recall@k")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--report-only", action="store_true", help="Only profile the source collection")
+    args = parser.parse_args()
+    if not args.target and not args.report_only:
+        parser.error("--target is required unless --report-only is given")
+
+    result = migrate(
+        source=args.source,
+        target=None if args.report_only else args.target,
+        source_model=args.source_model,
+        source_dimensions=args.source_dimensions,
+        model=args.model or args.source_model,
+        dimensions=args.dimensions if args.model or args.dimensions else args.source_dimensions,
+        quantization=args.quantization,
+        queries=args.queries,
+        k=args.k,
+        source_quantization=args.source_quantization,
+    )
+    print(json.dumps(result, indent=2))
@@ -1,30 +1,43 @@
 import os
 import json
+import fcntl
 import shutil
+import hashlib
+from contextlib import contextmanager
+from typing import BinaryIO
+from openai import OpenAI
 
 # page_index_main and config come from the open-source PageIndex repo
 # cloned to /pageindex_src and added to PYTHONPATH in Dockerfile.
 # Uses CHATGPT_API_KEY env var (same value as OPENAI_API_KEY) — no cloud API key needed.
 from pageindex import page_index_main
-from pageindex.utils import ConfigLoader
+from pageindex.utils import ConfigLoader, get_text_of_pages
+from lang_chain.metrics import record_usage, stage
+from lang_chain.llm_scheduler import BULK, complete, get_scheduler
 
 STORE_DIR = os.getenv("PAGEINDEX_STORE_DIR", "pageindex_store")
+# Longest wait of a full build for its LLM scheduler slot before LLMQueueFull
+LLM_BUILD_SLOT_TIMEOUT_SECONDS = float(os.getenv("LLM_BUILD_SLOT_TIMEOUT_SECONDS", "120"))
 
 _config_loader = ConfigLoader()
 _opt = _config_loader.load()  # loads defaults from config.yaml
 
+# Model for re-summarizing nodes after an incremental update — same env as the querier
+SUMMARY_MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
+_summary_client: OpenAI | None = None
+
 
 # ---------------------------------------------------------------------------
 # Non-PDF → PDF conversion helpers
 # ---------------------------------------------------------------------------
 
-def _extract_raw_text(file_path: str) -> str:
-    """Extract all text content from any supported file type."""
-    ext = os.path.splitext(file_path)[1].lower()
+def _extract_raw_text(source: str | BinaryIO, filename: str) -> str:
+    """Extract all text content from any supported file type (path or open binary file)."""
+    ext = os.path.splitext(filename)[1].lower()
 
     if ext in (".xlsx", ".xls"):
         import pandas as pd
-        xl = pd.ExcelFile(file_path)
+        xl = pd.ExcelFile(source)
         parts = []
         for sheet in xl.sheet_names:
             df = xl.parse(sheet).fillna("")
@@ -33,15 +46,17 @@ def _extract_raw_text(file_path: str) -> str:
 
     if ext == ".csv":
         import pandas as pd
-        df = pd.read_csv(file_path).fillna("")
+        df = pd.read_csv(source).fillna("")
         return df.to_string(index=False)
 
     if ext == ".docx":
         import docx2txt
-        return docx2txt.process(file_path) or ""
+        return docx2txt.process(source) or ""
 
     if ext == ".txt":
-        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        if not isinstance(source, str):
+            return source.read().decode("utf-8", errors="replace")
+        with open(source, "r", encoding="utf-8", errors="replace") as f:
             return f.read()
 
     raise ValueError(f"Cannot extract text from unsupported type: '{ext}'")
@@ -94,50 +109,229 @@ def _text_to_pdf(text: str, output_path: str) -> None:
     c.save()
 
 
-def _prepare_pdf(file_path: str, doc_dir: str) -> str:
+def _prepare_pdf(source: str | BinaryIO, filename: str, staging_dir: str) -> str:
     """
-    Copy / convert the source file into doc_dir as document.pdf.
-    Returns the path to the stored PDF.
+    Copy / convert the source (path or open binary file) into staging_dir as document.pdf.
+    Returns the path to the staged PDF; _install moves it into the store.
     """
-    stored_pdf = os.path.join(doc_dir, "document.pdf")
-    ext = os.path.splitext(file_path)[1].lower()
+    staged_pdf = os.path.join(staging_dir, "document.pdf")
+    ext = os.path.splitext(filename)[1].lower()
 
     if ext == ".pdf":
-        shutil.copy2(file_path, stored_pdf)
+        if isinstance(source, str):
+            shutil.copy2(source, staged_pdf)
+        else:
+            with open(staged_pdf, "wb") as f:
+                shutil.copyfileobj(source, f)
     else:
-        print(f"Converting '{os.path.basename(file_path)}' → PDF for PageIndex...")
-        text = _extract_raw_text(file_path)
-        _text_to_pdf(text, stored_pdf)
+        print(f"Converting '{filename}' → PDF for PageIndex...")
+        text = _extract_raw_text(source, filename)
+        _text_to_pdf(text, staged_pdf)
         print(f"Conversion done ({len(text):,} chars).")
 
-    return stored_pdf
+    return staged_pdf
+
+
+# ---------------------------------------------------------------------------
+# Incremental update helpers
+# ---------------------------------------------------------------------------
+
+def _page_hashes(pdf_path: str) -> list[str]:
+    """SHA-256 of every page's extracted text, in page order."""
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    return [
+        hashlib.sha256((page.extract_text() or "").encode("utf-8")).hexdigest()
+        for page in reader.pages
+    ]
+
+
+def _iter_nodes(structure):
+    for node in structure if isinstance(structure, list) else [structure]:
+        yield node
+        yield from _iter_nodes(node.get("nodes", []))
+
+
+def _mark_stale_nodes(tree: dict, changed_pages: set[int]) -> list[dict]:
+    """Flag every node whose page range covers a changed page (1-based) with needs_summary."""
+    stale = []
+    for node in _iter_nodes(tree.get("structure", [])):
+        start, end = node.get("start_index"), node.get("end_index")
+        if start is None or end is None:
+            continue
+        if any(start <= page <= end for page in changed_pages):
+            node["needs_summary"] = True
+            stale.append(node)
+    return stale
+
+
+def _get_summary_client() -> OpenAI:
+    global _summary_client
+    if _summary_client is None:
+        _summary_client = OpenAI(
+            api_key=os.getenv("GEMINI_KEY") or os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_retries=0,
+        )
+    return _summary_client
+
+
+def _resummarize_nodes(nodes: list[dict], pdf_path: str) -> int:
+    """Refresh text/summary of nodes flagged needs_summary. Returns how many were re-summarized."""
+    count = 0
+    for node in nodes:
+        text = get_text_of_pages(pdf_path, node["start_index"], node["end_index"])
+        if "text" in node:
+            node["text"] = text
+        if "summary" in node:
+            response = complete(
+                _get_summary_client().chat.completions.create,
+                BULK,
+                model=SUMMARY_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "Summarize this document section in 2–3 sentences. "
+                                   "Mention the key entities, figures and topics it covers.",
+                    },
+                    {"role": "user", "content": f"Section: {node.get('title', '')}\n\n{text}"},
+                ],
+                temperature=0,
+            )
+            record_usage("pageindex", "build_index", response.usage)
+            node["summary"] = response.choices[0].message.content or ""
+            count += 1
+        node.pop("needs_summary", None)
+    return count
+
+
+def _save_json(path: str, data) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def _install(staging_dir: str, doc_dir: str, tree: dict, hashes: list[str]) -> None:
+    """
+    Move the staged PDF, tree and page hashes into the store. Each is an atomic
+    replace, so other worker processes read the old or the new file, never half
+    of one. The hashes go last: if the process dies in between, the next upload
+    sees the old hashes and redoes the changed pages.
+    """
+    _save_json(os.path.join(staging_dir, "index.json"), tree)
+    _save_json(os.path.join(staging_dir, "page_hashes.json"), hashes)
+    for name in ("document.pdf", "index.json", "page_hashes.json"):
+        os.replace(os.path.join(staging_dir, name), os.path.join(doc_dir, name))
+
+
+@contextmanager
+def _document_lock(doc_dir: str):
+    """
+    Exclusive lock on one document's store directory, held while its index is
+    built or updated. flock() locks are per open file, so this serialises
+    threads of one worker as well as separate worker processes on the host.
+    """
+    with open(os.path.join(doc_dir, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 
 # ---------------------------------------------------------------------------
 # Public API
 # ---------------------------------------------------------------------------
 
-def build_index(file_path: str, filename: str) -> dict:
+def update_index(source: str | BinaryIO, filename: str) -> tuple[dict, dict]:
     """
-    Build a PageIndex tree for any supported file type.
-    Non-PDF files are converted to a paginated PDF first, then processed
-    identically to a native PDF — no change to the query path.
+    Build or incrementally update the PageIndex tree for `filename`.
 
-    Returns the tree structure dict.
+    Per-page text hashes are stored next to the tree. On re-upload with the
+    same page count, only nodes covering changed pages are marked
+    needs_summary and re-summarized; the tree structure is kept. A different
+    page count shifts every range, so the tree is rebuilt in full.
+
+    Returns (tree, report) where report has mode ("full", "incremental" or
+    "unchanged"), pages_reused, pages_recomputed and nodes_resummarized.
+
+    Concurrent calls for the same file, from any worker process, run one at a
+    time; a duplicate upload waits for the first build and is then "unchanged".
     """
     doc_dir = os.path.join(STORE_DIR, filename)
     os.makedirs(doc_dir, exist_ok=True)
+    with _document_lock(doc_dir), stage("pageindex", "build_index"):
+        return _update_index_locked(source, filename, doc_dir)
 
-    stored_pdf = _prepare_pdf(file_path, doc_dir)
 
-    print(f"Building PageIndex tree for '{filename}'...")
-    tree = page_index_main(stored_pdf, _opt)
+def _update_index_locked(source: str | BinaryIO, filename: str, doc_dir: str) -> tuple[dict, dict]:
+    # Everything is built from a staged copy; the stored PDF, tree and hashes
+    # are only replaced once the build succeeded, so a failed or rejected
+    # (LLMQueueFull) build leaves the previous index serving queries.
+    staging_dir = os.path.join(doc_dir, ".staging")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    try:
+        tree, report = _build_staged(source, filename, doc_dir, staging_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return tree, report
 
+
+def _build_staged(source: str | BinaryIO, filename: str, doc_dir: str, staging_dir: str) -> tuple[dict, dict]:
     index_path = os.path.join(doc_dir, "index.json")
-    with open(index_path, "w", encoding="utf-8") as f:
-        json.dump(tree, f, indent=2, ensure_ascii=False)
+    hashes_path = os.path.join(doc_dir, "page_hashes.json")
+
+    old_hashes = None
+    if os.path.exists(index_path) and os.path.exists(hashes_path):
+        with open(hashes_path, "r", encoding="utf-8") as f:
+            old_hashes = json.load(f)
+
+    staged_pdf = _prepare_pdf(source, filename, staging_dir)
+    new_hashes = _page_hashes(staged_pdf)
+
+    if old_hashes is not None and len(old_hashes) == len(new_hashes):
+        changed = {i + 1 for i, (old, new) in enumerate(zip(old_hashes, new_hashes)) if old != new}
+        tree, _ = load_index(filename)
+        stale = _mark_stale_nodes(tree, changed)
+        resummarized = _resummarize_nodes(stale, staged_pdf)
+        _install(staging_dir, doc_dir, tree, new_hashes)
+        report = {
+            "mode": "incremental" if changed else "unchanged",
+            "pages_reused": len(new_hashes) - len(changed),
+            "pages_recomputed": len(changed),
+            "nodes_resummarized": resummarized,
+        }
+        print(f"PageIndex for '{filename}' updated incrementally: {report}")
+        return tree, report
 
+    print(f"Building PageIndex tree for '{filename}'...")
+    # page_index_main makes its own LLM calls; the build holds one bulk slot of
+    # the scheduler, so builds queue behind chat and count towards its concurrency.
+    # The upload request waits for it, so the wait is bounded.
+    with get_scheduler().slot(BULK, timeout=LLM_BUILD_SLOT_TIMEOUT_SECONDS):
+        tree = page_index_main(staged_pdf, _opt)
+    _install(staging_dir, doc_dir, tree, new_hashes)
     print(f"Tree saved → {index_path}")
+    report = {
+        "mode": "full",
+        "pages_reused": 0,
+        "pages_recomputed": len(new_hashes),
+        "nodes_resummarized": 0,
+    }
+    return tree, report
+
+
+def build_index(source: str | BinaryIO, filename: str) -> dict:
+    """
+    Build a PageIndex tree for any supported file type.
+    Non-PDF files are converted to a paginated PDF first, then processed
+    identically to a native PDF — no change to the query path.
+    `source` is a path or an open binary file (e.g. a staged upload).
+    Re-uploads of an indexed file are updated incrementally (see update_index).
+
+    Returns the tree structure dict.
+    """
+    tree, _ = update_index(source, filename)
     return tree
 
 
@@ -1,8 +1,13 @@
 import os
 import json
-from openai import OpenAI
+import asyncio
+from typing import AsyncGenerator
+from openai import AsyncOpenAI, OpenAI
 from pageindex.utils import get_text_of_pages
 from lang_chain.pageindex_indexer import load_index
+from lang_chain.history_compactor import compact_history
+from lang_chain.metrics import record_usage, stage
+from lang_chain.llm_scheduler import acomplete, astream, complete
 
 # Supports both OpenAI and Gemini (via OpenAI-compatible endpoint).
 # Set OPENAI_BASE_URL=https://generativelanguage.googleapis.com/v1beta/openai/
@@ -10,7 +15,10 @@ from lang_chain.pageindex_indexer import load_index
 _api_key = os.getenv("GEMINI_KEY") or os.getenv("OPENAI_API_KEY")
 _base_url = os.getenv("OPENAI_BASE_URL") or None   # None → uses OpenAI default
 
-client = OpenAI(api_key=_api_key, base_url=_base_url)
+# Retries are left to lang_chain.llm_scheduler, which paces every call
+client = OpenAI(api_key=_api_key, base_url=_base_url, max_retries=0)
+# Used by the streaming route so the event loop is never blocked on the LLM
+async_client = AsyncOpenAI(api_key=_api_key, base_url=_base_url, max_retries=0)
 
 # Model used for both tree navigation and answer generation.
 # For Gemini set CHAT_MODEL=gemini-2.0-flash in .env
@@ -57,6 +65,11 @@ def _find_node(structure, node_id: str) -> dict | None:
 
 def _extract_text_for_nodes(pdf_path: str, node_ids: list[str], tree: dict) -> str:
     """Extract raw page text for the given node IDs from the PDF."""
+    with stage("pageindex", "page_extraction"):
+        return _extract_text(pdf_path, node_ids, tree)
+
+
+def _extract_text(pdf_path: str, node_ids: list[str], tree: dict) -> str:
     structure = tree.get("structure", [])
     texts = []
     seen = set()
@@ -82,7 +95,70 @@ def _extract_text_for_nodes(pdf_path: str, node_ids: list[str], tree: dict) -> s
 
 
 # ---------------------------------------------------------------------------
-# Public query function
+# Prompt building (shared by the blocking and streaming paths)
+# ---------------------------------------------------------------------------
+
+def _navigation_messages(doc_name: str, toc_str: str, user_input: str) -> list[dict]:
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a document navigation assistant. "
+                "Given a document's table of contents (with page ranges and section summaries), "
+                "identify the most relevant section node_ids for the user's query. "
+                "Return ONLY a valid JSON object: {\"node_ids\": [\"0001\", \"0003\"]}. "
+                "Choose 1–4 specific sections. Prefer depth over breadth."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Document: {doc_name}\n\n"
+                f"Table of Contents:\n{toc_str}\n\n"
+                f"Query: {user_input}"
+            ),
+        },
+    ]
+
+
+def _parse_node_ids(content: str | None) -> list[str]:
+    try:
+        node_ids = json.loads(content).get("node_ids", [])
+    except Exception as e:
+        print(f"Navigation parse error: {e} — using empty selection")
+        node_ids = []
+    print(f"PageIndex selected nodes: {node_ids}")
+    return node_ids
+
+
+def _answer_messages(
+    doc_name: str,
+    toc_str: str,
+    extracted_text: str,
+    user_input: str,
+    history: list[dict],
+) -> list[dict]:
+    # Fallback: use TOC summaries if no text could be extracted
+    if not extracted_text:
+        print("No page text extracted — falling back to TOC summaries")
+        extracted_text = f"Document structure and summaries:\n{toc_str}"
+
+    system_msg = (
+        f"You are an expert AI assistant helping users understand '{doc_name}'. "
+        f"Answer the user's question based only on the document context below. "
+        f"Be concise and accurate. Cite section names or page numbers when relevant.\n\n"
+        f"<document_context>\n{extracted_text}\n</document_context>"
+    )
+
+    answer_messages = [{"role": "system", "content": system_msg}]
+    # Recent turns verbatim, older ones as a running summary
+    answer_messages.extend(compact_history(history))
+    answer_messages.append({"role": "user", "content": user_input})
+    return answer_messages
+
+
+# ---------------------------------------------------------------------------
+# Public query functions
 # ---------------------------------------------------------------------------
 
 def chat_with_pageindex(
@@ -96,7 +172,7 @@ def chat_with_pageindex(
     Step 1 — Navigation:  LLM reads the document TOC (with summaries) and
                           identifies the most relevant section node IDs.
     Step 2 — Answer:      Extract raw page text for those sections and let
-                          the LLM answer using the extracted text + full history.
+                          the LLM answer using the extracted text + compacted history.
 
     No embeddings, no Qdrant, no cloud API key — only OpenAI + the local tree.
 
@@ -109,67 +185,30 @@ def chat_with_pageindex(
     # ------------------------------------------------------------------
     # Step 1: Tree Navigation — LLM picks relevant sections
     # ------------------------------------------------------------------
-    nav_response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a document navigation assistant. "
-                    "Given a document's table of contents (with page ranges and section summaries), "
-                    "identify the most relevant section node_ids for the user's query. "
-                    "Return ONLY a valid JSON object: {\"node_ids\": [\"0001\", \"0003\"]}. "
-                    "Choose 1–4 specific sections. Prefer depth over breadth."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    f"Document: {doc_name}\n\n"
-                    f"Table of Contents:\n{toc_str}\n\n"
-                    f"Query: {user_input}"
-                ),
-            },
-        ],
-        response_format={"type": "json_object"},
-        temperature=0,
-    )
-
-    try:
-        nav_result = json.loads(nav_response.choices[0].message.content)
-        node_ids: list[str] = nav_result.get("node_ids", [])
-    except Exception as e:
-        print(f"Navigation parse error: {e} — using empty selection")
-        node_ids = []
-
-    print(f"PageIndex selected nodes: {node_ids}")
+    with stage("pageindex", "navigation"):
+        nav_response = complete(
+            client.chat.completions.create,
+            model=CHAT_MODEL,
+            messages=_navigation_messages(doc_name, toc_str, user_input),
+            response_format={"type": "json_object"},
+            temperature=0,
+        )
+    record_usage("pageindex", "navigation", nav_response.usage)
+    node_ids = _parse_node_ids(nav_response.choices[0].message.content)
 
     # ------------------------------------------------------------------
     # Step 2: Extract page text + Generate answer
     # ------------------------------------------------------------------
     extracted_text = _extract_text_for_nodes(pdf_path, node_ids, tree)
 
-    # Fallback: use TOC summaries if no text could be extracted
-    if not extracted_text:
-        print("No page text extracted — falling back to TOC summaries")
-        extracted_text = f"Document structure and summaries:\n{toc_str}"
-
-    system_msg = (
-        f"You are an expert AI assistant helping users understand '{doc_name}'. "
-        f"Answer the user's question based only on the document context below. "
-        f"Be concise and accurate. Cite section names or page numbers when relevant.\n\n"
-        f"<document_context>\n{extracted_text}\n</document_context>"
-    )
-
-    answer_messages = [{"role": "system", "content": system_msg}]
-    answer_messages.extend(history)
-    answer_messages.append({"role": "user", "content": user_input})
-
-    answer_response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=answer_messages,
-        temperature=0.3,
-    )
+    with stage("pageindex", "answer"):
+        answer_response = complete(
+            client.chat.completions.create,
+            model=CHAT_MODEL,
+            messages=_answer_messages(doc_name, toc_str, extracted_text, user_input, history),
+            temperature=0.3,
+        )
+    record_usage("pageindex", "answer", answer_response.usage)
 
     reply = answer_response.choices[0].message.content or ""
 
@@ -179,3 +218,48 @@ def chat_with_pageindex(
     ]
 
     return reply, updated_history
+
+
+async def astream_chat_with_pageindex(
+    user_input: str,
+    filename: str,
+    history: list[dict],
+) -> AsyncGenerator[str, None]:
+    """
+    Streaming variant of chat_with_pageindex: navigation runs as before, then
+    the answer is yielded token by token. History is left to the caller, which
+    commits the turn once the stream completes. Closing the generator early
+    aborts the upstream completion.
+    """
+    tree, pdf_path = await asyncio.to_thread(load_index, filename)
+    doc_name = tree.get("doc_name", filename)
+    toc_str = _format_tree_as_toc(tree)
+
+    with stage("pageindex", "navigation"):
+        nav_response = await acomplete(
+            async_client.chat.completions.create,
+            model=CHAT_MODEL,
+            messages=_navigation_messages(doc_name, toc_str, user_input),
+            response_format={"type": "json_object"},
+            temperature=0,
+        )
+    record_usage("pageindex", "navigation", nav_response.usage)
+    node_ids = _parse_node_ids(nav_response.choices[0].message.content)
+
+    # Page extraction parses the PDF — keep it off the event loop
+    extracted_text = await asyncio.to_thread(_extract_text_for_nodes, pdf_path, node_ids, tree)
+
+    # Timed from the request to the last token; the final chunk carries the token usage
+    with stage("pageindex", "answer"):
+        async with astream(
+            async_client.chat.completions.create,
+            model=CHAT_MODEL,
+            messages=_answer_messages(doc_name, toc_str, extracted_text, user_input, history),
+            temperature=0.3,
+            stream_options={"include_usage": True},
+        ) as stream:
+            async for event in stream:
+                record_usage("pageindex", "answer", event.usage)
+                delta = event.choices[0].delta.content if event.choices else None
+                if delta:
+                    yield delta
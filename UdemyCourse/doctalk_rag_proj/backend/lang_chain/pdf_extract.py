@@ -0,0 +1,132 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Callable, Iterator
+from langchain_core.documents import Document
+
+# Pluggable PDF text extraction. "pypdf" is the original single-core
+# PyPDFLoader path; "parallel" splits the page range across worker processes
+# and yields pages lazily, in page order, as each range completes.
+PDF_EXTRACT_ENGINE = os.getenv("PDF_EXTRACT_ENGINE", "parallel")
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Created once and reused: spawning workers costs far more than extracting a page range
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool
+
+
+# Per-process reader cache. Opening a large PDF parses its whole page tree
+# (~1 s for 10k pages), so each worker opens a file once, not once per range.
+_reader_key: tuple | None = None
+_reader = None
+
+
+def _get_reader(file_path: str):
+    global _reader_key, _reader
+    from pypdf import PdfReader
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    if key != _reader_key:
+        _reader, _reader_key = PdfReader(file_path), key
+    return _reader
+
+
+def _extract_range(file_path: str, start: int, end: int) -> list[str]:
+    """Worker: extract text of pages [start, end). Runs in a child process."""
+    reader = _get_reader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _page_doc(file_path: str, page: int, text: str, total_pages: int) -> Document:
+    # Same metadata keys PyPDFLoader sets, so downstream code can't tell the engines apart
+    return Document(
+        page_content=text,
+        metadata={"source": file_path, "page": page, "page_label": str(page + 1), "total_pages": total_pages},
+    )
+
+
+def _iter_in_process(source: str | BinaryIO, name: str) -> Iterator[Document]:
+    from pypdf import PdfReader
+    reader = PdfReader(source)
+    total = len(reader.pages)
+    for page in range(total):
+        yield _page_doc(name, page, reader.pages[page].extract_text() or "", total)
+
+
+def _iter_pypdf(source: str | BinaryIO, name: str) -> Iterator[Document]:
+    if not isinstance(source, str):
+        yield from _iter_in_process(source, name)
+        return
+    from langchain_community.document_loaders import PyPDFLoader
+    yield from PyPDFLoader(source).lazy_load()
+
+
+def _iter_parallel(source: str | BinaryIO, name: str) -> Iterator[Document]:
+    # Workers re-open the file by path, so in-memory buffers are extracted here
+    if not isinstance(source, str):
+        yield from _iter_in_process(source, name)
+        return
+
+    from pypdf import PdfReader
+    file_path = source
+    total = len(PdfReader(file_path).pages)
+    if total <= PDF_PAGES_PER_TASK or PDF_EXTRACT_WORKERS <= 1:
+        # Not worth the IPC: extract in-process, still one page at a time
+        yield from _iter_in_process(file_path, name)
+        return
+
+    pool = _get_pool()
+    ranges = iter(
+        (start, min(start + PDF_PAGES_PER_TASK, total))
+        for start in range(0, total, PDF_PAGES_PER_TASK)
+    )
+    # Ordered window: at most 2 ranges per worker are extracted ahead of the consumer
+    window = deque()
+    for start, end in ranges:
+        window.append((start, pool.submit(_extract_range, file_path, start, end)))
+        if len(window) >= PDF_EXTRACT_WORKERS * 2:
+            break
+
+    while window:
+        start, future = window.popleft()
+        texts = future.result()
+        for start_next, end_next in ranges:
+            window.append((start_next, pool.submit(_extract_range, file_path, start_next, end_next)))
+            break
+        for offset, text in enumerate(texts):
+            yield _page_doc(name, start + offset, text, total)
+
+
+PDF_ENGINES: dict[str, Callable[[str | BinaryIO, str], Iterator[Document]]] = {
+    "pypdf": _iter_pypdf,
+    "parallel": _iter_parallel,
+}
+
+
+def iter_pdf_pages(
+    source: str | BinaryIO,
+    engine: str | None = None,
+    filename: str | None = None,
+) -> Iterator[Document]:
+    """
+    Lazily yield one Document per PDF page, in page order, using the chosen engine.
+    `source` is a path or an open binary file object (extracted in-process).
+    """
+    engine = engine or PDF_EXTRACT_ENGINE
+    if engine not in PDF_ENGINES:
+        raise ValueError(f"Unknown PDF extract engine '{engine}'. Available: {', '.join(sorted(PDF_ENGINES))}")
+    return PDF_ENGINES[engine](source, filename or str(source))
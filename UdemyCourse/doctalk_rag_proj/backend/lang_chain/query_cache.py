@@ -0,0 +1,132 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+# In-memory cache of user-question embeddings. Questions repeat constantly
+# ("summarize this", "what is the total"), and embedding one costs a network
+# round-trip before retrieval can even start. Bounded by entry count (LRU) and
+# age (TTL) so a model or deployment change never serves stale vectors for long.
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "4096"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "86400"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Case-fold and collapse whitespace so trivially different spellings share an entry."""
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU + TTL map of (model, normalized query) -> vector."""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, ttl_seconds: float = QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[float, list[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model: str, text: str) -> list[float] | None:
+        key = (model, normalize_query(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, model: str, text: str, vector: list[float]) -> None:
+        key = (model, normalize_query(text))
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model so embed_query / aembed_query go through the
+    query cache. Document embedding passes straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, cache: QueryEmbeddingCache):
+        self.underlying = underlying
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self.cache.get(self.model, text)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self.cache.put(self.model, text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vector = self.cache.get(self.model, text)
+        if vector is None:
+            vector = await self.underlying.aembed_query(text)
+            self.cache.put(self.model, text, vector)
+        return vector
+
+    async def aembed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several questions; every cache miss goes to the model in a single request."""
+        vectors = [self.cache.get(self.model, text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            fresh = dict(zip(missing, await self.underlying.aembed_documents(missing)))
+            for text, vector in fresh.items():
+                self.cache.put(self.model, text, vector)
+            vectors = [vector if vector is not None else fresh[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+
+_cache: QueryEmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryEmbeddingCache()
+    return _cache
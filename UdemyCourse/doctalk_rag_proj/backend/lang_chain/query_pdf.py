@@ -1,24 +1,65 @@
 import os
+import asyncio
+import httpx
+from typing import AsyncGenerator
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.documents import Document
 from langchain_qdrant import QdrantVectorStore
-from qdrant_client.models import Filter, FieldCondition, MatchValue
-from openai import OpenAI
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import QueryRequest
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
 from my_agents.model import PromptOutput
+from lang_chain.vector_store import CONTENT_KEY, METADATA_KEY, VECTOR_BACKEND, committed_filter, search_params
+from lang_chain.query_cache import CachedQueryEmbeddings, get_query_cache
+from lang_chain.embedding_cache import embedding_id, make_embeddings
+from lang_chain.answer_cache import get_answer_cache
+from lang_chain.vector_store import get_store
+from lang_chain.sparse_index import get_sparse_index, is_identifier, tokenize
+from lang_chain.context_packer import CONTEXT_CANDIDATES, pack_context
+from lang_chain.history_compactor import compact_history
+from lang_chain.metrics import record_usage, stage
+from lang_chain.llm_scheduler import BACKGROUND, INTERACTIVE, acomplete, astream, complete
 
 load_dotenv()
 
+VECTOR_DB_URL = os.getenv("VECTOR_DB_URL", "http://localhost:6333")
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "pdf_documents")
+CHAT_MODEL = os.getenv("VECTOR_CHAT_MODEL", "gpt-4o")
 
-embedding = OpenAIEmbeddings(
-    model="text-embedding-ada-002",
+# Connection pool of the async OpenAI client — bounds concurrent LLM/embedding calls per worker
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+# Chunks retrieved per query (QdrantVectorStore.similarity_search default)
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+
+# Hybrid retrieval: dense (Qdrant) and BM25 (lang_chain.sparse_index) candidate
+# lists are fused with reciprocal-rank fusion. Chunks containing every identifier
+# a question names are ranked first (up to EXACT_MATCH_K of them).
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+EXACT_MATCH_K = int(os.getenv("EXACT_MATCH_K", "2"))
+
+# LLM calls in flight per batch query (see aquery_batch)
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "16"))
+
+# Repeated questions reuse their embedding (see lang_chain.query_cache).
+# Model and size come from EMBEDDING_MODEL / EMBEDDING_DIMENSIONS, as for ingestion.
+embedding = CachedQueryEmbeddings(
+    make_embeddings(),
+    model=embedding_id(),
+    cache=get_query_cache(),
 )
 
-client = OpenAI()
+# Retries are left to lang_chain.llm_scheduler, which paces every call
+client = OpenAI(max_retries=0)
 
 # Cached at module level — initialized once on first query
 _vector_db = None
 
+# Async clients for the API routes, created on first use and closed on shutdown
+_async_client: AsyncOpenAI | None = None
+_async_qdrant: AsyncQdrantClient | None = None
+
 def get_vector_db():
     global _vector_db
     if _vector_db is None:
@@ -29,8 +70,242 @@ def get_vector_db():
         )
     return _vector_db
 
-def generate_sys_prompt(retrieved_docs):
+def get_async_client() -> AsyncOpenAI:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                )
+            )
+        )
+    return _async_client
+
+
+def get_async_qdrant() -> AsyncQdrantClient:
+    global _async_qdrant
+    if _async_qdrant is None:
+        _async_qdrant = AsyncQdrantClient(url=VECTOR_DB_URL)
+    return _async_qdrant
+
+
+async def close_async_clients() -> None:
+    """Close the pooled async clients (called on app shutdown)."""
+    global _async_client, _async_qdrant
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _async_qdrant is not None:
+        await _async_qdrant.close()
+        _async_qdrant = None
+
+
+def similarity_search(user_input: str, filename: str | None = None, k: int = RETRIEVAL_K) -> list[Document]:
+    """Dense top-k on the configured VECTOR_BACKEND, optionally restricted to one file."""
+    if VECTOR_BACKEND == "embedded":
+        with stage("vector", "embed_query"):
+            vector = embedding.embed_query(user_input)
+        with stage("vector", "search"):
+            return get_store().search(vector, filename, k)
+    # LangChain embeds the question inside the search call
+    with stage("vector", "search"):
+        return get_vector_db().similarity_search(
+            user_input, k=k, filter=committed_filter(filename), search_params=search_params(),
+            shard_key_selector=get_store().shard_key(filename),
+        )
+
+
+async def asimilarity_search(user_input: str, filename: str | None = None, k: int = RETRIEVAL_K) -> list[Document]:
+    """Async equivalent of QdrantVectorStore.similarity_search over the same payload layout."""
+    with stage("vector", "embed_query"):
+        vector = await embedding.aembed_query(user_input)
+    with stage("vector", "search"):
+        if VECTOR_BACKEND == "embedded":
+            # In-process brute force — run off the event loop
+            return await asyncio.to_thread(get_store().search, vector, filename, k)
+        response = await get_async_qdrant().query_points(
+            collection_name=COLLECTION_NAME,
+            query=vector,
+            query_filter=committed_filter(filename),
+            search_params=search_params(),
+            shard_key_selector=get_store().shard_key(filename),
+            limit=k,
+            with_payload=True,
+        )
+    return _to_documents(response.points)
+
+
+def _to_documents(points) -> list[Document]:
+    return [
+        Document(
+            page_content=point.payload.get(CONTENT_KEY, ""),
+            # "_id" as QdrantVectorStore sets it — hybrid fusion matches dense and BM25 hits by it
+            metadata={**(point.payload.get(METADATA_KEY) or {}), "_id": str(point.id)},
+        )
+        for point in points
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Hybrid retrieval (dense + BM25, reciprocal-rank fusion)
+# ---------------------------------------------------------------------------
+
+def rrf_fuse(
+    query: str,
+    dense: list[Document],
+    sparse: list[tuple[str, float, str, dict]],
+    k: int = RETRIEVAL_K,
+) -> list[Document]:
+    """
+    Fuse dense results and BM25 hits by reciprocal rank (score = sum of 1 / (RRF_K + rank)).
+    If the query names identifiers and some BM25 hits contain all of them, up
+    to EXACT_MATCH_K of those hits lead the list and the fused ranking fills the
+    rest of the `k` places (the answer may sit in a chunk without the identifier).
+    """
+    docs: dict[str, Document] = {}
+    scores: dict[str, float] = {}
+    for rank, doc in enumerate(dense):
+        key = str(doc.metadata.get("_id", id(doc)))
+        docs[key] = doc
+        scores[key] = scores.get(key, 0.0) + 1 / (RRF_K + rank + 1)
+    for rank, (point_id, _, text, metadata) in enumerate(sparse):
+        docs.setdefault(point_id, Document(page_content=text, metadata={**metadata, "_id": point_id}))
+        scores[point_id] = scores.get(point_id, 0.0) + 1 / (RRF_K + rank + 1)
+    fused = sorted(docs, key=lambda key: scores[key], reverse=True)
+
+    identifiers = {token for token in tokenize(query) if is_identifier(token)}
+    if identifiers:
+        exact = {point_id for point_id, _, text, _ in sparse if identifiers <= set(tokenize(text))}
+        leading = [key for key in fused if key in exact][:EXACT_MATCH_K]
+        fused = leading + [key for key in fused if key not in leading]
+    return [docs[key] for key in fused[:k]]
+
+
+def _bm25_search(filename: str, user_input: str, k: int, content_hash: str | None = None) -> list[Document]:
+    """BM25 hits, only from an index of the committed version (`content_hash`, looked up if not given)."""
+    with stage("vector", "bm25"):
+        if content_hash is None:
+            content_hash = get_store().committed_hash(filename)
+        return get_sparse_index().search(filename, user_input, k, content_hash)
+
+
+def _bm25_batch(filename: str, questions: list[str], k: int) -> list[list[Document]]:
+    content_hash = get_store().committed_hash(filename)
+    return [_bm25_search(filename, question, k, content_hash) for question in questions]
+
+
+def hybrid_search(user_input: str, filename: str | None = None, k: int = RETRIEVAL_K) -> list[Document]:
+    """Dense search fused with the file's BM25 index; dense only across all documents."""
+    if not (HYBRID_SEARCH and filename):
+        return similarity_search(user_input, filename, k)
+    dense = similarity_search(user_input, filename, HYBRID_CANDIDATES)
+    sparse = _bm25_search(filename, user_input, HYBRID_CANDIDATES)
+    return rrf_fuse(user_input, dense, sparse, k)
+
+
+async def ahybrid_search(user_input: str, filename: str | None = None, k: int = RETRIEVAL_K) -> list[Document]:
+    """Async hybrid_search: the dense query and the BM25 lookup run concurrently."""
+    if not (HYBRID_SEARCH and filename):
+        return await asimilarity_search(user_input, filename, k)
+    dense, sparse = await asyncio.gather(
+        asimilarity_search(user_input, filename, HYBRID_CANDIDATES),
+        asyncio.to_thread(_bm25_search, filename, user_input, HYBRID_CANDIDATES),
+    )
+    return rrf_fuse(user_input, dense, sparse, k)
+
+
+# ---------------------------------------------------------------------------
+# Context packing (MMR + overlap merge within CONTEXT_TOKEN_BUDGET)
+# ---------------------------------------------------------------------------
+
+def _point_ids(docs: list[Document]) -> list[str]:
+    return [str(doc.metadata["_id"]) for doc in docs if doc.metadata.get("_id") is not None]
+
+
+def retrieve_context(user_input: str, filename: str | None = None) -> list[Document]:
+    """Retrieve CONTEXT_CANDIDATES chunks and pack them into the prompt's token budget."""
+    docs = hybrid_search(user_input, filename, CONTEXT_CANDIDATES)
+    return pack_context(docs, get_store().vectors(_point_ids(docs)))
+
+
+async def _avectors(ids: list[str]) -> dict[str, list[float]]:
+    """Async get_store().vectors — the stored embeddings MMR compares candidates by."""
+    if not ids:
+        return {}
+    if VECTOR_BACKEND == "embedded":
+        return await asyncio.to_thread(get_store().vectors, ids)
+    points = await get_async_qdrant().retrieve(
+        collection_name=COLLECTION_NAME, ids=ids, with_payload=False, with_vectors=True
+    )
+    return {str(point.id): point.vector for point in points}
+
+
+async def aretrieve_context(user_input: str, filename: str | None = None) -> list[Document]:
+    """Async retrieve_context."""
+    docs = await ahybrid_search(user_input, filename, CONTEXT_CANDIDATES)
+    return pack_context(docs, await _avectors(_point_ids(docs)))
+
+
+# ---------------------------------------------------------------------------
+# Semantic answer cache (first turns only — answers with history depend on it)
+# ---------------------------------------------------------------------------
+
+async def _acommitted_hash(filename: str) -> str | None:
+    """Async QdrantStore.committed_hash: the content hash answers for `filename` are cached under."""
+    if VECTOR_BACKEND == "embedded":
+        return await asyncio.to_thread(get_store().committed_hash, filename)
+    qdrant = get_async_qdrant()
+    if not await qdrant.collection_exists(COLLECTION_NAME):
+        return None
+    points, _ = await qdrant.scroll(
+        collection_name=COLLECTION_NAME,
+        scroll_filter=committed_filter(filename),
+        shard_key_selector=get_store().shard_key(filename),
+        with_payload=[f"{METADATA_KEY}.content_hash"],
+        with_vectors=False,
+        limit=1,
+    )
+    return (points[0].payload.get(METADATA_KEY) or {}).get("content_hash") if points else None
+
+
+def _lookup_answer(user_input: str, filename: str) -> tuple[dict | None, str | None, list[float] | None]:
+    """Returns (cached_answer, content_hash, query_vector); the last two are needed to store a miss."""
+    content_hash = get_store().committed_hash(filename)
+    if content_hash is None:
+        return None, None, None
+    with stage("vector", "embed_query"):
+        vector = embedding.embed_query(user_input)
+    return get_answer_cache().lookup(filename, content_hash, vector), content_hash, vector
+
+
+async def _alookup_answer(user_input: str, filename: str) -> tuple[dict | None, str | None, list[float] | None]:
+    content_hash = await _acommitted_hash(filename)
+    if content_hash is None:
+        return None, None, None
+    with stage("vector", "embed_query"):
+        vector = await embedding.aembed_query(user_input)
+    return get_answer_cache().lookup(filename, content_hash, vector), content_hash, vector
+
+
+def _store_answer(filename: str, content_hash: str | None, vector: list[float] | None, answer: dict) -> None:
+    if content_hash is not None:
+        get_answer_cache().store(filename, content_hash, vector, answer)
+
+
+def _append_turn(user_input: str, history: list[dict], reply: str) -> list[dict]:
+    return history + [
+        {"role": "user", "content": user_input},
+        {"role": "assistant", "content": reply}
+    ]
+
+
+def generate_sys_prompt(retrieved_docs, json_output: bool = True):
     context = "\n\n".join(doc.page_content for doc in retrieved_docs)
+    # Streamed answers are shown token by token, so they are requested as plain text
+    output_format = "Provide your response in the required JSON format." if json_output else "Respond in plain text."
     system_prompt = f"""
         You are an expert AI Assistant who helps users analyse PDF documents.
         Answer the user's query based only on the relevant context retrieved from the document below.
@@ -39,22 +314,21 @@ def generate_sys_prompt(retrieved_docs):
         {context}
         </context>
 
-        Provide your response in the required JSON format.
+        {output_format}
     """
     return system_prompt
 
 def query_file(user_input, filename: str = None):
-    vector_db = get_vector_db()
-
-    # If a filename is provided, filter chunks to only that document
-    search_filter = None
+    cached = content_hash = vector = None
     if filename:
-        search_filter = Filter(
-            must=[FieldCondition(key="metadata.filename", match=MatchValue(value=filename))]
-        )
+        cached, content_hash, vector = _lookup_answer(user_input, filename)
+        if cached:
+            print(f"Answer cache hit for '{filename}'")
+            return dict(cached)
 
-    vector_docs_db = vector_db.similarity_search(user_input, filter=search_filter)
-    print(f"Retrieved {len(vector_docs_db)} chunks" + (f" from '{filename}'" if filename else " across all documents"))
+    # If a filename is provided, search only that document (dense + BM25), then pack
+    vector_docs_db = retrieve_context(user_input, filename)
+    print(f"Packed {len(vector_docs_db)} passages" + (f" from '{filename}'" if filename else " across all documents"))
 
     message_chat = [
         {
@@ -66,16 +340,22 @@ def query_file(user_input, filename: str = None):
             "content": user_input
         }
     ]
-    response = client.chat.completions.parse(
-        model="gpt-4o",
-        response_format=PromptOutput,
-        messages=message_chat
-    )
+    with stage("vector", "llm"):
+        response = complete(
+            client.chat.completions.parse,
+            model=CHAT_MODEL,
+            response_format=PromptOutput,
+            messages=message_chat
+        )
+    record_usage("vector", "llm", response.usage)
     msg_resp = response.choices[0].message.parsed
-    return {
+    answer = {
         "step": msg_resp.step,
         "content": msg_resp.content
     }
+    if filename:
+        _store_answer(filename, content_hash, vector, answer)
+    return answer
 
 
 def chat_with_file(user_input: str, filename: str, history: list[dict]) -> tuple[str, list[dict]]:
@@ -90,33 +370,247 @@ def chat_with_file(user_input: str, filename: str, history: list[dict]) -> tuple
     Returns:
         (assistant_reply, updated_history)
     """
-    vector_db = get_vector_db()
+    cached = content_hash = vector = None
+    if not history:
+        cached, content_hash, vector = _lookup_answer(user_input, filename)
+        if cached:
+            print(f"Answer cache hit for '{filename}'")
+            reply = cached["content"] or ""
+            return reply, _append_turn(user_input, history, reply)
 
-    search_filter = Filter(
-        must=[FieldCondition(key="metadata.filename", match=MatchValue(value=filename))]
-    )
-    retrieved_docs = vector_db.similarity_search(user_input, filter=search_filter)
-    print(f"Retrieved {len(retrieved_docs)} chunks from '{filename}'")
+    retrieved_docs = retrieve_context(user_input, filename)
+    print(f"Packed {len(retrieved_docs)} passages from '{filename}'")
 
-    # Build message list: system prompt + full conversation history + latest user message
+    # Build message list: system prompt + compacted conversation history + latest user message
     messages = [{"role": "system", "content": generate_sys_prompt(retrieved_docs)}]
-    messages.extend(history)
+    messages.extend(compact_history(history))
     messages.append({"role": "user", "content": user_input})
 
-    response = client.chat.completions.parse(
-        model="gpt-4o",
-        response_format=PromptOutput,
-        messages=messages
-    )
+    with stage("vector", "llm"):
+        response = complete(
+            client.chat.completions.parse,
+            model=CHAT_MODEL,
+            response_format=PromptOutput,
+            messages=messages
+        )
+    record_usage("vector", "llm", response.usage)
     msg_resp = response.choices[0].message.parsed
     reply = msg_resp.content or ""
+    if not history:
+        _store_answer(filename, content_hash, vector, {"step": msg_resp.step, "content": msg_resp.content})
 
     # Append this turn to history and return it
-    updated_history = history + [
-        {"role": "user", "content": user_input},
-        {"role": "assistant", "content": reply}
-    ]
-    return reply, updated_history
+    return reply, _append_turn(user_input, history, reply)
+
+
+# ---------------------------------------------------------------------------
+# Async path — used by the API routes so a slow LLM call never blocks the event loop
+# ---------------------------------------------------------------------------
+
+async def aquery_file(user_input: str, filename: str = None) -> dict:
+    """Async version of query_file."""
+    cached = content_hash = vector = None
+    if filename:
+        cached, content_hash, vector = await _alookup_answer(user_input, filename)
+        if cached:
+            print(f"Answer cache hit for '{filename}'")
+            return dict(cached)
+
+    retrieved_docs = await aretrieve_context(user_input, filename)
+    print(f"Packed {len(retrieved_docs)} passages" + (f" from '{filename}'" if filename else " across all documents"))
+
+    answer = await _aanswer(user_input, retrieved_docs)
+    if filename:
+        _store_answer(filename, content_hash, vector, answer)
+    return answer
+
+
+async def _aanswer(user_input: str, retrieved_docs: list[Document], priority: int = INTERACTIVE) -> dict:
+    """Single-turn structured answer from the retrieved context."""
+    with stage("vector", "llm"):
+        response = await acomplete(
+            get_async_client().chat.completions.parse,
+            priority,
+            model=CHAT_MODEL,
+            response_format=PromptOutput,
+            messages=[
+                {"role": "system", "content": generate_sys_prompt(retrieved_docs)},
+                {"role": "user", "content": user_input},
+            ],
+        )
+    record_usage("vector", "llm", response.usage)
+    msg_resp = response.choices[0].message.parsed
+    return {
+        "step": msg_resp.step,
+        "content": msg_resp.content
+    }
+
+
+async def achat_with_file(user_input: str, filename: str, history: list[dict]) -> tuple[str, list[dict]]:
+    """Async version of chat_with_file. Returns (assistant_reply, updated_history)."""
+    cached = content_hash = vector = None
+    if not history:
+        cached, content_hash, vector = await _alookup_answer(user_input, filename)
+        if cached:
+            print(f"Answer cache hit for '{filename}'")
+            reply = cached["content"] or ""
+            return reply, _append_turn(user_input, history, reply)
+
+    retrieved_docs = await aretrieve_context(user_input, filename)
+    print(f"Packed {len(retrieved_docs)} passages from '{filename}'")
+
+    messages = [{"role": "system", "content": generate_sys_prompt(retrieved_docs)}]
+    messages.extend(compact_history(history))
+    messages.append({"role": "user", "content": user_input})
+
+    with stage("vector", "llm"):
+        response = await acomplete(
+            get_async_client().chat.completions.parse,
+            model=CHAT_MODEL,
+            response_format=PromptOutput,
+            messages=messages
+        )
+    record_usage("vector", "llm", response.usage)
+    msg_resp = response.choices[0].message.parsed
+    reply = msg_resp.content or ""
+    if not history:
+        _store_answer(filename, content_hash, vector, {"step": msg_resp.step, "content": msg_resp.content})
+
+    return reply, _append_turn(user_input, history, reply)
+
+
+async def astream_chat_with_file(user_input: str, filename: str, history: list[dict]) -> AsyncGenerator[str, None]:
+    """
+    Streaming variant of achat_with_file: yields answer text as the LLM produces it.
+    History is left untouched — the caller commits the turn once the stream completes.
+    Closing the generator early aborts the upstream completion.
+    """
+    content_hash = vector = None
+    if not history:
+        cached, content_hash, vector = await _alookup_answer(user_input, filename)
+        if cached:
+            print(f"Answer cache hit for '{filename}'")
+            yield cached["content"] or ""
+            return
+
+    retrieved_docs = await aretrieve_context(user_input, filename)
+    print(f"Packed {len(retrieved_docs)} passages from '{filename}'")
+
+    messages = [{"role": "system", "content": generate_sys_prompt(retrieved_docs, json_output=False)}]
+    messages.extend(compact_history(history))
+    messages.append({"role": "user", "content": user_input})
+
+    parts = []
+    # Timed from the request to the last token; the final chunk carries the token usage
+    with stage("vector", "llm"):
+        async with astream(
+            get_async_client().chat.completions.create,
+            model=CHAT_MODEL,
+            messages=messages,
+            stream_options={"include_usage": True},
+        ) as stream:
+            async for event in stream:
+                record_usage("vector", "llm", event.usage)
+                delta = event.choices[0].delta.content if event.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+    if not history:
+        _store_answer(filename, content_hash, vector, {"step": "answer", "content": "".join(parts)})
+
+
+# ---------------------------------------------------------------------------
+# Batch queries — many questions, one embedding request, one vector search
+# ---------------------------------------------------------------------------
+
+async def abatch_similarity_search(vectors: list[list[float]], filename: str | None, k: int) -> list[list[Document]]:
+    """Dense top-k for several query vectors in a single Qdrant request."""
+    if VECTOR_BACKEND == "embedded":
+        with stage("vector", "search"):
+            return await asyncio.to_thread(lambda: [get_store().search(vector, filename, k) for vector in vectors])
+    shard = get_store().shard_key(filename)
+    with stage("vector", "search"):
+        responses = await get_async_qdrant().query_batch_points(
+            collection_name=COLLECTION_NAME,
+            requests=[
+                QueryRequest(
+                    query=vector,
+                    filter=committed_filter(filename),
+                    params=search_params(),
+                    shard_key=shard,
+                    limit=k,
+                    with_payload=True,
+                )
+                for vector in vectors
+            ],
+        )
+    return [_to_documents(response.points) for response in responses]
+
+
+async def _abatch_contexts(questions: list[str], vectors: list[list[float]], filename: str | None) -> list[list[Document]]:
+    """aretrieve_context for many questions: batched dense search, BM25 in one thread hop, one vector fetch."""
+    if HYBRID_SEARCH and filename:
+        dense, sparse = await asyncio.gather(
+            abatch_similarity_search(vectors, filename, HYBRID_CANDIDATES),
+            asyncio.to_thread(_bm25_batch, filename, questions, HYBRID_CANDIDATES),
+        )
+        candidates = [rrf_fuse(q, d, s, CONTEXT_CANDIDATES) for q, d, s in zip(questions, dense, sparse)]
+    else:
+        candidates = await abatch_similarity_search(vectors, filename, CONTEXT_CANDIDATES)
+    stored = await _avectors(list(dict.fromkeys(pid for docs in candidates for pid in _point_ids(docs))))
+    return [pack_context(docs, stored) for docs in candidates]
+
+
+async def aquery_batch(
+    questions: list[str],
+    filename: str | None = None,
+    concurrency: int = BATCH_LLM_CONCURRENCY,
+) -> AsyncGenerator[dict, None]:
+    """
+    Answer many questions about one document (or all documents). Questions are
+    embedded in one request and searched in one batch; cached answers are
+    yielded first, then LLM answers with at most `concurrency` calls in flight.
+    Yields {"index", "question", "step", "content", "cached"} — or "error" —
+    per question, in completion order. Closing the generator cancels the rest.
+    """
+    with stage("vector", "embed_query"):
+        vectors = await embedding.aembed_queries(questions)
+    content_hash = await _acommitted_hash(filename) if filename else None
+
+    pending = []
+    for index, (question, vector) in enumerate(zip(questions, vectors)):
+        cached = get_answer_cache().lookup(filename, content_hash, vector) if content_hash else None
+        if cached:
+            yield {"index": index, "question": question, **cached, "cached": True}
+        else:
+            pending.append(index)
+    if not pending:
+        return
+
+    contexts = await _abatch_contexts([questions[i] for i in pending], [vectors[i] for i in pending], filename)
+    print(f"Batch of {len(questions)} questions: {len(questions) - len(pending)} cached, {len(pending)} to answer")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(index: int, retrieved_docs: list[Document]) -> dict:
+        async with semaphore:
+            try:
+                # Queued behind interactive chat in the LLM scheduler
+                result = await _aanswer(questions[index], retrieved_docs, BACKGROUND)
+            except Exception as e:
+                return {"index": index, "question": questions[index], "error": str(e)}
+        if filename:
+            _store_answer(filename, content_hash, vectors[index], result)
+        return {"index": index, "question": questions[index], **result, "cached": False}
+
+    tasks = [asyncio.create_task(answer(index, docs)) for index, docs in zip(pending, contexts)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
 if __name__ == "__main__":
     while True:
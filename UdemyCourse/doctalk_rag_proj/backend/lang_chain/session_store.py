@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Chat sessions of both engines: {filename, job_id, history}. Sessions expire
+# after SESSION_TTL_SECONDS without use. Turns are appended as deltas — a new
+# message never rewrites the stored history.
+#
+#   SESSION_BACKEND=memory  per-process dict with TTL + LRU bound (default; one worker only)
+#   SESSION_BACKEND=sqlite  SQLite file shared by every worker on the host
+#   SESSION_BACKEND=redis   any Redis-protocol server at SESSION_REDIS_URL;
+#                           "local://" uses an in-process stand-in (tests, single worker)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite3")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+# Expired SQLite sessions are purged on every Nth create
+_PURGE_EVERY = 100
+# A read refreshes a SQLite session's TTL at most this often (or every tenth of
+# the TTL, if shorter), so reads rarely take the write lock
+_TOUCH_INTERVAL_SECONDS = 60
+
+
+class MemorySessionStore:
+    """Thread-safe in-process sessions, evicted when idle past the TTL or beyond `max_entries` (LRU)."""
+
+    def __init__(self, namespace: str, ttl_seconds: int = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._sessions: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, session_id: str) -> dict | None:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.monotonic() - session["touched"] > self.ttl_seconds:
+            del self._sessions[session_id]
+            self.evictions += 1
+            return None
+        session["touched"] = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def create(self, session_id: str, fields: dict) -> None:
+        with self._lock:
+            self._sessions[session_id] = {"fields": dict(fields), "history": [], "touched": time.monotonic()}
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, session_id: str) -> dict | None:
+        with self._lock:
+            session = self._live(session_id)
+            return {**session["fields"], "history": list(session["history"])} if session else None
+
+    def append(self, session_id: str, messages: list[dict]) -> bool:
+        with self._lock:
+            session = self._live(session_id)
+            if session is None:
+                return False
+            session["history"].extend(messages)
+            return True
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions), "evictions": self.evictions}
+
+
+class SQLiteSessionStore:
+    """Sessions in a SQLite file (WAL), safe to share between worker processes on one host."""
+
+    def __init__(self, namespace: str, path: str = SESSION_DB_PATH, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.namespace = namespace
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._touch_after = min(_TOUCH_INTERVAL_SECONDS, ttl_seconds / 10)
+        self._local = threading.local()
+        self._creates = 0
+        self._conn().executescript(
+            "CREATE TABLE IF NOT EXISTS sessions (namespace TEXT NOT NULL, id TEXT NOT NULL, fields TEXT NOT NULL,"
+            " touched REAL NOT NULL, PRIMARY KEY (namespace, id));"
+            "CREATE TABLE IF NOT EXISTS messages (namespace TEXT NOT NULL, session_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL, message TEXT NOT NULL, PRIMARY KEY (namespace, session_id, seq)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS sessions_by_touched ON sessions (touched);"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _touch(self, conn: sqlite3.Connection, session_id: str) -> str | None:
+        """Refresh a live session's TTL and return its fields JSON; drop it if expired."""
+        now = time.time()
+        row = conn.execute(
+            "SELECT fields, touched FROM sessions WHERE namespace = ? AND id = ?", (self.namespace, session_id)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl_seconds:
+            self._delete(conn, session_id)
+            return None
+        conn.execute("UPDATE sessions SET touched = ? WHERE namespace = ? AND id = ?", (now, self.namespace, session_id))
+        return row[0]
+
+    def _delete(self, conn: sqlite3.Connection, session_id: str) -> int:
+        conn.execute("DELETE FROM messages WHERE namespace = ? AND session_id = ?", (self.namespace, session_id))
+        return conn.execute("DELETE FROM sessions WHERE namespace = ? AND id = ?", (self.namespace, session_id)).rowcount
+
+    def _purge_expired(self, conn: sqlite3.Connection) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        conn.execute(
+            "DELETE FROM messages WHERE namespace = ? AND session_id IN"
+            " (SELECT id FROM sessions WHERE namespace = ? AND touched < ?)",
+            (self.namespace, self.namespace, cutoff),
+        )
+        conn.execute("DELETE FROM sessions WHERE namespace = ? AND touched < ?", (self.namespace, cutoff))
+
+    def create(self, session_id: str, fields: dict) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (self.namespace, session_id, json.dumps(fields), time.time()),
+            )
+            self._creates += 1
+            if self._creates % _PURGE_EVERY == 0:
+                self._purge_expired(conn)
+
+    def get(self, session_id: str) -> dict | None:
+        conn = self._conn()
+        # Deferred read transaction: a consistent snapshot without the write lock
+        with conn:
+            conn.execute("BEGIN")
+            row = conn.execute(
+                "SELECT fields, touched FROM sessions WHERE namespace = ? AND id = ?", (self.namespace, session_id)
+            ).fetchone()
+            if row is None or time.time() - row[1] > self.ttl_seconds:
+                return None   # expired rows are removed by the periodic purge
+            rows = conn.execute(
+                "SELECT message FROM messages WHERE namespace = ? AND session_id = ? ORDER BY seq",
+                (self.namespace, session_id),
+            ).fetchall()
+        if time.time() - row[1] > self._touch_after:
+            conn.execute(
+                "UPDATE sessions SET touched = ? WHERE namespace = ? AND id = ?", (time.time(), self.namespace, session_id)
+            )
+        return {**json.loads(row[0]), "history": [json.loads(r[0]) for r in rows]}
+
+    def append(self, session_id: str, messages: list[dict]) -> bool:
+        conn = self._conn()
+        with conn:
+            # IMMEDIATE takes the write lock up front, so concurrent appends from
+            # several workers get consecutive sequence numbers
+            conn.execute("BEGIN IMMEDIATE")
+            if self._touch(conn, session_id) is None:
+                return False
+            start = conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE namespace = ? AND session_id = ?",
+                (self.namespace, session_id),
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?)",
+                [(self.namespace, session_id, start + i, json.dumps(m)) for i, m in enumerate(messages)],
+            )
+        return True
+
+    def delete(self, session_id: str) -> bool:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return self._delete(conn, session_id) > 0
+
+    def stats(self) -> dict:
+        count = self._conn().execute(
+            "SELECT COUNT(*) FROM sessions WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        return {"backend": "sqlite", "sessions": count, "path": self.path}
+
+
+class LocalRedis:
+    """
+    In-process stand-in for the handful of Redis commands RedisSessionStore
+    uses (HSET/HGETALL, RPUSH/LRANGE, EXPIRE, EXISTS, DEL, pipelines and
+    WATCH/MULTI transactions).
+    """
+
+    def __init__(self):
+        self._data: dict[str, object] = {}
+        self._expires: dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name: str):
+        expires = self._expires.get(name)
+        if expires is not None and time.monotonic() >= expires:
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        return self._data.get(name)
+
+    def hset(self, name: str, mapping: dict) -> int:
+        with self._lock:
+            current = self._get(name)
+            if current is None:
+                current = self._data[name] = {}
+            current.update({k: str(v) for k, v in mapping.items()})
+            return len(mapping)
+
+    def hgetall(self, name: str) -> dict:
+        with self._lock:
+            return dict(self._get(name) or {})
+
+    def rpush(self, name: str, *values: str) -> int:
+        with self._lock:
+            current = self._get(name)
+            if current is None:
+                current = self._data[name] = []
+            current.extend(values)
+            return len(current)
+
+    def lrange(self, name: str, start: int, end: int) -> list:
+        with self._lock:
+            current = self._get(name) or []
+            return list(current[start:] if end == -1 else current[start:end + 1])
+
+    def expire(self, name: str, seconds: int) -> bool:
+        with self._lock:
+            if self._get(name) is None:
+                return False
+            self._expires[name] = time.monotonic() + seconds
+            return True
+
+    def exists(self, *names: str) -> int:
+        with self._lock:
+            return sum(self._get(name) is not None for name in names)
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            removed = 0
+            for name in names:
+                removed += self._get(name) is not None
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return removed
+
+    def pipeline(self) -> "_LocalPipeline":
+        return _LocalPipeline(self)
+
+    def transaction(self, func, *watches: str, value_from_callable: bool = False):
+        """redis-py's transaction(): holding the lock throughout stands in for WATCH."""
+        with self._lock:
+            pipe = _LocalPipeline(self, buffered=False)
+            value = func(pipe)
+            result = pipe.execute()
+        return value if value_from_callable else result
+
+
+class _LocalPipeline:
+    def __init__(self, redis: LocalRedis, buffered: bool = True):
+        self._redis = redis
+        self._calls = []
+        self._buffered = buffered
+
+    def multi(self) -> None:
+        self._buffered = True
+
+    def __getattr__(self, command: str):
+        if not self._buffered:
+            # Between WATCH and MULTI commands run immediately
+            return getattr(self._redis, command)
+
+        def queue(*args, **kwargs):
+            self._calls.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self) -> list:
+        with self._redis._lock:
+            return [getattr(self._redis, command)(*args, **kwargs) for command, args, kwargs in self._calls]
+
+
+def _redis_client(url: str):
+    if url.startswith("local://"):
+        return LocalRedis()
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("redis is required for SESSION_BACKEND=redis. Add it to requirements.txt.")
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+class RedisSessionStore:
+    """
+    Sessions on a Redis-protocol server: a hash of fields plus a list of JSON
+    messages per session, both expiring SESSION_TTL_SECONDS after last use.
+    """
+
+    def __init__(self, namespace: str, url: str = SESSION_REDIS_URL, ttl_seconds: int = SESSION_TTL_SECONDS, client=None):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.redis = client if client is not None else _redis_client(url)
+
+    def _keys(self, session_id: str) -> tuple[str, str]:
+        base = f"doctalk:session:{self.namespace}:{session_id}"
+        return base, f"{base}:history"
+
+    def create(self, session_id: str, fields: dict) -> None:
+        meta, history = self._keys(session_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(meta, history)
+        pipe.hset(meta, mapping={"fields": json.dumps(fields)})
+        pipe.expire(meta, self.ttl_seconds)
+        pipe.execute()
+
+    def get(self, session_id: str) -> dict | None:
+        meta, history = self._keys(session_id)
+        pipe = self.redis.pipeline()
+        pipe.hgetall(meta)
+        pipe.lrange(history, 0, -1)
+        pipe.expire(meta, self.ttl_seconds)
+        pipe.expire(history, self.ttl_seconds)
+        stored, messages, _, _ = pipe.execute()
+        if not stored:
+            return None
+        return {**json.loads(stored["fields"]), "history": [json.loads(m) for m in messages]}
+
+    def append(self, session_id: str, messages: list[dict]) -> bool:
+        meta, history = self._keys(session_id)
+        encoded = [json.dumps(m) for m in messages]
+
+        def _append(pipe) -> bool:
+            # meta is WATCHed: if the session is deleted or expires before EXEC,
+            # the transaction aborts and is retried, so no orphan history is left
+            if not pipe.exists(meta):
+                return False
+            pipe.multi()
+            pipe.rpush(history, *encoded)
+            pipe.expire(meta, self.ttl_seconds)
+            pipe.expire(history, self.ttl_seconds)
+            return True
+
+        return self.redis.transaction(_append, meta, value_from_callable=True)
+
+    def delete(self, session_id: str) -> bool:
+        return self.redis.delete(*self._keys(session_id)) > 0
+
+    def stats(self) -> dict:
+        return {"backend": "redis"}
+
+
+_stores: dict[str, object] = {}
+_stores_lock = threading.Lock()
+_local_redis: LocalRedis | None = None
+
+
+def get_session_store(namespace: str):
+    """The session store of one router ("chat", "pageindex"), backed by SESSION_BACKEND."""
+    global _local_redis
+    with _stores_lock:
+        store = _stores.get(namespace)
+        if store is None:
+            if SESSION_BACKEND == "sqlite":
+                store = SQLiteSessionStore(namespace)
+            elif SESSION_BACKEND == "redis":
+                client = None
+                if SESSION_REDIS_URL.startswith("local://"):
+                    # One stand-in per process, shared by every namespace
+                    _local_redis = _local_redis or LocalRedis()
+                    client = _local_redis
+                store = RedisSessionStore(namespace, client=client)
+            elif SESSION_BACKEND == "memory":
+                store = MemorySessionStore(namespace)
+            else:
+                raise ValueError(f"Unknown SESSION_BACKEND '{SESSION_BACKEND}' (memory, sqlite or redis)")
+            _stores[namespace] = store
+    return store
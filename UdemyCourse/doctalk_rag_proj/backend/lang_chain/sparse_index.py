@@ -0,0 +1,223 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+from typing import Iterable
+
+# Local BM25 index per file, so exact identifiers (invoice numbers, GSTINs)
+# that dense embeddings blur together are still found. Each file's index is a
+# small SQLite database built from a new version's points before that version
+# is committed and swapped in right after. Each index records the content_hash
+# it was built from; searches ignore an index that is not of the committed version.
+SPARSE_INDEX_DIR = os.getenv("SPARSE_INDEX_DIR", "sparse_index")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Query terms found in more than this share of chunks carry ~zero IDF but cost a
+# full posting-list scan ("invoice" in an invoice file) — they are skipped.
+BM25_MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", "0.5"))
+
+# Identifiers keep their inner hyphens/slashes ("inv-4821") and are also indexed by part
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+_SQL_BATCH = 500
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def is_identifier(token: str) -> bool:
+    """Tokens mixing letters and digits, or long numbers — the ones dense search misses."""
+    has_digit = any(c.isdigit() for c in token)
+    return has_digit and (len(token) >= 5 or any(c.isalpha() for c in token))
+
+
+def _index_path(root: str, filename: str) -> str:
+    # Hashed so any filename maps to a safe, fixed-length path
+    digest = hashlib.sha256(filename.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(root, f"{digest}.sqlite3")
+
+
+class SparseIndex:
+    """Per-file BM25 inverted indexes stored as SQLite files under SPARSE_INDEX_DIR."""
+
+    def __init__(self, root: str = SPARSE_INDEX_DIR):
+        self.root = root
+        self._local = threading.local()   # sqlite connections are per thread
+
+    def _path(self, filename: str) -> str:
+        return _index_path(self.root, filename)
+
+    def rebuild(self, filename: str, points: Iterable[tuple[str, str, dict]], content_hash: str | None) -> int:
+        """
+        Replace the index of `filename` with one built from (point_id, text,
+        metadata) tuples of version `content_hash`. Readers see the old or the
+        new index, never a partial one. Returns the number of indexed chunks.
+        """
+        staged, count = self.build(filename, points, content_hash)
+        self.install(filename, staged)
+        return count
+
+    def build(self, filename: str, points: Iterable[tuple[str, str, dict]], content_hash: str | None) -> tuple[str, int]:
+        """
+        Write an index of `filename` to a temp file without making it visible.
+        Returns (temp path, number of indexed chunks); pass the path to
+        install() or discard().
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(filename)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript(
+                "PRAGMA journal_mode=OFF;"
+                "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+                "CREATE TABLE chunks (point_id TEXT PRIMARY KEY, length INTEGER NOT NULL,"
+                " page_content TEXT NOT NULL, metadata TEXT NOT NULL);"
+                "CREATE TABLE postings (term TEXT NOT NULL, point_id TEXT NOT NULL, tf INTEGER NOT NULL,"
+                " PRIMARY KEY (term, point_id)) WITHOUT ROWID;"
+            )
+            df: Counter = Counter()
+            total_length = 0
+            count = 0
+            chunk_rows, posting_rows = [], []
+            for point_id, text, metadata in points:
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                total_length += length
+                count += 1
+                df.update(terms.keys())
+                chunk_rows.append((point_id, length, text, json.dumps(metadata)))
+                posting_rows.extend((term, point_id, tf) for term, tf in terms.items())
+                if len(chunk_rows) >= _SQL_BATCH:
+                    conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", chunk_rows)
+                    conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", posting_rows)
+                    chunk_rows, posting_rows = [], []
+            conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", chunk_rows)
+            conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", posting_rows)
+            conn.execute("CREATE TABLE terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID")
+            conn.executemany("INSERT INTO terms VALUES (?, ?)", df.items())
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("filename", filename),
+                ("content_hash", content_hash or ""),
+                ("chunks", str(count)),
+                ("avg_length", str(total_length / count if count else 0.0)),
+            ])
+            conn.commit()
+        except BaseException:
+            conn.close()
+            self.discard(tmp_path)
+            raise
+        conn.close()
+        print(f"Sparse index for '{filename}' built ({count} chunks, {len(df)} terms).")
+        return tmp_path, count
+
+    def install(self, filename: str, staged: str) -> None:
+        """Atomically swap a built index in as the index of `filename`."""
+        os.replace(staged, self._path(filename))
+
+    def discard(self, staged: str) -> None:
+        if os.path.exists(staged):
+            os.remove(staged)
+
+    def content_hash(self, filename: str) -> str | None:
+        """content_hash the index of `filename` was built from; None without an index (or a hash)."""
+        path = self._path(filename)
+        if not os.path.exists(path):
+            return None
+        row = self._connect(path).execute("SELECT value FROM meta WHERE key = 'content_hash'").fetchone()
+        return (row[0] or None) if row else None
+
+    def delete(self, filename: str) -> None:
+        path = self._path(filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        # Reopen when the file was swapped by a rebuild (inode changes on os.replace)
+        cache = getattr(self._local, "conns", None)
+        if cache is None:
+            cache = self._local.conns = {}
+        inode = os.stat(path).st_ino
+        cached = cache.get(path)
+        if cached and cached[0] == inode:
+            return cached[1]
+        if cached:
+            cached[1].close()
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        cache[path] = (inode, conn)
+        return conn
+
+    def search(self, filename: str, query: str, k: int = 20, content_hash: str | None = None) -> list[tuple[str, float, str, dict]]:
+        """
+        Top-k chunks of `filename` by BM25 as (point_id, score, page_content, metadata).
+        Nothing is found when the index was not built from version `content_hash`
+        (the committed one), so a stale index never feeds old chunks to a prompt.
+        """
+        path = self._path(filename)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not content_hash or not os.path.exists(path):
+            return []
+        conn = self._connect(path)
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get("content_hash") != content_hash:
+            return []
+        n_chunks = int(meta["chunks"])
+        avg_length = float(meta["avg_length"]) or 1.0
+
+        placeholders = ",".join("?" * len(terms))
+        df = dict(conn.execute(f"SELECT term, df FROM terms WHERE term IN ({placeholders})", terms).fetchall())
+        selective = {term: d for term, d in df.items() if d <= n_chunks * BM25_MAX_DF_RATIO}
+        df = selective or df   # a query of only common words still gets ranked
+        if not df:
+            return []
+        idf = {term: math.log(1 + (n_chunks - d + 0.5) / (d + 0.5)) for term, d in df.items()}
+
+        scores: dict[str, float] = {}
+        rows = conn.execute(
+            "SELECT p.term, p.point_id, p.tf, c.length FROM postings p JOIN chunks c USING (point_id)"
+            f" WHERE p.term IN ({','.join('?' * len(df))})",
+            list(df),
+        )
+        for term, point_id, tf, length in rows:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[point_id] = scores.get(point_id, 0.0) + idf[term] * tf * (BM25_K1 + 1) / norm
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        if not top:
+            return []
+        ids = [point_id for point_id, _ in top]
+        stored = {
+            point_id: (text, json.loads(metadata))
+            for point_id, text, metadata in conn.execute(
+                f"SELECT point_id, page_content, metadata FROM chunks WHERE point_id IN ({','.join('?' * len(ids))})",
+                ids,
+            )
+        }
+        return [(point_id, score, *stored[point_id]) for point_id, score in top]
+
+
+_index: SparseIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_sparse_index() -> SparseIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SparseIndex()
+    return _index
@@ -0,0 +1,116 @@
+import os
+import csv
+from typing import BinaryIO, Iterable, Iterator
+from langchain_core.documents import Document
+from lang_chain.text_io import open_text
+from lang_chain.token_chunker import CHUNK_TOKENS, TokenChunker, count_tokens, get_encoder
+
+# Spreadsheets are streamed row by row and emitted as row-group Documents that
+# repeat the header, so a million-row sheet ingests in constant memory and every
+# chunk is self-describing. Groups are sized in tokens to fit one chunk
+# (CHUNK_TOKENS) and are marked `prechunked` so the text splitter never cuts a
+# row in half; a row too long for a chunk on its own is split across several.
+TABLE_MAX_ROWS_PER_CHUNK = int(os.getenv("TABLE_MAX_ROWS_PER_CHUNK", "100"))
+
+_SEP = " | "
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    return str(value).replace("\n", " ").strip()
+
+
+def _row_groups(
+    rows: Iterable[tuple],
+    metadata: dict,
+    max_tokens: int = CHUNK_TOKENS,
+    max_rows: int = TABLE_MAX_ROWS_PER_CHUNK,
+) -> Iterator[Document]:
+    """Turn a row stream (first non-empty row = header) into header-prefixed row groups."""
+    header_line = None
+    header_tokens = 0
+    row_splitter = None
+    group: list[str] = []
+    size = 0
+    first_row = 0
+
+    def _doc(lines: list[str], row_start: int, row_end: int) -> Document:
+        return Document(
+            page_content=header_line + "\n" + "\n".join(lines),
+            metadata={**metadata, "row_start": row_start, "row_end": row_end, "prechunked": True},
+        )
+
+    row_number = 0
+    for raw in rows:
+        cells = [_cell(v) for v in raw]
+        if not any(cells):
+            continue
+        if header_line is None:
+            header_line = _SEP.join(cells)
+            # A header longer than half a chunk is cut, so every chunk keeps room for rows
+            tokens = get_encoder().encode_ordinary(header_line)
+            if len(tokens) > max_tokens // 2:
+                header_line = get_encoder().decode_bytes(tokens[:max_tokens // 2 - 2]).decode("utf-8", errors="ignore") + " …"
+            header_tokens = count_tokens(header_line) + 1
+            continue
+
+        row_number += 1
+        line = _SEP.join(cells)
+        # +1 for the newline joining it to the group
+        line_tokens = count_tokens(line) + 1
+        if group and (size + line_tokens > max_tokens - header_tokens or len(group) >= max_rows):
+            yield _doc(group, first_row, first_row + len(group) - 1)
+            group, size = [], 0
+        if line_tokens > max_tokens - header_tokens:
+            if row_splitter is None:
+                row_splitter = TokenChunker(chunk_size=max_tokens - header_tokens, chunk_overlap=0)
+            for piece in row_splitter.split_text(line):
+                yield _doc([piece], row_number, row_number)
+            continue
+        if not group:
+            first_row = row_number
+        group.append(line)
+        size += line_tokens
+
+    if group:
+        yield _doc(group, first_row, first_row + len(group) - 1)
+    elif header_line is not None and row_number == 0:
+        # Header-only sheet: still index the column names
+        yield Document(page_content=header_line, metadata={**metadata, "row_start": 0, "row_end": 0, "prechunked": True})
+
+
+def iter_xlsx(source: str | BinaryIO, name: str) -> Iterator[Document]:
+    """Stream every sheet of an .xlsx workbook with openpyxl read-only mode."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("openpyxl is required for Excel files. Add it to requirements.txt.")
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield from _row_groups(sheet.iter_rows(values_only=True), {"source": name, "sheet": sheet.title})
+    finally:
+        workbook.close()
+
+
+def iter_xls(source: str | BinaryIO, name: str) -> Iterator[Document]:
+    """
+    Legacy .xls has no streaming reader; each sheet is parsed with pandas
+    (one sheet in memory at a time) and emitted as the same row groups.
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        raise RuntimeError("pandas and xlrd are required for .xls files. Add them to requirements.txt.")
+    xl = pd.ExcelFile(source)
+    for sheet_name in xl.sheet_names:
+        df = xl.parse(sheet_name, header=None).fillna("")
+        yield from _row_groups(df.itertuples(index=False, name=None), {"source": name, "sheet": sheet_name})
+        del df
+
+
+def iter_csv(source: str | BinaryIO, name: str) -> Iterator[Document]:
+    """Stream a CSV with the csv module — one row in memory at a time."""
+    with open_text(source, errors="replace") as f:
+        yield from _row_groups(csv.reader(f), {"source": name})
@@ -0,0 +1,19 @@
+import io
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, TextIO
+
+
+@contextmanager
+def open_text(source: str | BinaryIO, errors: str = "strict") -> Iterator[TextIO]:
+    """Open a path, or wrap a binary file object, as UTF-8 text without closing the caller's file."""
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8", errors=errors, newline="") as f:
+            yield f
+        return
+    wrapper = io.TextIOWrapper(source, encoding="utf-8", errors=errors, newline="")
+    try:
+        yield wrapper
+    finally:
+        # Detaching needs an open file; one the caller already closed needs no protection
+        if not source.closed:
+            wrapper.detach()
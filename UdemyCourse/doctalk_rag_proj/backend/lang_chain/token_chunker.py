@@ -0,0 +1,103 @@
+import os
+from functools import lru_cache
+from typing import Iterable
+from langchain_core.documents import Document
+
+# Chunks are sized in embedding-model tokens rather than characters, so every
+# chunk costs a predictable amount of context at query time. Each page is
+# encoded once; boundaries are placed on token offsets and nudged back to the
+# nearest line or sentence end when one is close, and each chunk is decoded
+# with a single call into tiktoken's Rust core.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")   # tokenizer of text-embedding-ada-002
+
+# How far back (as a fraction of the chunk) to look for a natural break
+_BOUNDARY_LOOKBACK = 0.25
+_SENTENCE_ENDS = (b".", b"?", b"!", b":", b";")
+
+
+@lru_cache(maxsize=None)
+def get_encoder(name: str = CHUNK_ENCODING):
+    """tiktoken encoders load their BPE tables on construction — build each one once per process."""
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+def count_tokens(text: str, encoding: str = CHUNK_ENCODING) -> int:
+    return len(get_encoder(encoding).encode_ordinary(text))
+
+
+def _is_break(token: bytes) -> bool:
+    return b"\n" in token or token.rstrip().endswith(_SENTENCE_ENDS)
+
+
+class TokenChunker:
+    """
+    Drop-in replacement for the character splitter: `split_text` and
+    `split_documents` with chunk_size / chunk_overlap measured in tokens.
+    Each chunk's metadata gets `token_count`.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = CHUNK_TOKENS,
+        chunk_overlap: int = CHUNK_OVERLAP_TOKENS,
+        encoding: str = CHUNK_ENCODING,
+    ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size}).")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoder = get_encoder(encoding)
+        self._break_tokens: dict[int, bool] = {}
+
+    def _is_break(self, token: int) -> bool:
+        # Memoised per token id — common tokens (".", "\n", " the") are checked once per process
+        flag = self._break_tokens.get(token)
+        if flag is None:
+            flag = self._break_tokens[token] = _is_break(self.encoder.decode_single_token_bytes(token))
+        return flag
+
+    def _windows(self, text: str) -> Iterable[tuple[str, int]]:
+        tokens = self.encoder.encode_ordinary(text)
+        total = len(tokens)
+        lookback = max(1, int(self.chunk_size * _BOUNDARY_LOOKBACK))
+
+        start = 0
+        while start < total:
+            end = min(start + self.chunk_size, total)
+            if end < total:
+                # Only the tail of the window is inspected for a break; the rest is never decoded per token
+                for cut in range(end, end - lookback, -1):
+                    if self._is_break(tokens[cut - 1]):
+                        end = cut
+                        break
+            # A window is decoded in one call; partial multi-byte characters at the edges are dropped
+            chunk = self.encoder.decode_bytes(tokens[start:end]).decode("utf-8", errors="ignore").strip()
+            if chunk:
+                yield chunk, end - start
+            if end >= total:
+                break
+            start = max(end - self.chunk_overlap, start + 1)
+
+    def split_text(self, text: str) -> list[str]:
+        return [chunk for chunk, _ in self._windows(text)]
+
+    def split_documents(self, documents: Iterable[Document]) -> list[Document]:
+        chunks = []
+        for doc in documents:
+            for text, n_tokens in self._windows(doc.page_content):
+                chunks.append(Document(page_content=text, metadata={**doc.metadata, "token_count": n_tokens}))
+        return chunks
+
+
+def chunker_signature() -> str:
+    """Identifies the chunking settings; part of each page's hash so a settings change re-chunks pages."""
+    return f"{CHUNK_ENCODING}:{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}"
+
+
+@lru_cache(maxsize=None)
+def get_chunker() -> TokenChunker:
+    """The chunker every ingestion path shares (configured by CHUNK_* env vars); one per process."""
+    return TokenChunker()
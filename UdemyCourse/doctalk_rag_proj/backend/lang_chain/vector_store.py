@@ -0,0 +1,400 @@
+import os
+import uuid
+from typing import Iterator
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    DeleteOperation,
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    HasIdCondition,
+    IsEmptyCondition,
+    MatchValue,
+    PayloadField,
+    PayloadSchemaType,
+    PayloadSelectorInclude,
+    PointStruct,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    SetPayload,
+    SetPayloadOperation,
+    ShardingMethod,
+    VectorParams,
+)
+from langchain_core.documents import Document
+
+VECTOR_DB_URL = os.getenv("VECTOR_DB_URL", "http://localhost:6333")
+COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "pdf_documents")
+# "qdrant" (the service in Infra/docker-compose.yml) or "embedded" (lang_chain.embedded_store)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant").lower()
+# "document": every file gets its own custom shard key, so filtered queries touch
+# one shard. Needs Qdrant in distributed mode and a collection created with it.
+QDRANT_SHARDING = os.getenv("QDRANT_SHARDING", "none").lower()
+QDRANT_SHARDS_PER_KEY = int(os.getenv("QDRANT_SHARDS_PER_KEY", "1"))
+# Quantization of new collections: "scalar" (int8, 4x smaller) or "binary"
+# (1 bit per dimension, 32x smaller; best with >= 1024 dims). Quantized vectors
+# stay in RAM; the originals move to disk and re-score the oversampled candidates.
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+
+# Payload layout matches langchain_qdrant.QdrantVectorStore so points written
+# here stay readable through QdrantVectorStore.similarity_search().
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+
+# Fixed namespace so the same (filename, page key, chunk-within-page) always maps
+# to the same point ID — retried uploads overwrite instead of duplicating, and an
+# unchanged page keeps its points across versions of the file.
+POINT_NAMESPACE = uuid.UUID("6f1c4b52-3d7e-4a8e-9c1b-2f5d8e7a9b10")
+
+_SCROLL_PAGE = 1000
+
+# Payload fields ingestion and queries filter on; indexed so filtering stays
+# cheap as the collection grows (without an index Qdrant scans payloads)
+PAYLOAD_INDEXES = {
+    "filename": PayloadSchemaType.KEYWORD,
+    "content_hash": PayloadSchemaType.KEYWORD,
+    "page_key": PayloadSchemaType.KEYWORD,
+    "committed": PayloadSchemaType.BOOL,
+}
+
+
+def point_id(filename: str, page_key: str, page_chunk: int) -> str:
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{filename}:{page_key}:{page_chunk}"))
+
+
+def _match(key: str, value) -> FieldCondition:
+    return FieldCondition(key=f"{METADATA_KEY}.{key}", match=MatchValue(value=value))
+
+
+def _committed() -> Filter:
+    # Points written before versioning carry no content_hash and never get the
+    # committed flag; they stay visible until the file's next ingest replaces them
+    return Filter(should=[
+        _match("committed", True),
+        IsEmptyCondition(is_empty=PayloadField(key=f"{METADATA_KEY}.content_hash")),
+    ])
+
+
+def committed_filter(filename: str | None = None) -> Filter:
+    """Committed points only (of `filename`, if given): a version still being written stays invisible."""
+    return Filter(must=[_committed()] + ([_match("filename", filename)] if filename else []))
+
+
+def quantization_config(mode: str = QDRANT_QUANTIZATION):
+    if mode == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if mode == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    if mode != "none":
+        raise ValueError(f"Unknown QDRANT_QUANTIZATION '{mode}' (none, scalar or binary)")
+    return None
+
+
+def search_params(mode: str = QDRANT_QUANTIZATION) -> SearchParams | None:
+    """Query-time params: search the quantized vectors, then re-score with the originals."""
+    if mode == "none":
+        return None
+    return SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=QDRANT_OVERSAMPLING))
+
+
+class QdrantStore:
+    """Thin wrapper over QdrantClient used by the ingestion pipeline."""
+
+    def __init__(
+        self,
+        url: str = VECTOR_DB_URL,
+        collection_name: str = COLLECTION_NAME,
+        quantization: str = QDRANT_QUANTIZATION,
+    ):
+        self.client = QdrantClient(url=url)
+        self.collection_name = collection_name
+        self.quantization = quantization
+        self.sharded = QDRANT_SHARDING == "document"
+        self._collection_ready = False
+        self._indexes_ready = False
+        self._shard_keys: set[str] = set()
+
+    def ensure_collection(self, vector_size: int) -> None:
+        """Create the collection on first use (cosine distance, unnamed vector) with its payload indexes."""
+        if self._collection_ready:
+            return
+        if not self.client.collection_exists(self.collection_name):
+            quantization = quantization_config(self.quantization)
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=quantization is not None),
+                quantization_config=quantization,
+                sharding_method=ShardingMethod.CUSTOM if self.sharded else None,
+            )
+            print(f"Created Qdrant collection '{self.collection_name}' (dim={vector_size}"
+                  + (f", {self.quantization} quantization" if quantization else "")
+                  + (", sharded by document" if self.sharded else "") + ").")
+        else:
+            size = self.client.get_collection(self.collection_name).config.params.vectors.size
+            if size != vector_size:
+                raise RuntimeError(
+                    f"Collection '{self.collection_name}' holds {size}-dim vectors but the embedding model "
+                    f"produces {vector_size}. Migrate it with lang_chain/migrate_collection.py."
+                )
+        self._ensure_indexes()
+        self._collection_ready = True
+
+    def _ensure_indexes(self) -> None:
+        """
+        Create any missing payload index — also on collections made before indexes
+        existed (e.g. by QdrantVectorStore.from_documents). Disables document
+        sharding if the existing collection was not created with custom sharding.
+        """
+        if self._indexes_ready:
+            return
+        info = self.client.get_collection(self.collection_name)
+        for field, schema in PAYLOAD_INDEXES.items():
+            if f"{METADATA_KEY}.{field}" not in (info.payload_schema or {}):
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=f"{METADATA_KEY}.{field}",
+                    field_schema=schema,
+                    wait=True,
+                )
+                print(f"Created payload index on '{METADATA_KEY}.{field}' ({schema.value}).")
+        if self.sharded and info.config.params.sharding_method != ShardingMethod.CUSTOM:
+            print(f"Collection '{self.collection_name}' was not created with custom sharding — QDRANT_SHARDING ignored.")
+            self.sharded = False
+        self._indexes_ready = True
+
+    def shard_key(self, filename: str | None) -> str | None:
+        """
+        Shard key selector for queries about `filename` (None = all shards).
+        QDRANT_SHARDING only applies if the collection was created with custom
+        sharding, which is checked once against the collection.
+        """
+        if self.sharded and not self._indexes_ready and self.client.collection_exists(self.collection_name):
+            self._ensure_indexes()
+        return filename if self.sharded and filename else None
+
+    def _shard(self, filename: str | None) -> str | None:
+        """Shard key of `filename` in document-sharding mode, created on first use."""
+        if self.shard_key(filename) is None:
+            return None
+        if filename not in self._shard_keys:
+            try:
+                self.client.create_shard_key(self.collection_name, filename, shards_number=QDRANT_SHARDS_PER_KEY)
+            except Exception as e:
+                if "already exists" not in str(e):
+                    raise
+            self._shard_keys.add(filename)
+        return filename
+
+    def upsert(self, chunks: list[Document], vectors: list[list[float]], ids: list[str] | None = None) -> None:
+        """Write one batch of embedded chunks. Pass deterministic `ids` to make retries idempotent."""
+        if not chunks:
+            return
+        self.ensure_collection(len(vectors[0]))
+        ids = ids or [uuid.uuid4().hex for _ in chunks]
+        points: dict[str | None, list[PointStruct]] = {}
+        for pid, chunk, vector in zip(ids, chunks, vectors):
+            # One request per shard key (bulk batches can span several files)
+            points.setdefault(self._shard(chunk.metadata.get("filename")), []).append(PointStruct(
+                id=pid,
+                vector=vector,
+                payload={CONTENT_KEY: chunk.page_content, METADATA_KEY: chunk.metadata},
+            ))
+        for key, batch in points.items():
+            self.client.upsert(collection_name=self.collection_name, points=batch, shard_key_selector=key, wait=True)
+
+    def is_committed(self, filename: str, content_hash: str) -> bool:
+        """True if this exact file version was fully ingested and no other version's points remain."""
+        if not self.client.collection_exists(self.collection_name):
+            return False
+        self._ensure_indexes()
+        committed = self.client.count(
+            collection_name=self.collection_name,
+            shard_key_selector=self._shard(filename),
+            count_filter=Filter(must=[
+                _match("filename", filename),
+                _match("content_hash", content_hash),
+                _match("committed", True),
+            ]),
+            exact=False,
+        )
+        if committed.count == 0:
+            return False
+        leftovers = self.client.count(
+            collection_name=self.collection_name,
+            shard_key_selector=self._shard(filename),
+            count_filter=Filter(
+                must=[_match("filename", filename)],
+                must_not=[_match("content_hash", content_hash)],
+            ),
+            exact=True,
+        )
+        return leftovers.count == 0
+
+    def committed_hash(self, filename: str) -> str | None:
+        """content_hash of the committed version of `filename`, or None if it has none."""
+        if not self.client.collection_exists(self.collection_name):
+            return None
+        points, _ = self.client.scroll(
+            collection_name=self.collection_name,
+            scroll_filter=committed_filter(filename),
+            shard_key_selector=self._shard(filename),
+            with_payload=PayloadSelectorInclude(include=[f"{METADATA_KEY}.content_hash"]),
+            with_vectors=False,
+            limit=1,
+        )
+        return (points[0].payload.get(METADATA_KEY) or {}).get("content_hash") if points else None
+
+    def iter_points(self, filename: str, committed_only: bool = False) -> Iterator[tuple[str, str, dict]]:
+        """Yield (point_id, page_content, metadata) for every (committed) point of `filename`, without vectors."""
+        if not self.client.collection_exists(self.collection_name):
+            return
+        conditions = [_match("filename", filename)] + ([_committed()] if committed_only else [])
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(must=conditions),
+                shard_key_selector=self._shard(filename),
+                with_payload=True,
+                with_vectors=False,
+                limit=_SCROLL_PAGE,
+                offset=offset,
+            )
+            for point in points:
+                yield str(point.id), point.payload.get(CONTENT_KEY, ""), point.payload.get(METADATA_KEY) or {}
+            if offset is None:
+                return
+
+    def vectors(self, ids: list[str]) -> dict[str, list[float]]:
+        """Stored embeddings of the given point IDs (missing IDs are left out)."""
+        if not ids:
+            return {}
+        points = self.client.retrieve(
+            collection_name=self.collection_name, ids=ids, with_payload=False, with_vectors=True
+        )
+        return {str(point.id): point.vector for point in points}
+
+    def page_points(self, filename: str) -> dict[str, list[str]]:
+        """Map each stored page_key of `filename` to the IDs of its points."""
+        pages: dict[str, list[str]] = {}
+        if not self.client.collection_exists(self.collection_name):
+            return pages
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(must=[_match("filename", filename)]),
+                shard_key_selector=self._shard(filename),
+                with_payload=PayloadSelectorInclude(include=[f"{METADATA_KEY}.page_key"]),
+                with_vectors=False,
+                limit=_SCROLL_PAGE,
+                offset=offset,
+            )
+            for point in points:
+                page_key = (point.payload.get(METADATA_KEY) or {}).get("page_key")
+                if page_key:
+                    pages.setdefault(page_key, []).append(str(point.id))
+            if offset is None:
+                return pages
+
+    def _count_ids(self, filename: str, ids: list[str]) -> int:
+        """How many of `ids` are stored as points of `filename`."""
+        found = 0
+        for start in range(0, len(ids), _SCROLL_PAGE):
+            found += self.client.count(
+                collection_name=self.collection_name,
+                shard_key_selector=self._shard(filename),
+                count_filter=Filter(must=[
+                    _match("filename", filename),
+                    HasIdCondition(has_id=ids[start:start + _SCROLL_PAGE]),
+                ]),
+                exact=True,
+            ).count
+        return found
+
+    def commit_document(
+        self,
+        filename: str,
+        content_hash: str,
+        relabel: list[tuple[list[str], dict]] = (),
+        written_ids: list[str] = (),
+    ) -> None:
+        """
+        In one batch request, applied in order: merge the new version's metadata
+        (page number, content_hash, ...) into the points of reused pages given
+        as (point_ids, metadata), mark the new version's points as committed,
+        and delete every point of older versions. Reused pages keep the old
+        version's labels until then, so a failure before the commit leaves the
+        old version intact.
+
+        Raises RuntimeError instead of committing when any of `written_ids`
+        (the chunks upserted for this version) or of the reused points is missing.
+        """
+        expected = [*written_ids, *(pid for ids, _ in relabel for pid in ids)]
+        found = self._count_ids(filename, expected)
+        if found < len(expected):
+            raise RuntimeError(
+                f"Not committing '{filename}': only {found} of its {len(expected)} points are stored."
+            )
+        shard = self._shard(filename)
+        self.client.batch_update_points(
+            collection_name=self.collection_name,
+            update_operations=[
+                *(
+                    SetPayloadOperation(set_payload=SetPayload(
+                        payload=metadata, points=ids, key=METADATA_KEY, shard_key=shard,
+                    ))
+                    for ids, metadata in relabel
+                ),
+                SetPayloadOperation(set_payload=SetPayload(
+                    payload={"committed": True},
+                    key=METADATA_KEY,
+                    filter=Filter(must=[_match("filename", filename), _match("content_hash", content_hash)]),
+                    shard_key=shard,
+                )),
+                DeleteOperation(delete=FilterSelector(
+                    filter=Filter(
+                        must=[_match("filename", filename)],
+                        must_not=[_match("content_hash", content_hash)],
+                    ),
+                    shard_key=shard,
+                )),
+            ],
+            wait=True,
+        )
+
+    def discard_uncommitted(self, filename: str, content_hash: str) -> None:
+        """Delete the points a failed ingest of `content_hash` wrote; committed points are kept."""
+        if not self.client.collection_exists(self.collection_name):
+            return
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=Filter(
+                must=[_match("filename", filename), _match("content_hash", content_hash)],
+                must_not=[_match("committed", True)],
+            ),
+            shard_key_selector=self._shard(filename),
+            wait=True,
+        )
+
+
+_store = None
+
+
+def get_store():
+    """The ingestion store for VECTOR_BACKEND — QdrantStore or EmbeddedStore, same interface."""
+    global _store
+    if _store is None:
+        if VECTOR_BACKEND == "embedded":
+            from lang_chain.embedded_store import EmbeddedStore
+            _store = EmbeddedStore()
+        else:
+            _store = QdrantStore()
+    return _store
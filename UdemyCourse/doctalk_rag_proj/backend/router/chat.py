@@ -1,17 +1,24 @@
 import os
 import uuid
-import aiofiles
+import asyncio
+from functools import partial
 from typing import Optional
 from fastapi import APIRouter, HTTPException, UploadFile
 from pydantic import BaseModel
-from lang_chain.document_loader import upload_document, SUPPORTED_EXTENSIONS
-from lang_chain.query_pdf import chat_with_file
+from lang_chain.document_loader import ingest_document, SUPPORTED_EXTENSIONS
+from lang_chain.query_pdf import achat_with_file, astream_chat_with_file
+from lang_chain.jobs import submit_job, get_job, JobQueueFull
+from lang_chain.session_store import get_session_store
+from lang_chain.llm_scheduler import LLMQueueFull, get_scheduler
+from router.uploads import stage_upload
+from router.streaming import stream_reply
 
 router = APIRouter()
 
-# In-memory session store: session_id -> { filename, history }
+# Session store (SESSION_BACKEND): session_id -> { filename, job_id, history }
 # Each session is tied to one uploaded file and holds its full conversation history.
-_sessions: dict[str, dict] = {}
+# Its sqlite / redis backends block, so handlers call it through asyncio.to_thread.
+_sessions = get_session_store("chat")
 
 
 # ---------- Response Models ----------
@@ -19,6 +26,7 @@ _sessions: dict[str, dict] = {}
 class StartChatResponse(BaseModel):
     session_id: str
     filename: str
+    job_id: str
     message: str
 
 class ChatRequest(BaseModel):
@@ -43,7 +51,9 @@ class SessionInfoResponse(BaseModel):
 async def start_chat(file: UploadFile):
     """
     Upload a PDF and start a new chat session.
-    Returns a session_id — use it in all subsequent /chat/{session_id}/message calls.
+    Returns a session_id — use it in all subsequent /chat/{session_id}/message calls —
+    and the job_id of the background ingestion. Messages are accepted once
+    GET /jobs/{job_id} reports `succeeded`.
     """
     ext = os.path.splitext(file.filename)[1].lower()
     if ext not in SUPPORTED_EXTENSIONS:
@@ -52,30 +62,41 @@ async def start_chat(file: UploadFile):
             detail=f"Unsupported file type '{ext}'. Supported: {', '.join(sorted(SUPPORTED_EXTENSIONS))}"
         )
 
-    upload_dir = "temp"
-    file_path = os.path.join(upload_dir, file.filename)
-    os.makedirs(upload_dir, exist_ok=True)
-
+    staged = await stage_upload(file)
     try:
-        async with aiofiles.open(file_path, mode="wb") as f:
-            while chunks := await file.read(1024 * 1024):
-                await f.write(chunks)
-
-        filename = upload_document(file_path)
+        filename = staged.filename
+        job = partial(ingest_document, staged.source(), filename=filename, content_hash=staged.sha256)
+        job_id = submit_job("ingest", job, filename=filename, cleanup=staged.close)
 
         session_id = str(uuid.uuid4())
-        _sessions[session_id] = {"filename": filename, "history": []}
+        await asyncio.to_thread(_sessions.create, session_id, {"filename": filename, "job_id": job_id})
 
         return StartChatResponse(
             session_id=session_id,
             filename=filename,
-            message=f"'{filename}' uploaded successfully. Start chatting using session_id."
+            job_id=job_id,
+            message=f"'{filename}' uploaded. Ingestion running as job '{job_id}'; start chatting once it succeeds."
         )
+    except JobQueueFull as e:
+        staged.close()
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
+        staged.close()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+
+
+async def _ready_session(session_id: str) -> dict:
+    """The session, once its file is searchable — 404 / 409 / 500 otherwise."""
+    session = await asyncio.to_thread(_sessions.get, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found. Upload a file at /chat/start first.")
+
+    job = await asyncio.to_thread(get_job, session["job_id"]) if session.get("job_id") else None
+    if job and job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Ingestion failed: {job['error']}")
+    if job and job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"'{session['filename']}' is still being ingested (stage: {job['stage']}).")
+    return session
 
 
 @router.post("/{session_id}/message", response_model=ChatResponse)
@@ -84,17 +105,16 @@ async def send_message(session_id: str, body: ChatRequest):
     Send a message in an existing chat session.
     The LLM answers based on the uploaded file and remembers the full conversation history.
     """
-    session = _sessions.get(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found. Upload a file at /chat/start first.")
+    session = await _ready_session(session_id)
 
     try:
-        reply, updated_history = chat_with_file(
+        reply, updated_history = await achat_with_file(
             user_input=body.message,
             filename=session["filename"],
             history=session["history"]
         )
-        _sessions[session_id]["history"] = updated_history
+        # Only the new turn is written; the stored history is never rewritten
+        await asyncio.to_thread(_sessions.append, session_id, updated_history[len(session["history"]):])
 
         return ChatResponse(
             session_id=session_id,
@@ -102,14 +122,50 @@ async def send_message(session_id: str, body: ChatRequest):
             reply=reply,
             history=updated_history
         )
+    except LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/{session_id}/message/stream")
+async def stream_message(session_id: str, body: ChatRequest):
+    """
+    Streaming variant of /message (Server-Sent Events).
+    Emits `token` events as the answer is generated, then one `done` event with
+    the ChatResponse fields plus ttft_ms / total_ms. The turn is added to the
+    history only when the stream completes; an `error` event or a client
+    disconnect leaves the history unchanged.
+    """
+    session = await _ready_session(session_id)
+    history = session["history"]
+    # Refuse now with a 503 rather than with an error event after a 200
+    try:
+        get_scheduler().check_admission()
+    except LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    def commit(reply: str) -> dict:
+        updated_history = history + [
+            {"role": "user", "content": body.message},
+            {"role": "assistant", "content": reply}
+        ]
+        # The session may have been deleted or expired meanwhile; append() then ignores the turn
+        _sessions.append(session_id, updated_history[len(history):])
+        return ChatResponse(
+            session_id=session_id,
+            filename=session["filename"],
+            reply=reply,
+            history=updated_history
+        ).model_dump()
+
+    return stream_reply("vector", astream_chat_with_file(body.message, session["filename"], history), commit)
+
+
 @router.get("/{session_id}", response_model=SessionInfoResponse)
 async def get_session(session_id: str):
     """Get session details and full conversation history."""
-    session = _sessions.get(session_id)
+    session = await asyncio.to_thread(_sessions.get, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -124,7 +180,6 @@ async def get_session(session_id: str):
 @router.delete("/{session_id}")
 async def delete_session(session_id: str):
     """Clear a chat session and its history."""
-    if session_id not in _sessions:
+    if not await asyncio.to_thread(_sessions.delete, session_id):
         raise HTTPException(status_code=404, detail="Session not found")
-    del _sessions[session_id]
     return {"status": "ok", "message": f"Session '{session_id}' deleted"}
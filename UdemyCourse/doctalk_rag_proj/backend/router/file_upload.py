@@ -1,12 +1,20 @@
 import os
-import aiofiles
+from functools import partial
 from fastapi import APIRouter, UploadFile, HTTPException
-from lang_chain.document_loader import upload_document, SUPPORTED_EXTENSIONS
+from lang_chain.document_loader import ingest_document, SUPPORTED_EXTENSIONS
+from lang_chain.bulk_ingest import ingest_files
+from lang_chain.embedding_cache import get_cache
+from lang_chain.jobs import submit_job, JobQueueFull
+from router.uploads import stage_upload
 
 router = APIRouter()
 
-@router.post("/add_file/")
+@router.post("/add_file/", status_code=202)
 async def add_db_file(file: UploadFile):
+    """
+    Stage the upload and queue it for ingestion.
+    Returns a job_id — poll GET /jobs/{job_id} or stream GET /jobs/{job_id}/events.
+    """
     ext = os.path.splitext(file.filename)[1].lower()
     if ext not in SUPPORTED_EXTENSIONS:
         raise HTTPException(
@@ -14,19 +22,67 @@ async def add_db_file(file: UploadFile):
             detail=f"Unsupported file type '{ext}'. Supported: {', '.join(sorted(SUPPORTED_EXTENSIONS))}"
         )
 
-    upload_dir = "temp"
-    file_path = os.path.join(upload_dir, file.filename)
-    os.makedirs(upload_dir, exist_ok=True)
+    staged = await stage_upload(file)
+    try:
+        print(f"Staged '{staged.filename}' ({staged.size:,} bytes), queueing ingestion job...")
+        job = partial(ingest_document, staged.source(), filename=staged.filename, content_hash=staged.sha256)
+        job_id = submit_job("ingest", job, filename=staged.filename, cleanup=staged.close)
+        return {"status": "queued", "job_id": job_id, "filename": staged.filename}
+    except JobQueueFull as e:
+        staged.close()
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        staged.close()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/add_files/", status_code=202)
+async def add_db_files(files: list[UploadFile]):
+    """
+    Stage many uploads and ingest them as one bulk job: files are parsed in a
+    process pool and share a single embed + upsert stage.
+    The finished job's `result` holds a per-file summary and overall throughput.
+    """
+    names = [f.filename for f in files]
+    unsupported = [n for n in names if os.path.splitext(n)[1].lower() not in SUPPORTED_EXTENSIONS]
+    if unsupported:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type(s): {', '.join(unsupported)}. Supported: {', '.join(sorted(SUPPORTED_EXTENSIONS))}"
+        )
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="Duplicate filenames in one batch are not allowed.")
+
+    staged_files = []
+
+    def _cleanup():
+        for staged in staged_files:
+            staged.close()
 
     try:
-        async with aiofiles.open(file_path, mode='wb') as f:
-            while chunks := await file.read(1024 * 1024):
-                await f.write(chunks)
-        print("File saved locally, uploading to vector DB...")
-        filename = upload_document(file_path)
-        return {"status": "ok", "filename": filename}
+        for file in files:
+            # Parser processes open files by path, so bulk uploads always spool to disk
+            staged_files.append(await stage_upload(file, spool_max_bytes=0))
+        job = partial(
+            ingest_files,
+            [s.path for s in staged_files],
+            filenames=[s.filename for s in staged_files],
+            content_hashes=[s.sha256 for s in staged_files],
+        )
+        job_id = submit_job("bulk_ingest", job, cleanup=_cleanup)
+        return {"status": "queued", "job_id": job_id, "files": names}
+    except JobQueueFull as e:
+        _cleanup()
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        _cleanup()
+        raise
     except Exception as e:
+        _cleanup()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
\ No newline at end of file
+
+
+@router.get("/embedding_cache")
+async def embedding_cache_stats():
+    """Entry count and hit/miss counters of the on-disk embedding cache."""
+    return get_cache().stats()
@@ -1,9 +1,25 @@
+import os
+import time
 from typing import Optional
 from fastapi import APIRouter, HTTPException
-from lang_chain.query_pdf import query_file
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from lang_chain.query_pdf import aquery_batch, aquery_file
+from lang_chain.query_cache import get_query_cache
+from lang_chain.answer_cache import get_answer_cache
+from lang_chain.llm_scheduler import LLMQueueFull
+from router.streaming import SSE_HEADERS, sse
 
 router = APIRouter()
 
+# Largest question list accepted by /query_batch/
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "200"))
+
+
+class BatchQueryRequest(BaseModel):
+    questions: list[str]
+    filename: Optional[str] = None
+
 @router.post("/query_file/")
 async def query_pdf_file(query: str, filename: Optional[str] = None):
     """
@@ -12,6 +28,59 @@ async def query_pdf_file(query: str, filename: Optional[str] = None):
     - Omit `filename` to search across all uploaded documents.
     """
     try:
-        return query_file(query, filename=filename)
+        return await aquery_file(query, filename=filename)
+    except LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/query_batch/")
+async def query_batch(body: BatchQueryRequest):
+    """
+    Ask many questions in one request (Server-Sent Events).
+    Emits one `result` event per question as soon as it is answered — with its
+    `index` in the request, so results arrive out of order — then one `done`
+    event with counts and total_ms. A failed question gets an `error` field
+    in its result; the rest of the batch carries on. Blank questions are
+    rejected with 422 rather than dropped, so every index matches the request.
+    """
+    questions = body.questions
+    if not questions:
+        raise HTTPException(status_code=400, detail="No questions given.")
+    blank = [i for i, q in enumerate(questions) if not q.strip()]
+    if blank:
+        raise HTTPException(status_code=422, detail=f"Blank question(s) at index {', '.join(map(str, blank))}.")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+
+    async def events():
+        started = time.perf_counter()
+        counts = {"answered": 0, "cached": 0, "failed": 0}
+        try:
+            async for result in aquery_batch(questions, filename=body.filename):
+                if "error" in result:
+                    counts["failed"] += 1
+                else:
+                    counts["answered"] += 1
+                    counts["cached"] += result["cached"]
+                yield sse("result", result)
+        except Exception as e:
+            yield sse("error", {"detail": str(e)})
+            return
+        yield sse("done", {"questions": len(questions), **counts,
+                           "total_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/query_cache")
+async def query_cache_stats():
+    """Entry count and hit/miss/eviction counters of the query-embedding cache."""
+    return get_query_cache().stats()
+
+
+@router.get("/answer_cache")
+async def answer_cache_stats():
+    """Document/entry counts and hit/miss/invalidation counters of the semantic answer cache."""
+    return get_answer_cache().stats()
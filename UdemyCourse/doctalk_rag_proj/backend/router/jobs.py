@@ -0,0 +1,51 @@
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from lang_chain.jobs import get_job, is_finished
+
+router = APIRouter()
+# get_job() may read JOB_STATE_PATH (SQLite), so it runs in a thread
+
+# How often the SSE stream checks the job for new progress
+POLL_INTERVAL_SECONDS = 0.5
+
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str):
+    """Current status, stage and per-stage progress of an ingestion job."""
+    job = await asyncio.to_thread(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """
+    Server-Sent Events stream of job progress.
+    Emits a `progress` event on every change and a final `done` event.
+    """
+    if not await asyncio.to_thread(get_job, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        last_version = -1
+        while True:
+            job = await asyncio.to_thread(get_job, job_id)
+            if job is None:
+                yield "event: error\ndata: {\"detail\": \"Job expired\"}\n\n"
+                return
+            if job["version"] != last_version:
+                last_version = job["version"]
+                event = "done" if is_finished(job) else "progress"
+                yield f"event: {event}\ndata: {json.dumps(job)}\n\n"
+                if event == "done":
+                    return
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
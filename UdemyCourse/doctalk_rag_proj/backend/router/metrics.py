@@ -0,0 +1,38 @@
+import time
+from starlette.types import ASGIApp, Receive, Scope, Send
+from lang_chain.metrics import HTTP_REQUESTS, HTTP_SECONDS, request_scope, route_template
+
+
+class MetricsMiddleware:
+    """
+    Makes the request scope visible to the stage metrics recorded while it is
+    served, and records request counts and durations per route template.
+    Streamed bodies are timed to the last byte.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = request_scope.set(scope)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Routing has filled in the scope by now
+            route = route_template(scope)
+            HTTP_REQUESTS.inc(route=route, method=scope["method"], status=status)
+            HTTP_SECONDS.observe(time.perf_counter() - start, route=route, method=scope["method"])
+            request_scope.reset(token)
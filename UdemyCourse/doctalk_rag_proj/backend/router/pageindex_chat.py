@@ -1,17 +1,22 @@
 import os
 import uuid
 import asyncio
-import aiofiles
+from typing import Optional
 from fastapi import APIRouter, HTTPException, UploadFile
 from pydantic import BaseModel
-from lang_chain.pageindex_indexer import build_index
-from lang_chain.pageindex_querier import chat_with_pageindex
+from lang_chain.pageindex_indexer import update_index
+from lang_chain.pageindex_querier import astream_chat_with_pageindex, chat_with_pageindex
 from lang_chain.document_loader import SUPPORTED_EXTENSIONS
+from lang_chain.session_store import get_session_store
+from lang_chain.llm_scheduler import LLMQueueFull, get_scheduler
+from router.uploads import stage_upload
+from router.streaming import stream_reply
 
 router = APIRouter()
 
-# In-memory session store: session_id -> { filename, history }
-_sessions: dict[str, dict] = {}
+# Session store (SESSION_BACKEND): session_id -> { filename, history }
+# Its sqlite / redis backends block, so handlers call it through asyncio.to_thread.
+_sessions = get_session_store("pageindex")
 
 
 # ---------- Response Models ----------
@@ -21,6 +26,7 @@ class StartChatResponse(BaseModel):
     filename: str
     doc_name: str
     message: str
+    reindex: Optional[dict] = None
 
 class ChatRequest(BaseModel):
     message: str
@@ -53,37 +59,29 @@ async def start_chat(file: UploadFile):
             detail=f"Unsupported file type '{ext}'. Supported: {', '.join(sorted(SUPPORTED_EXTENSIONS))}"
         )
 
-    upload_dir = "temp"
-    file_path = os.path.join(upload_dir, file.filename)
-    os.makedirs(upload_dir, exist_ok=True)
-
+    staged = await stage_upload(file)
     try:
-        async with aiofiles.open(file_path, mode="wb") as f:
-            while chunks := await file.read(1024 * 1024):
-                await f.write(chunks)
-
         # page_index_main() internally calls asyncio.run(), which cannot be
         # nested inside FastAPI's running event loop. Run it in a thread so
         # it gets its own clean event loop.
-        tree = await asyncio.to_thread(build_index, file_path, file.filename)
+        tree, reindex = await asyncio.to_thread(update_index, staged.open(), file.filename)
 
         session_id = str(uuid.uuid4())
-        _sessions[session_id] = {
-            "filename": file.filename,
-            "history": [],
-        }
+        await asyncio.to_thread(_sessions.create, session_id, {"filename": file.filename})
 
         return StartChatResponse(
             session_id=session_id,
             filename=file.filename,
             doc_name=tree.get("doc_name", file.filename),
             message=f"PageIndex tree built for '{file.filename}'. Start chatting!",
+            reindex=reindex,
         )
+    except LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        staged.close()
 
 
 @router.post("/{session_id}/message", response_model=ChatResponse)
@@ -93,7 +91,7 @@ async def send_message(session_id: str, body: ChatRequest):
     Step 1: LLM selects relevant sections from the tree.
     Step 2: Raw page text is extracted and passed to the LLM to answer.
     """
-    session = _sessions.get(session_id)
+    session = await asyncio.to_thread(_sessions.get, session_id)
     if not session:
         raise HTTPException(
             status_code=404,
@@ -107,7 +105,8 @@ async def send_message(session_id: str, body: ChatRequest):
             session["filename"],
             session["history"],
         )
-        _sessions[session_id]["history"] = updated_history
+        # Only the new turn is written; the stored history is never rewritten
+        await asyncio.to_thread(_sessions.append, session_id, updated_history[len(session["history"]):])
 
         return ChatResponse(
             session_id=session_id,
@@ -115,14 +114,54 @@ async def send_message(session_id: str, body: ChatRequest):
             reply=reply,
             history=updated_history,
         )
+    except LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/{session_id}/message/stream")
+async def stream_message(session_id: str, body: ChatRequest):
+    """
+    Streaming variant of /message (Server-Sent Events).
+    Tree navigation runs first, then the answer is sent as `token` events and
+    a final `done` event (ChatResponse fields plus ttft_ms / total_ms). The
+    turn is added to the history only when the stream completes.
+    """
+    session = await asyncio.to_thread(_sessions.get, session_id)
+    if not session:
+        raise HTTPException(
+            status_code=404,
+            detail="Session not found. Upload a file at /chat/start first.",
+        )
+    history = session["history"]
+    # Refuse now with a 503 rather than with an error event after a 200
+    try:
+        get_scheduler().check_admission()
+    except LLMQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    def commit(reply: str) -> dict:
+        updated_history = history + [
+            {"role": "user", "content": body.message},
+            {"role": "assistant", "content": reply},
+        ]
+        # The session may have been deleted or expired meanwhile; append() then ignores the turn
+        _sessions.append(session_id, updated_history[len(history):])
+        return ChatResponse(
+            session_id=session_id,
+            filename=session["filename"],
+            reply=reply,
+            history=updated_history,
+        ).model_dump()
+
+    return stream_reply("pageindex", astream_chat_with_pageindex(body.message, session["filename"], history), commit)
+
+
 @router.get("/{session_id}", response_model=SessionInfoResponse)
 async def get_session(session_id: str):
     """Get session details and full conversation history."""
-    session = _sessions.get(session_id)
+    session = await asyncio.to_thread(_sessions.get, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -137,7 +176,6 @@ async def get_session(session_id: str):
 @router.delete("/{session_id}")
 async def delete_session(session_id: str):
     """Clear a chat session and its history."""
-    if session_id not in _sessions:
+    if not await asyncio.to_thread(_sessions.delete, session_id):
         raise HTTPException(status_code=404, detail="Session not found")
-    del _sessions[session_id]
     return {"status": "ok", "message": f"Session '{session_id}' deleted"}
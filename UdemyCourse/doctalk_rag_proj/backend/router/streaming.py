@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import statistics
+from collections import deque
+from typing import AsyncGenerator, Callable
+from fastapi.responses import StreamingResponse
+from lang_chain.metrics import STREAM_OUTCOMES, STREAM_TTFT, current_route
+
+# Shared Server-Sent Events plumbing for the streaming chat routes of both
+# engines. Tokens are forwarded as they arrive; the turn is committed to the
+# session only after the last token, so a disconnect or an LLM error never
+# leaves half an answer in the history. Time-to-first-token (TTFT) is the
+# headline latency metric, kept per engine over a rolling window.
+STREAM_STATS_WINDOW = int(os.getenv("STREAM_STATS_WINDOW", "1000"))
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _percentile(values: list[float], pct: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+class StreamStats:
+    """Rolling TTFT / total-latency samples and outcome counters per engine."""
+
+    def __init__(self, window: int = STREAM_STATS_WINDOW):
+        self.window = window
+        self._ttft: dict[str, deque] = {}
+        self._total: dict[str, deque] = {}
+        self._outcomes: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _counters(self, engine: str) -> dict[str, int]:
+        return self._outcomes.setdefault(engine, {"completed": 0, "disconnected": 0, "failed": 0})
+
+    def record(self, engine: str, ttft: float, total: float) -> None:
+        with self._lock:
+            self._ttft.setdefault(engine, deque(maxlen=self.window)).append(ttft)
+            self._total.setdefault(engine, deque(maxlen=self.window)).append(total)
+            self._counters(engine)["completed"] += 1
+        # Also exported at /metrics, as a histogram summable across workers
+        STREAM_TTFT.observe(ttft, engine=engine, route=current_route())
+        STREAM_OUTCOMES.inc(engine=engine, route=current_route(), outcome="completed")
+
+    def outcome(self, engine: str, outcome: str) -> None:
+        with self._lock:
+            self._counters(engine)[outcome] += 1
+        STREAM_OUTCOMES.inc(engine=engine, route=current_route(), outcome=outcome)
+
+    def summary(self) -> dict:
+        with self._lock:
+            result = {}
+            for engine, counters in self._outcomes.items():
+                ttft = list(self._ttft.get(engine, ()))
+                total = list(self._total.get(engine, ()))
+                stats = {**counters, "samples": len(ttft)}
+                if ttft:
+                    stats.update({
+                        "ttft_p50_ms": round(_percentile(ttft, 50) * 1000, 1),
+                        "ttft_p95_ms": round(_percentile(ttft, 95) * 1000, 1),
+                        "total_p50_ms": round(_percentile(total, 50) * 1000, 1),
+                        "total_p95_ms": round(_percentile(total, 95) * 1000, 1),
+                    })
+                result[engine] = stats
+            return result
+
+
+stream_stats = StreamStats()
+
+
+def stream_reply(
+    engine: str,
+    tokens: AsyncGenerator[str, None],
+    on_complete: Callable[[str], dict],
+) -> StreamingResponse:
+    """
+    SSE response forwarding `tokens` as `token` events. When the stream ends,
+    `on_complete(reply)` commits the turn (in a worker thread — it may block on
+    the session store) and its result is sent as the `done` event (with
+    ttft_ms / total_ms). Failures end the stream with an `error` event.
+    """
+    started = time.perf_counter()
+
+    async def events():
+        ttft = None
+        parts: list[str] = []
+        try:
+            async for token in tokens:
+                if not token:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(token)
+                yield sse("token", {"text": token})
+
+            result = await asyncio.to_thread(on_complete, "".join(parts))
+            total = time.perf_counter() - started
+            ttft = total if ttft is None else ttft
+            stream_stats.record(engine, ttft, total)
+            yield sse("done", {**result, "ttft_ms": round(ttft * 1000, 1), "total_ms": round(total * 1000, 1)})
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away: nothing is committed; closing `tokens` aborts the LLM stream
+            stream_stats.outcome(engine, "disconnected")
+            print(f"[{engine}] client disconnected after {len(parts)} tokens — turn discarded")
+            raise
+        except Exception as e:
+            stream_stats.outcome(engine, "failed")
+            yield sse("error", {"detail": str(e)})
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
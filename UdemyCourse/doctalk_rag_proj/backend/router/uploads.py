@@ -0,0 +1,150 @@
+import io
+import os
+import hashlib
+import tempfile
+from typing import BinaryIO
+from fastapi import HTTPException, UploadFile
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Shared upload handling for every route that accepts files. Uploads are
+# streamed once into a spooled buffer (memory, rolling over to a uniquely named
+# temp file), hashed and sized on the way, and handed to the parsers as an open
+# file object — no `temp/<original filename>` collisions and no second read.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "temp")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_MB", "2048")) * 1024 * 1024
+SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MB", "16")) * 1024 * 1024
+
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+class StagedUpload:
+    """An uploaded file held in memory or in a unique temp file, with its hash and size."""
+
+    def __init__(self, filename: str, spool_max_bytes: int = SPOOL_MAX_BYTES):
+        self.filename = filename
+        self.size = 0
+        self.sha256 = ""
+        self.path: str | None = None   # set once the buffer rolls over to disk
+        self._spool_max_bytes = spool_max_bytes
+        self._file: BinaryIO = io.BytesIO()
+        self._digest = hashlib.sha256()
+
+    def write(self, data: bytes) -> None:
+        self._digest.update(data)
+        self.size += len(data)
+        if self.path is None and self.size > self._spool_max_bytes:
+            self._rollover()
+        self._file.write(data)
+
+    def _rollover(self) -> None:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        ext = os.path.splitext(self.filename)[1].lower()
+        disk = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix="upload-", suffix=ext, delete=False)
+        disk.write(self._file.getvalue())
+        self._file.close()
+        self._file, self.path = disk, disk.name
+
+    def finish(self) -> None:
+        if self.path is None and self._spool_max_bytes == 0:
+            self._rollover()   # caller asked for a file on disk, even if empty
+        self.sha256 = self._digest.hexdigest()
+        self._file.flush()
+        self._file.seek(0)
+
+    def open(self) -> BinaryIO:
+        """The underlying file object, rewound to the start."""
+        self._file.seek(0)
+        return self._file
+
+    def source(self) -> str | BinaryIO:
+        """What to hand a parser: the temp path if on disk (so worker processes can open it), else the buffer."""
+        return self.path or self.open()
+
+    def close(self) -> None:
+        self._file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def stage_upload(
+    file: UploadFile,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    spool_max_bytes: int = SPOOL_MAX_BYTES,
+) -> StagedUpload:
+    """
+    Stream an UploadFile into a StagedUpload, hashing as it goes.
+    Raises HTTP 413 as soon as the file exceeds `max_bytes`.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"'{file.filename}' exceeds the {max_bytes // (1024 * 1024)} MB limit.")
+
+    staged = StagedUpload(file.filename, spool_max_bytes=spool_max_bytes)
+    try:
+        while chunk := await file.read(READ_CHUNK_BYTES):
+            if staged.size + len(chunk) > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"'{file.filename}' exceeds the {max_bytes // (1024 * 1024)} MB limit.",
+                )
+            staged.write(chunk)
+        staged.finish()
+        return staged
+    except Exception:
+        staged.close()
+        raise
+
+
+# Headroom for multipart boundaries and form fields around a single file
+_MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject oversized request bodies before they are buffered: by Content-Length
+    when the client sends one, otherwise by counting bytes as they stream in.
+    Single-file routes get MAX_UPLOAD_BYTES; `bulk_paths` get MAX_REQUEST_BYTES.
+    """
+
+    def __init__(self, app: ASGIApp, bulk_paths: tuple[str, ...] = ()):
+        self.app = app
+        self.bulk_paths = bulk_paths
+
+    def _limit_for(self, path: str) -> int:
+        if any(path.startswith(p) for p in self.bulk_paths):
+            return MAX_REQUEST_BYTES
+        return MAX_UPLOAD_BYTES + _MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self._limit_for(scope["path"])
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail="Request body too large.")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send: Send) -> None:
+        body = b'{"detail":"Request body too large."}'
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
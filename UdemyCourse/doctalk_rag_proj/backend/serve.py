@@ -0,0 +1,77 @@
+"""
+Production entry point: WEB_CONCURRENCY uvicorn worker processes sharing one
+port. Each worker is a separate interpreter, so CPU-heavy parsing and the sync
+LLM calls of one request no longer hold up the others.
+
+State the workers must share is checked before they start: sessions need
+SESSION_BACKEND=sqlite or redis, ingestion job status needs JOB_STATE_PATH,
+and vectors need VECTOR_BACKEND=qdrant (the embedded store is single-process).
+Caches (query embeddings, answers, history summaries) stay per worker;
+/metrics sums the snapshots the workers write to METRICS_DIR.
+
+Usage (from backend/):
+    WEB_CONCURRENCY=4 SESSION_BACKEND=sqlite JOB_STATE_PATH=jobs.sqlite3 python serve.py
+
+For development, one process with auto-reload:
+    uvicorn api:app --reload
+"""
+import os
+import glob
+import tempfile
+import uvicorn
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Seconds a worker gets to finish in-flight requests (e.g. streamed replies) on shutdown
+GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "30"))
+
+
+def check_shared_state(workers: int) -> None:
+    if workers <= 1:
+        return
+    if os.getenv("SESSION_BACKEND", "memory").lower() == "memory":
+        raise RuntimeError(
+            f"SESSION_BACKEND=memory cannot be shared by {workers} workers. Set SESSION_BACKEND=sqlite or redis."
+        )
+    if not os.getenv("JOB_STATE_PATH"):
+        raise RuntimeError(
+            f"JOB_STATE_PATH is required with {workers} workers, so job status can be polled through any of them."
+        )
+    if os.getenv("VECTOR_BACKEND", "qdrant").lower() == "embedded":
+        # Each process caches slot tables and memory maps and compacts files under its own lock
+        raise RuntimeError(
+            f"VECTOR_BACKEND=embedded cannot be shared by {workers} workers. Use VECTOR_BACKEND=qdrant or one worker."
+        )
+
+
+def prepare_metrics_dir(workers: int) -> None:
+    """Give multi-worker mode a METRICS_DIR, emptied so counters restart with the server."""
+    if workers <= 1:
+        return
+    metrics_dir = os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "doctalk_metrics"))
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        os.remove(path)
+
+
+def main() -> None:
+    check_shared_state(WEB_CONCURRENCY)
+    prepare_metrics_dir(WEB_CONCURRENCY)
+    # Each worker's LLM scheduler takes this share of LLM_RPM / LLM_TPM
+    os.environ["WEB_CONCURRENCY"] = str(WEB_CONCURRENCY)
+    # Every worker starts its own PDF extraction pool; split the cores between them
+    os.environ.setdefault("PDF_EXTRACT_WORKERS", str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+    print(f"Starting {WEB_CONCURRENCY} worker(s) on {HOST}:{PORT}")
+    uvicorn.run(
+        "api:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT_SECONDS,
+    )
+
+
+if __name__ == "__main__":
+    main()
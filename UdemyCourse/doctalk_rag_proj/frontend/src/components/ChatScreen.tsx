@@ -10,7 +10,7 @@ import {
   Database, GitBranch,
 } from "lucide-react";
 import clsx from "clsx";
-import { sendMessage, deleteSession } from "@/lib/api";
+import { streamMessage, deleteSession } from "@/lib/api";
 import type { Message } from "@/lib/api";
 import MarkdownMessage from "./MarkdownMessage";
 
@@ -129,6 +129,7 @@ export default function ChatScreen({
   ]);
   const [input, setInput] = useState("");
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [showScrollBtn, setShowScrollBtn] = useState(false);
 
@@ -168,18 +169,27 @@ export default function ChatScreen({
     setMessages((prev) => [...prev, { role: "user", content: trimmed }]);
     setIsLoading(true);
 
+    let reply = "";
     try {
-      const data = await sendMessage(sessionId, trimmed, deepTree);
-      setMessages((prev) => [
-        ...prev,
-        { role: "assistant", content: data.reply },
-      ]);
+      await streamMessage(sessionId, trimmed, deepTree, (token) => {
+        const first = reply === "";
+        reply += token;
+        const content = reply;
+        setIsStreaming(true);
+        setMessages((prev) =>
+          first
+            ? [...prev, { role: "assistant", content }]
+            : [...prev.slice(0, -1), { role: "assistant", content }]
+        );
+      });
     } catch (err: unknown) {
       setError(err instanceof Error ? err.message : "Failed to get a response.");
-      setMessages((prev) => prev.slice(0, -1));
+      // Drop the user message and any partial reply — the server did not commit the turn
+      setMessages((prev) => prev.slice(0, reply ? -2 : -1));
       setInput(trimmed);
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -256,7 +266,7 @@ export default function ChatScreen({
           {messages.map((msg, i) => (
             <MessageBubble key={i} message={msg} deepTree={deepTree} />
           ))}
-          {isLoading && <TypingIndicator deepTree={deepTree} />}
+          {isLoading && !isStreaming && <TypingIndicator deepTree={deepTree} />}
 
           {error && (
             <div
@@ -8,6 +8,15 @@ export interface StartChatResponse {
   session_id: string;
   filename: string;
   message: string;
+  job_id?: string;
+}
+
+export interface JobStatus {
+  job_id: string;
+  status: "queued" | "running" | "succeeded" | "failed";
+  stage: string | null;
+  progress: Record<string, number>;
+  error: string | null;
 }
 
 export interface Message {
@@ -39,7 +48,30 @@ export async function startChat(
     throw new Error(err.detail || "Failed to start chat session");
   }
 
-  return res.json();
+  const data: StartChatResponse = await res.json();
+  // The vector engine ingests in the background — wait until the file is searchable
+  if (data.job_id) {
+    await waitForJob(data.job_id);
+  }
+  return data;
+}
+
+export async function waitForJob(
+  jobId: string,
+  intervalMs = 1000
+): Promise<JobStatus> {
+  for (;;) {
+    const res = await fetch(`${BASE_URL}/jobs/${jobId}`);
+    if (!res.ok) {
+      throw new Error("Failed to fetch ingestion status");
+    }
+    const job: JobStatus = await res.json();
+    if (job.status === "succeeded") return job;
+    if (job.status === "failed") {
+      throw new Error(job.error || "File ingestion failed");
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
 }
 
 export async function sendMessage(
@@ -61,6 +93,47 @@ export async function sendMessage(
   return res.json();
 }
 
+// Streams the reply over SSE: onToken gets each text delta, and the returned
+// promise resolves with the final ChatResponse once the turn is committed.
+export async function streamMessage(
+  sessionId: string,
+  message: string,
+  deepTree: boolean,
+  onToken: (text: string) => void
+): Promise<ChatResponse> {
+  const res = await fetch(`${chatBase(deepTree)}/${sessionId}/message/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ message }),
+  });
+
+  if (!res.ok || !res.body) {
+    const err = await res.json().catch(() => ({ detail: res.statusText }));
+    throw new Error(err.detail || "Failed to send message");
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary: number;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const event = block.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] ?? "{}");
+      if (event === "token") onToken(data.text);
+      else if (event === "done") return data as ChatResponse;
+      else if (event === "error") throw new Error(data.detail || "Failed to get a response.");
+    }
+  }
+  throw new Error("Connection closed before the reply finished.");
+}
+
 export async function deleteSession(
   sessionId: string,
   deepTree: boolean
@@ -0,0 +1,108 @@
+"""
+Benchmark chunking: the original RecursiveCharacterTextSplitter(1000, 200)
+against the token-aware chunker in backend/lang_chain/token_chunker.py.
+
+Reports throughput (pages/s, MB/s) and the spread of chunk sizes in tokens —
+the number that decides how predictable context packing is at query time.
+
+Pages come from --pdf if given (generated with generate_invoices.py when the
+default corpus is missing), otherwise from synthetic prose.
+
+Usage (from doctalk_rag_proj/):
+    python utils/bench_chunker.py [--pdf B2B_Invoices.pdf] [--pages 2000] [--repeat 3]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "backend"))
+sys.path.append(HERE)
+
+_WORDS = (
+    "invoice total amount payable customer supplier quantity unit price tax net gross "
+    "delivery terms conditions shipment warehouse order reference account balance due "
+    "the of and to in for with on by at from as is was are be this that which"
+).split()
+
+
+def synthetic_pages(count: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        paragraphs = []
+        for _ in range(rng.randint(3, 8)):
+            sentences = [
+                " ".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 24))).capitalize() + "."
+                for _ in range(rng.randint(2, 7))
+            ]
+            paragraphs.append(" ".join(sentences))
+        pages.append("\n\n".join(paragraphs))
+    return pages
+
+
+def pdf_pages(pdf_path: str, limit: int) -> list[str]:
+    from lang_chain.pdf_extract import iter_pdf_pages
+    pages = []
+    for doc in iter_pdf_pages(pdf_path):
+        pages.append(doc.page_content)
+        if len(pages) >= limit:
+            break
+    return pages
+
+
+def bench(name: str, split, pages: list[str], repeat: int, count_tokens) -> None:
+    best = float("inf")
+    chunks: list[str] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [c for page in pages for c in split(page)]
+        best = min(best, time.perf_counter() - start)
+
+    mb = sum(len(p.encode("utf-8")) for p in pages) / (1024 * 1024)
+    sizes = [count_tokens(c) for c in chunks]
+    print(
+        f"{name:<28} {len(chunks):>7} chunks  {best:7.3f}s  {len(pages) / best:9.1f} pages/s  {mb / best:7.2f} MB/s  "
+        f"tokens min/mean/max/stdev {min(sizes)}/{statistics.mean(sizes):.0f}/{max(sizes)}/{statistics.pstdev(sizes):.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=None, help="Chunk the pages of this PDF instead of synthetic text")
+    parser.add_argument("--pages", type=int, default=2000, help="Number of pages to chunk")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per splitter; the best time is reported")
+    args = parser.parse_args()
+
+    if args.pdf:
+        if not os.path.exists(args.pdf):
+            print(f"Generating invoice corpus → {args.pdf} ...")
+            import generate_invoices
+            generate_invoices.main()
+            if args.pdf != "B2B_Invoices.pdf":
+                os.replace("B2B_Invoices.pdf", args.pdf)
+        pages = pdf_pages(args.pdf, args.pages)
+    else:
+        pages = synthetic_pages(args.pages)
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from lang_chain.token_chunker import TokenChunker, count_tokens, get_encoder
+
+    get_encoder()   # load the BPE tables up front so they aren't billed to the first run
+
+    char_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    token_chunker = TokenChunker()
+
+    print(f"{len(pages)} pages, best of {args.repeat}")
+    bench("RecursiveCharacter(1000/200)", char_splitter.split_text, pages, args.repeat, count_tokens)
+    bench(
+        f"TokenChunker({token_chunker.chunk_size}/{token_chunker.chunk_overlap})",
+        token_chunker.split_text, pages, args.repeat, count_tokens,
+    )
+
+
+if __name__ == "__main__":
+    main()
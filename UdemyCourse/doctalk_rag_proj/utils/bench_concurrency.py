@@ -0,0 +1,158 @@
+"""
+Benchmark concurrent query throughput of the vector engine: the original sync
+path (query_file called from an async route, blocking the event loop) against
+the async path (aquery_file on pooled AsyncOpenAI / AsyncQdrantClient).
+
+Both variants run in one process on one event loop, like a single uvicorn
+worker, and are driven through the ASGI interface with N requests in flight.
+
+By default OpenAI and Qdrant are replaced with stand-ins that only wait
+(--latency-ms for the chat call, a tenth of that for embedding and search),
+so the numbers isolate how the worker schedules I/O. Pass --live to hit the
+real services configured in .env (costs tokens; needs an ingested --filename).
+
+Usage (from doctalk_rag_proj/):
+    python utils/bench_concurrency.py [--requests 100] [--concurrency 50] [--latency-ms 800]
+    python utils/bench_concurrency.py --live --filename invoices.pdf --requests 20 --concurrency 10
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import statistics
+from types import SimpleNamespace
+from typing import Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "backend"))
+sys.path.append(os.path.join(HERE, "..", ".."))   # my_agents
+
+
+# ---------------------------------------------------------------------------
+# Latency-only stand-ins for OpenAI and Qdrant
+# ---------------------------------------------------------------------------
+
+def _stub_services(latency_s: float) -> None:
+    from langchain_core.documents import Document
+    from my_agents.model import PromptOutput
+    from lang_chain import query_pdf
+
+    small = latency_s / 10
+    docs = [Document(page_content=f"chunk {i}", metadata={"filename": "bench.pdf"}) for i in range(4)]
+    parsed = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(parsed=PromptOutput(step="answer", content="ok")))])
+
+    class Embeddings:
+        def embed_query(self, text):
+            time.sleep(small)
+            return [0.0] * 8
+
+        async def aembed_query(self, text):
+            await asyncio.sleep(small)
+            return [0.0] * 8
+
+    class VectorDB:
+        def similarity_search(self, query, k=4, filter=None):
+            time.sleep(small)
+            return docs
+
+    class AsyncQdrant:
+        async def query_points(self, **kwargs):
+            await asyncio.sleep(small)
+            return SimpleNamespace(points=[SimpleNamespace(payload={"page_content": d.page_content, "metadata": d.metadata}) for d in docs])
+
+    class Completions:
+        def parse(self, **kwargs):
+            time.sleep(latency_s)
+            return parsed
+
+    class AsyncCompletions:
+        async def parse(self, **kwargs):
+            await asyncio.sleep(latency_s)
+            return parsed
+
+    query_pdf.embedding = Embeddings()
+    query_pdf._vector_db = VectorDB()
+    query_pdf._async_qdrant = AsyncQdrant()
+    query_pdf.client = SimpleNamespace(chat=SimpleNamespace(completions=Completions()))
+    query_pdf._async_client = SimpleNamespace(chat=SimpleNamespace(completions=AsyncCompletions()))
+
+
+# ---------------------------------------------------------------------------
+# Apps and load driver
+# ---------------------------------------------------------------------------
+
+def build_app(mode: str):
+    from fastapi import FastAPI
+    from lang_chain.query_pdf import aquery_file, query_file
+
+    app = FastAPI()
+    if mode == "sync":
+        @app.post("/query")
+        async def query(query: str, filename: Optional[str] = None):
+            return query_file(query, filename=filename)   # the route body before the async path
+    else:
+        @app.post("/query")
+        async def query(query: str, filename: Optional[str] = None):
+            return await aquery_file(query, filename=filename)
+    return app
+
+
+async def run_load(app, requests: int, concurrency: int, filename: Optional[str]) -> tuple[float, list[float], int]:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+    params = {"query": "What is the total amount due?"}
+    if filename:
+        params["filename"] = filename
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as http:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await http.post("/query", params=params)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):   # silence per-query retrieval logs
+            await asyncio.gather(*(one() for _ in range(requests)))
+        return time.perf_counter() - start, latencies, errors
+
+
+def report(name: str, elapsed: float, latencies: list[float], errors: int) -> float:
+    rps = len(latencies) / elapsed
+    q = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+    print(
+        f"{name:<6} {len(latencies):>5} requests  {elapsed:7.2f}s  {rps:8.1f} req/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.0f} ms  p95 {q[18] * 1000:7.0f} ms  errors {errors}"
+    )
+    return rps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=800, help="Simulated chat completion latency")
+    parser.add_argument("--live", action="store_true", help="Use the real OpenAI and Qdrant services")
+    parser.add_argument("--filename", default=None, help="Restrict retrieval to this ingested file")
+    args = parser.parse_args()
+
+    if not args.live:
+        os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+        _stub_services(args.latency_ms / 1000)
+
+    print(f"{args.requests} requests, {args.concurrency} in flight" + ("" if args.live else f", {args.latency_ms:.0f} ms simulated LLM latency"))
+    sync_rps = report("sync", *asyncio.run(run_load(build_app("sync"), args.requests, args.concurrency, args.filename)))
+    async_rps = report("async", *asyncio.run(run_load(build_app("async"), args.requests, args.concurrency, args.filename)))
+    print(f"throughput gain: {async_rps / sync_rps:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark hybrid retrieval: BM25 index build time, sparse search latency and
+reciprocal-rank-fusion overhead, plus how many chunks/tokens an exact-identifier
+question sends to the LLM compared with dense-only top-k.
+
+By default runs offline on a synthetic invoice corpus (one chunk per invoice,
+like generate_invoices.py) with a random dense ranking standing in for Qdrant.
+With --live, dense results come from the vector backend for --filename (already ingested,
+costs one embedding call per query) and the fused search is timed end to end.
+
+Usage (from doctalk_rag_proj/):
+    python utils/bench_hybrid.py [--chunks 10000] [--queries 500]
+    python utils/bench_hybrid.py --live --filename B2B_Invoices.pdf --queries 50
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "backend"))
+sys.path.append(os.path.join(HERE, "..", ".."))   # my_agents
+
+
+def synthetic_invoices(count: int, seed: int = 7) -> list[tuple[str, str, dict]]:
+    rng = random.Random(seed)
+    points = []
+    for i in range(count):
+        items = "\n".join(
+            f"Item {n} | {rng.randint(1, 10)} | {rng.randint(100, 1000)}" for n in range(1, rng.randint(2, 5))
+        )
+        text = (
+            f"B2B Invoice\nInvoice Number: INV-{100000 + i}\nDate: 2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}\n"
+            f"Buyer: Buyer {rng.randint(1, 100)}\nSeller: Seller {rng.randint(1, 100)}\n"
+            f"GSTIN: {rng.randint(10, 99)}ABCDE{rng.randint(1000, 9999)}Z{rng.randint(1, 9)}\n"
+            f"Items:\nDescription | Quantity | Price\n{items}"
+        )
+        points.append((f"point-{i}", text, {"filename": "bench.pdf", "page": i}))
+    return points
+
+
+def pct(values: list[float], p: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="Synthetic corpus size (offline mode)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--live", action="store_true", help="Use the vector backend + OpenAI for the dense half")
+    parser.add_argument("--filename", default=None, help="Ingested file to query in --live mode")
+    args = parser.parse_args()
+
+    if not args.live:
+        os.environ["SPARSE_INDEX_DIR"] = tempfile.mkdtemp(prefix="bench-sparse-")
+        os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+    from langchain_core.documents import Document
+    from lang_chain.sparse_index import get_sparse_index
+    from lang_chain.token_chunker import count_tokens
+    from lang_chain import query_pdf
+
+    index = get_sparse_index()
+    rng = random.Random(11)
+
+    if args.live:
+        filename = args.filename
+        if not filename:
+            parser.error("--live needs --filename")
+        from lang_chain.vector_store import get_store
+        points = list(get_store().iter_points(filename))
+    else:
+        filename = "bench.pdf"
+        points = synthetic_invoices(args.chunks)
+
+    start = time.perf_counter()
+    index.rebuild(filename, points)
+    print(f"BM25 index build: {len(points)} chunks in {time.perf_counter() - start:.2f}s")
+
+    # Questions about one exact invoice number taken from the corpus
+    targets = [rng.choice(points) for _ in range(args.queries)]
+    questions = []
+    for point_id, text, _ in targets:
+        number = next(line.split(": ")[1] for line in text.splitlines() if line.startswith("Invoice Number"))
+        questions.append((point_id, f"What is the total amount of invoice {number}?"))
+
+    sparse_times, fuse_times, dense_times, hybrid_times = [], [], [], []
+    exact_hits = fused_chunks = fused_tokens = dense_tokens = 0
+    for point_id, question in questions:
+        if args.live:
+            t = time.perf_counter()
+            dense = query_pdf.similarity_search(question, filename)
+            dense_times.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            fused = query_pdf.hybrid_search(question, filename)
+            hybrid_times.append(time.perf_counter() - t)
+        else:
+            # Random dense ranking: fusion must still surface the exact match from BM25
+            dense = [
+                Document(page_content=text, metadata={**meta, "_id": pid})
+                for pid, text, meta in rng.sample(points, query_pdf.HYBRID_CANDIDATES)
+            ]
+            t = time.perf_counter()
+            sparse = index.search(filename, question, query_pdf.HYBRID_CANDIDATES)
+            sparse_times.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            fused = query_pdf.rrf_fuse(question, dense, sparse)
+            fuse_times.append(time.perf_counter() - t)
+            dense = dense[:query_pdf.RETRIEVAL_K]
+
+        exact_hits += any(doc.metadata.get("_id") == point_id for doc in fused)
+        fused_chunks += len(fused)
+        fused_tokens += sum(count_tokens(doc.page_content) for doc in fused)
+        dense_tokens += sum(count_tokens(doc.page_content) for doc in dense)
+
+    n = len(questions)
+    if args.live:
+        print(f"dense search          p50 {pct(dense_times, 50):7.1f} ms  p95 {pct(dense_times, 95):7.1f} ms")
+        print(f"hybrid (dense + BM25) p50 {pct(hybrid_times, 50):7.1f} ms  p95 {pct(hybrid_times, 95):7.1f} ms")
+    else:
+        print(f"BM25 search           p50 {pct(sparse_times, 50):7.2f} ms  p95 {pct(sparse_times, 95):7.2f} ms")
+        print(f"RRF fusion            p50 {pct(fuse_times, 50):7.3f} ms  p95 {pct(fuse_times, 95):7.3f} ms")
+    print(f"exact chunk retrieved {exact_hits / n:7.1%}")
+    print(f"context per question  hybrid {fused_chunks / n:.1f} chunks / {fused_tokens / n:.0f} tokens   "
+          f"dense top-{query_pdf.RETRIEVAL_K} {dense_tokens / n:.0f} tokens")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark PDF text extraction: the original PyPDFLoader.load() against the
+parallel page-range engine in backend/lang_chain/pdf_extract.py.
+
+The engine's gain has two sources, reported separately: calling pypdf directly
+instead of through PyPDFLoader (the "in-process" line — one core, no pool),
+and spreading page ranges over worker processes (the rest). On a single core
+only the first applies; measure on a multi-core host to see the second.
+
+Generates the 10,000-invoice corpus with generate_invoices.py if it is missing.
+
+Usage (from doctalk_rag_proj/):
+    python utils/bench_pdf_extract.py [--pdf B2B_Invoices.pdf] [--workers 8]
+"""
+import os
+import sys
+import time
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "backend"))
+sys.path.append(HERE)
+
+
+def bench_pypdf_loader(pdf_path: str) -> tuple[float, int, int]:
+    from langchain_community.document_loaders import PyPDFLoader
+    start = time.perf_counter()
+    docs = PyPDFLoader(pdf_path).load()
+    return time.perf_counter() - start, len(docs), sum(len(d.page_content) for d in docs)
+
+
+def bench_engine(pdf_path: str, engine: str) -> tuple[float, float, int, int]:
+    """Returns (total_seconds, seconds_to_first_page, pages, chars)."""
+    from lang_chain.pdf_extract import iter_pdf_pages
+    start = time.perf_counter()
+    first = None
+    pages = chars = 0
+    for doc in iter_pdf_pages(pdf_path, engine=engine):
+        if first is None:
+            first = time.perf_counter() - start
+        pages += 1
+        chars += len(doc.page_content)
+    return time.perf_counter() - start, first or 0.0, pages, chars
+
+
+def bench_engine_in_process(pdf_path: str) -> tuple[float, float, int, int]:
+    from lang_chain import pdf_extract
+    workers = pdf_extract.PDF_EXTRACT_WORKERS
+    pdf_extract.PDF_EXTRACT_WORKERS = 1
+    try:
+        return bench_engine(pdf_path, "parallel")
+    finally:
+        pdf_extract.PDF_EXTRACT_WORKERS = workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default="B2B_Invoices.pdf", help="PDF to extract (generated if missing)")
+    parser.add_argument("--workers", type=int, default=None, help="Overrides PDF_EXTRACT_WORKERS")
+    args = parser.parse_args()
+
+    if args.workers:
+        os.environ["PDF_EXTRACT_WORKERS"] = str(args.workers)
+
+    if not os.path.exists(args.pdf):
+        print(f"Generating invoice corpus → {args.pdf} ...")
+        import generate_invoices
+        generate_invoices.main()
+        if args.pdf != "B2B_Invoices.pdf":
+            os.replace("B2B_Invoices.pdf", args.pdf)
+
+    base_s, base_pages, base_chars = bench_pypdf_loader(args.pdf)
+    print(f"PyPDFLoader.load()   {base_pages:>6} pages  {base_s:8.2f}s  {base_pages / base_s:8.1f} pages/s")
+
+    # Same per-page extraction as the workers, in this process and without a pool
+    one_s, _, one_pages, _ = bench_engine_in_process(args.pdf)
+    print(f"in-process pypdf     {one_pages:>6} pages  {one_s:8.2f}s  {one_pages / one_s:8.1f} pages/s")
+
+    # Warm the worker pool so process start-up isn't billed to the first run
+    from lang_chain.pdf_extract import _get_pool
+    list(_get_pool().map(abs, range(os.cpu_count() or 2)))
+
+    par_s, par_first, par_pages, par_chars = bench_engine(args.pdf, "parallel")
+    print(
+        f"parallel engine      {par_pages:>6} pages  {par_s:8.2f}s  {par_pages / par_s:8.1f} pages/s  "
+        f"(first page after {par_first * 1000:.0f} ms)"
+    )
+    print(
+        f"speed-up: {base_s / par_s:.2f}x on {os.cpu_count()} core(s) — "
+        f"{base_s / one_s:.2f}x from skipping PyPDFLoader, {one_s / par_s:.2f}x from the worker pool"
+    )
+
+    if (par_pages, par_chars) != (base_pages, base_chars):
+        print(f"WARNING: output differs — pages {par_pages} vs {base_pages}, chars {par_chars} vs {base_chars}")
+
+
+if __name__ == "__main__":
+    main()
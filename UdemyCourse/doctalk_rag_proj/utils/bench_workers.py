@@ -0,0 +1,195 @@
+"""
+Load test of the multi-worker serving mode: starts the API with 1, 2, 4, ...
+uvicorn worker processes (as serve.py does), drives PageIndex chat messages
+over HTTP with N requests in flight, and reports throughput per worker count.
+
+Each message is handled by a stand-in for the PageIndex answer that holds the
+GIL for --cpu-ms (like tree navigation, prompt building and parsing do) and
+then blocks for --latency-ms (the sync LLM call). One worker is therefore
+capped at roughly 1000 / cpu-ms messages per second, and throughput should
+grow close to linearly with workers until the cores run out.
+
+Sessions live in a SQLite session store shared by the workers and are created
+through whichever worker accepts the connection, so every run also checks that
+all turns were recorded regardless of the worker that served them.
+
+Usage (from doctalk_rag_proj/):
+    python utils/bench_workers.py [--workers 1,2,4] [--requests 400] [--concurrency 64] [--cpu-ms 20] [--latency-ms 100]
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(HERE, "..", "backend")
+
+
+# ---------------------------------------------------------------------------
+# Stand-in app (imported by each uvicorn worker)
+# ---------------------------------------------------------------------------
+
+def stub_app():
+    """uvicorn factory: the real API with PageIndex building and answering replaced by stand-ins."""
+    sys.path.append(BACKEND)
+    sys.path.append(os.path.join(BACKEND, "..", ".."))   # my_agents
+    from router import pageindex_chat
+
+    cpu_s = float(os.environ["BENCH_CPU_MS"]) / 1000
+    latency_s = float(os.environ["BENCH_LATENCY_MS"]) / 1000
+
+    def update_index(source, filename):
+        return {"doc_name": filename}, None
+
+    def chat_with_pageindex(message, filename, history):
+        start = time.thread_time()
+        while time.thread_time() - start < cpu_s:
+            sum(i * i for i in range(1000))
+        time.sleep(latency_s)
+        reply = f"answer to {message}"
+        return reply, history + [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+
+    pageindex_chat.update_index = update_index
+    pageindex_chat.chat_with_pageindex = chat_with_pageindex
+
+    from api import app
+    return app
+
+
+# ---------------------------------------------------------------------------
+# Server processes and load driver
+# ---------------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, data_dir: str, cpu_ms: float, latency_ms: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-bench"),
+        "SESSION_BACKEND": "sqlite",
+        "SESSION_DB_PATH": os.path.join(data_dir, "sessions.sqlite3"),
+        "JOB_STATE_PATH": os.path.join(data_dir, "jobs.sqlite3"),
+        "PAGEINDEX_STORE_DIR": os.path.join(data_dir, "pageindex_store"),
+        # /ready needs a vector store; the embedded one needs no server. Only
+        # /ready opens it here (the benchmark writes no vectors), which is why
+        # these workers may share it — serve.py refuses that combination
+        "VECTOR_BACKEND": "embedded",
+        "EMBEDDED_STORE_DIR": os.path.join(data_dir, "embedded_store"),
+        "PDF_EXTRACT_WORKERS": "1",
+        "BENCH_CPU_MS": str(cpu_ms),
+        "BENCH_LATENCY_MS": str(latency_ms),
+    }
+    command = [
+        sys.executable, "-m", "uvicorn", "bench_workers:stub_app", "--factory",
+        "--app-dir", HERE, "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(command, env=env, cwd=data_dir, stdout=subprocess.DEVNULL)
+
+
+async def wait_ready(base_url: str, workers: int, timeout: float = 60) -> set[int]:
+    """Poll /ready on fresh connections until every worker has answered 200 (or the timeout passes)."""
+    import httpx
+
+    pids: set[int] = set()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and len(pids) < workers:
+        try:
+            async with httpx.AsyncClient(base_url=base_url) as http:
+                response = await http.get("/ready")
+            if response.status_code == 200:
+                pids.add(response.json()["pid"])
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.05 if pids else 0.2)
+    if not pids:
+        raise RuntimeError(f"No worker became ready within {timeout:.0f}s")
+    return pids
+
+
+async def run_load(base_url: str, requests: int, concurrency: int) -> tuple[float, list[float], int, int]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as http:
+        sessions = []
+        for _ in range(concurrency):
+            response = await http.post("/pageindex/chat/start", files={"file": ("bench.pdf", b"%PDF-1.4 bench", "application/pdf")})
+            response.raise_for_status()
+            sessions.append(response.json()["session_id"])
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: list[float] = []
+        errors = 0
+
+        async def one(i: int):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await http.post(f"/pageindex/chat/{sessions[i % len(sessions)]}/message", json={"message": f"q{i}"})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+        turns = 0
+        for session_id in sessions:
+            turns += (await http.get(f"/pageindex/chat/{session_id}")).json()["turn_count"]
+    return elapsed, latencies, errors, turns
+
+
+def report(workers: int, ready: int, elapsed: float, latencies: list[float], errors: int, turns: int, base_rps: float | None) -> float:
+    rps = len(latencies) / elapsed
+    q = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+    speedup = rps / base_rps if base_rps else 1.0
+    print(
+        f"{workers:>3} workers ({ready} ready)  {rps:8.1f} req/s  p50 {statistics.median(latencies) * 1000:6.0f} ms  "
+        f"p95 {q[18] * 1000:6.0f} ms  speedup {speedup:4.2f}x  efficiency {speedup / workers:4.0%}  "
+        f"errors {errors}  turns recorded {turns}/{len(latencies)}"
+    )
+    return rps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cores = os.cpu_count() or 1
+    default_workers = ",".join(str(n) for n in (1, 2, 4, 8, 16) if n <= cores) or "1"
+    parser.add_argument("--workers", default=default_workers, help="Comma-separated worker counts (default: powers of two up to the core count)")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--cpu-ms", type=float, default=20, help="GIL-holding work per message")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Simulated blocking LLM latency per message")
+    args = parser.parse_args()
+
+    print(
+        f"{cores} cores, {args.requests} messages, {args.concurrency} in flight, "
+        f"{args.cpu_ms:.0f} ms CPU + {args.latency_ms:.0f} ms blocking LLM per message"
+    )
+    base_rps = None
+    for workers in (int(n) for n in args.workers.split(",")):
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        with tempfile.TemporaryDirectory(prefix="bench_workers_") as data_dir:
+            server = start_server(workers, port, data_dir, args.cpu_ms, args.latency_ms)
+            try:
+                ready = asyncio.run(wait_ready(base_url, workers))
+                rps = report(workers, len(ready), *asyncio.run(run_load(base_url, args.requests, args.concurrency)), base_rps)
+                base_rps = base_rps or rps
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()